@@ -0,0 +1,64 @@
+"""Auto team balancing, 2v2 to 16v16, against the old brute force.
+
+Run from the repository root:
+
+    python -m bench.balance
+"""
+
+import time
+import random
+from itertools import combinations
+
+from pubobot import balance
+
+# the brute force is hopeless past this
+BRUTE_FORCE_LIMIT = 24
+
+
+def brute_force(ratings, size):
+    """The previous implementation from Match.__init__."""
+    perfect_rank = sum(ratings) / 2
+    best_diff = 10000
+    best_team = None
+    for team in combinations(range(len(ratings)), size):
+        rank = sum([ratings[i] for i in team])
+        if abs(perfect_rank - rank) < best_diff:
+            best_diff = abs(perfect_rank - rank)
+            best_team = list(team)
+    return best_team
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    team = func(*args, **kwargs)
+    return time.perf_counter() - start, team
+
+
+def main():
+    rnd = random.Random(0)
+    print("size  |  brute force      |  exact            |  local            |  auto")
+    for size in range(2, 17):
+        ratings = [rnd.randint(800, 2200) for _ in range(size * 2)]
+        total = sum(ratings)
+
+        def diff(team):
+            return abs(2 * sum(ratings[i] for i in team) - total) / 2
+
+        cells = []
+        if len(ratings) <= BRUTE_FORCE_LIMIT:
+            elapsed, team = timed(brute_force, ratings, size)
+            cells.append(f"{elapsed * 1000:9.2f} ms {diff(team):5.1f}")
+        else:
+            cells.append(f"{'-':>18}")
+        elapsed, team = timed(balance.split, ratings, size, None, engine="exact")
+        cells.append(f"{elapsed * 1000:9.2f} ms {diff(team):5.1f}")
+        elapsed, team = timed(balance.split, ratings, size, None, 0, engine="local")
+        cells.append(f"{elapsed * 1000:9.2f} ms {diff(team):5.1f}")
+        elapsed, team = timed(balance.split, ratings, size, 0.1, 0)
+        cells.append(f"{elapsed * 1000:9.2f} ms {diff(team):5.1f}")
+        print(f"{size:2}v{size:<2} | " + " | ".join(cells))
+    print("(time, rating difference between the teams)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Multi-objective auto teams for 12v12, solution quality against solve time.
+
+Run from the repository root:
+
+    python -m bench.balance_objectives
+"""
+
+import time
+import random
+
+from pubobot import balance
+
+PLAYERS = 24
+ROUNDS = 20
+
+
+def pickup(rnd):
+    """Ratings, two captains_role holders and last match teammates."""
+    ratings = [rnd.randint(800, 2200) for _ in range(PLAYERS)]
+    captains = rnd.sample(range(PLAYERS), 3)
+    last = rnd.sample(range(PLAYERS), PLAYERS)
+    teammates = []
+    for team in (last[: PLAYERS // 4], last[PLAYERS // 4 : PLAYERS // 2]):
+        teammates += [(a, b) for a in team for b in team if a < b]
+    return balance.Objectives(ratings, captains, teammates)
+
+
+def main():
+    rnd = random.Random(0)
+    pickups = [pickup(rnd) for _ in range(ROUNDS)]
+    print(
+        "search              |  time      |  cost  | rating | spread | captain | repeat"
+    )
+
+    def row(name, solve):
+        elapsed, parts, costs = 0, [0, 0, 0, 0], 0
+        for objectives in pickups:
+            start = time.perf_counter()
+            team = solve(objectives)
+            elapsed += time.perf_counter() - start
+            costs += objectives.cost(team)
+            parts = [a + b for a, b in zip(parts, objectives.parts(team))]
+        parts = [part / ROUNDS for part in parts]
+        print(
+            f"{name:19} | {elapsed / ROUNDS * 1000:7.2f} ms | {costs / ROUNDS:6.1f} | "
+            + " | ".join(f"{part:6.2f}" for part in parts)
+        )
+
+    row("rating only", lambda o: balance.split(o.ratings, None, 0.1, 0))
+    for restarts in (0, 2, 4, 8, 16, 64):
+        row(
+            f"arrange restarts={restarts}",
+            lambda o: balance.arrange(o, None, 1, 0, restarts),
+        )
+    print("(averages over {0} pickups, cost in rating points)".format(ROUNDS))
+
+
+if __name__ == "__main__":
+    main()
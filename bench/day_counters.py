@@ -0,0 +1,90 @@
+"""!top and !stats from the day buckets vs the raw history, 1M rows by default.
+
+Run from the repository root:
+
+    python -m bench.day_counters [rows]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from pubobot import config, console, stats3
+
+PLAYERS = 500
+TEAM = 4
+YEARS = 3
+RUNS = 20
+
+# the old !top queries, one GROUP BY over the whole range
+raw_top = "SELECT user_name, count(user_id) FROM player_pickups WHERE channel_id = ? and at > ? GROUP BY user_id ORDER by count(user_id) DESC LIMIT 10"
+raw_stats = "SELECT pickup_name, count(pickup_name) FROM pickups WHERE channel_id = ? GROUP BY pickup_name"
+
+
+def history(rows):
+    """Synthetic 4v4 matches as (pickups row, player_pickups rows)."""
+    rnd = random.Random(0)
+    matches = rows // (2 * TEAM)
+    for pickup_id in range(matches):
+        at = pickup_id * YEARS * 365 * stats3.DAY // matches
+        name = rnd.choice(("elim", "ctf", "tam"))
+        players = rnd.sample(range(PLAYERS), 2 * TEAM)
+        yield (
+            (pickup_id, 1, name, at),
+            [
+                (pickup_id, 1, user_id, "player{0}".format(user_id), name, at)
+                for user_id in players
+            ],
+        )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        func(*args)
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def query(statement, *args):
+    return stats3.c.execute(statement, args).fetchall()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    console.init(enable_input=False)
+    config.init()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), config.db_pragmas())
+        for pickup, player_pickups in history(rows):
+            stats3.c.execute(
+                "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at) VALUES (?, ?, ?, ?)",
+                pickup,
+            )
+            stats3.c.executemany(
+                "INSERT INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at) VALUES (?, ?, ?, ?, ?, ?)",
+                player_pickups,
+            )
+        stats3.conn.commit()
+
+        start = time.perf_counter()
+        stats3.rebuild_counters()
+        print(f"{rows} rows, {PLAYERS} players, {YEARS} years")
+        print(f"{'rebuild':14} | {time.perf_counter() - start:8.2f} s")
+        now = YEARS * 365 * stats3.DAY
+
+        for name, days in (("weekly", 7), ("yearly", 365), ("all time", None)):
+            timegap = now - days * stats3.DAY + 3600 if days else 0
+            raw = timed(query, raw_top, 1, timegap)
+            buckets = timed(stats3.top, 1, timegap)
+            print(f"{'!top ' + name:14} | {raw:8.2f} ms raw | {buckets:8.2f} ms days")
+        raw = timed(query, raw_stats, 1)
+        buckets = timed(stats3.stats, 1)
+        print(f"{'!stats':14} | {raw:8.2f} ms raw | {buckets:8.2f} ms days")
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Per-message cost of Channel.processmsg at 10k messages a second.
+
+Handlers are stubbed out, so only the routing is timed. The baseline
+is what the previous elif chain did before comparing the first word:
+split and lowercase the message, work out the access level and run the
+uncompiled +/- patterns.
+
+Run from the repository root:
+
+    python -m bench.dispatch [messages]
+"""
+
+import re
+import sys
+import time
+import random
+import asyncio
+import inspect
+from types import SimpleNamespace
+
+from pubobot import bot, console
+
+RATE = 10000  # messages a second
+CHAT = ["gg", "anyone up for a game?", "lol", "brb 5 min", "nice shot"]
+COMMANDS = ["!add elim", "!who", "+elim", "!lastt", "!lb", "!remove", "!stats x"]
+
+
+def preamble(channel, msg):
+    """The work the old processmsg did for every message."""
+    member = msg.author
+    msgtup = msg.content.split(" ")
+    lower = [i.lower() for i in msgtup]
+    role_ids = [i.id for i in member.roles]
+    if (
+        channel.cfg["admin_role"] in role_ids
+        or member.id == channel.cfg["admin_id"]
+        or channel.channel.permissions_for(member).administrator
+    ):
+        pass
+    re.match(r"^\+..", lower[0])
+    re.match(r"^-..", lower[0])
+    return lower[0][0] == channel.cfg["prefix"]
+
+
+def make_channel():
+    channel = bot.Channel.__new__(bot.Channel)
+    channel.cfg = {
+        "prefix": "!",
+        "ranked": 1,
+        "admin_role": 1,
+        "admin_id": 1,
+        "moderator_role": 2,
+    }
+    channel.channel = SimpleNamespace(
+        permissions_for=lambda member: SimpleNamespace(administrator=False)
+    )
+    for name, method in inspect.getmembers(bot.Channel, inspect.isfunction):
+        if name not in ("processmsg", "access_level"):
+            is_async = inspect.iscoroutinefunction(method)
+            setattr(channel, name, handled_async if is_async else handled)
+    return channel
+
+
+def handled(*args, **kwargs):
+    pass
+
+
+async def handled_async(*args, **kwargs):
+    pass
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    console.init(enable_input=False)
+    console.display = lambda text: None  # no CHAT| lines in the output
+    channel = make_channel()
+    member = SimpleNamespace(id=5, roles=[], display_name="player")
+    rnd = random.Random(0)
+    messages = [
+        SimpleNamespace(
+            content=rnd.choice(COMMANDS if rnd.random() < 0.2 else CHAT),
+            author=member,
+            guild="guild",
+            channel="channel",
+        )
+        for _ in range(count)
+    ]
+
+    start = time.perf_counter()
+    for msg in messages:
+        preamble(channel, msg)
+    old = (time.perf_counter() - start) / count
+
+    async def dispatch():
+        start = time.perf_counter()
+        for msg in messages:
+            await channel.processmsg(msg)
+        return (time.perf_counter() - start) / count
+
+    new = asyncio.run(dispatch())
+
+    print(f"{count} messages, 20% commands")
+    for name, cost in (("old preamble", old), ("registry", new)):
+        print(
+            f"{name:12} | {cost * 1e6:6.2f} us/message | "
+            f"{cost * RATE:6.1%} of a core at {RATE} msgs/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
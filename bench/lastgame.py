@@ -0,0 +1,114 @@
+"""!last <player> on a long match history, 100k matches by default.
+
+Compares the pickup_roster lookup with the old LIKE scan of pickups.players
+and times the roster backfill an existing database gets on upgrade.
+
+Run from the repository root:
+
+    python -m bench.lastgame [matches]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from pubobot import config, console, stats3
+
+PLAYERS = 5000
+TEAM = 4
+LOOKUPS = 200
+
+
+def history(matches):
+    """Synthetic 4v4 matches as (pickups row, player_pickups rows)."""
+    rnd = random.Random(0)
+    for pickup_id in range(1, matches + 1):
+        players = rnd.sample(range(PLAYERS), 2 * TEAM)
+        nicks = ["player{0}".format(user_id) for user_id in players]
+        yield (
+            (
+                pickup_id,
+                1,
+                "elim",
+                pickup_id,
+                " ".join(nicks),
+                " ".join(nicks[:TEAM]),
+                " ".join(nicks[TEAM:]),
+                0,
+                None,
+            ),
+            [
+                (
+                    pickup_id,
+                    1,
+                    user_id,
+                    nicks[n],
+                    "elim",
+                    pickup_id,
+                    "alpha" if n < TEAM else "beta",
+                    0,
+                    None,
+                    None,
+                    None,
+                    0,
+                )
+                for n, user_id in enumerate(players)
+            ],
+        )
+
+
+def timed(lookup, nicks):
+    start = time.perf_counter()
+    for nick in nicks:
+        lookup(nick)
+    return (time.perf_counter() - start) / len(nicks) * 1000
+
+
+def like(nick):
+    stats3.c.execute(
+        "SELECT pickup_id FROM pickups WHERE channel_id = ? AND players LIKE ? ORDER BY pickup_id DESC LIMIT 1",
+        (1, "%{0}%".format(nick)),
+    )
+    return stats3.c.fetchone()
+
+
+def main():
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    console.init(enable_input=False)
+    config.init()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), config.db_pragmas())
+        for pickup, player_pickups in history(matches):
+            stats3.c.execute(
+                "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at, players, alpha_players, beta_players, is_ranked, winner_team) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                pickup,
+            )
+            stats3.c.executemany(
+                "INSERT INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at, team, is_ranked, is_winner, rank_after, rank_change, is_lastpick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                player_pickups,
+            )
+        stats3.conn.commit()
+
+        start = time.perf_counter()
+        stats3.backfill_roster()
+        stats3.create_roster_indexes()
+        stats3.conn.commit()
+        backfill = time.perf_counter() - start
+
+        rnd = random.Random(1)
+        nicks = ["player{0}".format(rnd.randrange(PLAYERS)) for _ in range(LOOKUPS)]
+        print(f"{matches} matches, {PLAYERS} players")
+        print(f"{'backfill':8} | {backfill:8.2f} s")
+        print(f"{'LIKE':8} | {timed(like, nicks):8.3f} ms/lookup")
+        print(
+            f"{'roster':8} | "
+            f"{timed(lambda nick: stats3.lastgame(1, nick), nicks):8.3f} ms/lookup"
+        )
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""!rank and !lb on a channel with tens of thousands of rated players.
+
+Compares the old full ladder scan, the cached Leaderboard and the window
+function fallback used when a channel does not fit in the rating cache.
+
+Run from the repository root:
+
+    python -m bench.leaderboard [players]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from pubobot import config, console, stats3
+
+LOOKUPS = 50
+
+
+def legacy_rank_details(user_id):
+    """The previous get_rank_details(), without the match history."""
+    stats3.c.execute(
+        "SELECT user_id, nick, rank, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL ORDER BY rank DESC",
+        (1,),
+    )
+    lb = stats3.c.fetchall()
+    for i in lb:
+        if i[0] == user_id:
+            return lb.index(i) + 1
+
+
+def legacy_ladder(page):
+    stats3.c.execute(
+        "SELECT rank, nick, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND wins+loses > 0 ORDER BY rank desc LIMIT ?",
+        (1, (page + 1) * 10),
+    )
+    return stats3.c.fetchall()[page * 10 :]
+
+
+def timed(func, args):
+    start = time.perf_counter()
+    for arg in args:
+        func(arg)
+    return (time.perf_counter() - start) / len(args) * 1000
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    console.init(enable_input=False)
+    config.init()
+    rnd = random.Random(0)
+    user_ids = rnd.sample(range(players), LOOKUPS)
+    pages = [rnd.randrange(players // 10) for _ in range(LOOKUPS)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), config.db_pragmas())
+        stats3.c.executemany(
+            "INSERT INTO channel_players (channel_id, user_id, nick, rank, wins, loses) VALUES (1, ?, ?, ?, ?, ?)",
+            (
+                (i, "player{0}".format(i), rnd.randint(800, 2200), 5, 5)
+                for i in range(players)
+            ),
+        )
+        stats3.conn.commit()
+
+        def rank(user_id):
+            stats3.get_rank_details(1, user_id=user_id)
+
+        def ladder(page):
+            stats3.get_ladder(1, page)
+
+        def around(user_id):
+            stats3.get_ladder_around(1, user_id)
+
+        print(f"{players} rated players, ms per call")
+        print("              |  !rank    |  !lb page |  !lb me")
+        legacy = timed(legacy_rank_details, user_ids), timed(legacy_ladder, pages)
+        print(f"old scan      | {legacy[0]:8.3f} | {legacy[1]:8.3f} |        -")
+
+        start = time.perf_counter()
+        stats3.rank_cache.board(1)
+        print(f"cache load    | {(time.perf_counter() - start) * 1000:8.3f} ms once")
+        cached = [timed(f, a) for f, a in ((rank, user_ids), (ladder, pages))]
+        cached.append(timed(around, user_ids))
+        print("leaderboard   | " + " | ".join(f"{t:8.3f}" for t in cached))
+
+        stats3.cache_ranks(0)
+        stats3.rank_cache.invalidate(1)
+        fallback = [timed(f, a) for f, a in ((rank, user_ids), (ladder, pages))]
+        fallback.append(timed(around, user_ids))
+        print("sql fallback  | " + " | ".join(f"{t:8.3f}" for t in fallback))
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Memory held by 1,000 simultaneous matches, measured with tracemalloc.
+
+Every match is a 5v5 in teams picking with two captains, a few picks
+made and ready marks on its pickup. The baseline holds the same state
+in plain objects with a per-instance __dict__, like the classes had
+before __slots__.
+
+Run from the repository root:
+
+    python -m bench.match_memory [matches]
+"""
+
+import sys
+import random
+import tracemalloc
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from pubobot import bot
+
+MEMBERS = 20000
+TEAM = 5
+
+
+class Plain:
+    """An object with a __dict__, for the previous layout."""
+
+
+class PlainPool(Plain):
+    """UnpickedPool before the id to position map."""
+
+    def __init__(self, players):
+        self.position_to_players = OrderedDict(enumerate(players, 1))
+
+
+def build(count, members, slots):
+    rnd = random.Random(0)
+    matches = []
+    for match_id in range(count):
+        players = rnd.sample(members, 2 * TEAM)
+        cfg = {"pickup_name": "elim", "maxplayers": 2 * TEAM}
+        if slots:
+            pickup = bot.Pickup(None, cfg)
+            pickup.mark_user_ready(*players)
+            match = bot.Match.__new__(bot.Match)
+            match._players = bot.Players(match, players, indexed=False)
+            match.unpicked_pool = bot.UnpickedPool(players[4:])
+        else:
+            pickup = Plain()
+            for name in bot.Pickup.__slots__:
+                setattr(pickup, name, None)
+            pickup.cfg, pickup.name = cfg, cfg["pickup_name"]
+            pickup._players = []
+            pickup.users_last_ready = {}
+            for player in players:
+                mark = Plain()
+                mark.user, mark.time = player, 0.0
+                pickup.users_last_ready[player.id] = mark
+            match = Plain()
+            match._players = list(players)
+            match.unpicked_pool = PlainPool(players[4:])
+        for name in bot.Match.__slots__:
+            if name not in ("_players", "unpicked_pool"):
+                setattr(match, name, None)
+        match.id = match_id
+        match.pickup = pickup
+        match.state = "teams_picking"
+        match.ranks = {player.id: 1400 for player in players}
+        match.captains = players[:2]
+        match.alpha_team = [players[0], players[2]]
+        match.beta_team = [players[1], players[3]]
+        match.players_ready = [player.id for player in players]
+        match.team_names = ["alpha", "beta"]
+        matches.append(match)
+    return matches
+
+
+def measure(make):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = make()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    bot.init()
+    members = [SimpleNamespace(id=i) for i in range(MEMBERS)]
+
+    plain, baseline = measure(lambda: build(count, members, False))
+    matches, slotted = measure(lambda: build(count, members, True))
+
+    print(f"{count} matches of {2 * TEAM} players")
+    for name, used in (("__dict__", baseline), ("__slots__", slotted)):
+        print(f"{name:9} | {used / 1024:8.0f} KiB | {used / count:6.0f} B/match")
+
+
+if __name__ == "__main__":
+    main()
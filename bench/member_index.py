@@ -0,0 +1,90 @@
+"""Finding a member's pickups and matches with 500 pickups on 200 channels.
+
+Compares the member index with the previous scans over active_pickups
+and active_matches, and times what keeping the index costs on add and
+remove.
+
+Run from the repository root:
+
+    python -m bench.member_index [lookups]
+"""
+
+import sys
+import time
+import random
+from types import SimpleNamespace
+
+from pubobot import bot
+
+CHANNELS = 200
+PICKUPS = 500
+MEMBERS = 5000
+PLAYERS = 8
+
+
+def scan(member):
+    """The previous lookups of remove_player and global_remove."""
+    pickups = [p for p in bot.active_pickups if member.id in [i.id for i in p.players]]
+    matches = [m for m in bot.active_matches if member.id in [i.id for i in m.players]]
+    return pickups, matches
+
+
+def indexed(member):
+    pickups = list(bot.pickups_by_member.get(member.id, ()))
+    matches = list(bot.matches_by_member.get(member.id, ()))
+    return pickups, matches
+
+
+def churn(rnd, pickups, members, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        players = rnd.choice(pickups).players
+        member = rnd.choice(members)
+        if member in players:
+            players.remove(member)
+        else:
+            players.append(member)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bot.init()
+    rnd = random.Random(0)
+    members = [SimpleNamespace(id=i) for i in range(MEMBERS)]
+    channels = [SimpleNamespace(id=i) for i in range(CHANNELS)]
+
+    pickups = []
+    for i in range(PICKUPS):
+        pickup = bot.Pickup(channels[i % CHANNELS], {"pickup_name": f"p{i}"})
+        pickup.players = rnd.sample(members, rnd.randrange(1, PLAYERS))
+        bot.active_pickups.append(pickup)
+        pickups.append(pickup)
+    for channel in channels:  # a match in progress on every channel
+        match = bot.Match.__new__(bot.Match)
+        match._players = bot.Players(match, rnd.sample(members, PLAYERS), False)
+        bot.active_matches.append(match)
+        match.players.attach()
+    assert bot.check_index() == ()
+
+    lookups = [rnd.choice(members) for _ in range(count)]
+    print(f"{PICKUPS} pickups and {CHANNELS} matches on {CHANNELS} channels")
+    found = []
+    for name, lookup in (("scan", scan), ("index", indexed)):
+        start = time.perf_counter()
+        found.append([lookup(member) for member in lookups])
+        elapsed = (time.perf_counter() - start) / count
+        print(f"{name:5} | {elapsed * 1e6:8.2f} us/lookup")
+    assert [(set(p), set(m)) for p, m in found[0]] == [
+        (set(p), set(m)) for p, m in found[1]
+    ]
+
+    plain = [SimpleNamespace(players=list(p.players)) for p in pickups]
+    for name, owners in (("list", plain), ("Players", pickups)):
+        elapsed = churn(random.Random(1), owners, members[:200], count)
+        print(f"{name:7} | {elapsed * 1e6:8.2f} us/add or remove")
+    assert bot.check_index() == ()
+
+
+if __name__ == "__main__":
+    main()
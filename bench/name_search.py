@@ -0,0 +1,96 @@
+"""Player name lookups on a 5M roster row history by default.
+
+Times !last by a nick prefix with the FTS5 index and with the LIKE scan
+used when sqlite lacks FTS5, and !stats by a nick prefix.
+
+Run from the repository root:
+
+    python -m bench.name_search [rows]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from pubobot import config, console, stats3
+
+PLAYERS = 20000
+TEAM = 4
+LOOKUPS = 100
+
+
+def history(rows):
+    """Synthetic 4v4 matches as (pickups row, roster rows)."""
+    rnd = random.Random(0)
+    for pickup_id in range(1, rows // (2 * TEAM) + 1):
+        players = rnd.sample(range(PLAYERS), 2 * TEAM)
+        nicks = ["Player{0:05}".format(user_id) for user_id in players]
+        yield (
+            (pickup_id, 1, "elim", pickup_id, " ".join(nicks)),
+            [
+                (pickup_id, 1, user_id, nicks[n], "alpha" if n < TEAM else "beta")
+                for n, user_id in enumerate(players)
+            ],
+        )
+
+
+def timed(lookup, texts):
+    start = time.perf_counter()
+    for text in texts:
+        lookup(text)
+    return (time.perf_counter() - start) / len(texts) * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    console.init(enable_input=False)
+    config.init()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.sqlite3")
+        stats3.init(db, config.db_pragmas())
+        start = time.perf_counter()
+        # index once at the end rather than through the triggers
+        stats3.c.execute("DROP TRIGGER name_search_insert")
+        for pickup, roster in history(rows):
+            stats3.c.execute(
+                "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at, players) VALUES (?, ?, ?, ?, ?)",
+                pickup,
+            )
+            stats3.c.executemany(
+                "INSERT INTO pickup_roster (pickup_id, channel_id, user_id, nick, team) VALUES (?, ?, ?, ?, ?)",
+                roster,
+            )
+        stats3.conn.commit()
+        stats3.setup_search()
+        print(f"{rows} roster rows, {PLAYERS} players")
+        print(f"{'build':18} | {time.perf_counter() - start:8.2f} s")
+
+        # nick prefixes matching 10 players each, and nicks nobody has
+        rnd = random.Random(1)
+        prefixes = [
+            "player{0:04}".format(rnd.randrange(PLAYERS // 10)) for _ in range(LOOKUPS)
+        ]
+        misses = ["nobody{0}".format(n) for n in range(LOOKUPS // 10)]
+        for search in (True, False):
+            stats3.name_search = search
+            name = "fts5" if search else "like"
+            for kind, texts in (("prefix", prefixes), ("miss", misses)):
+                print(
+                    f"{name + ' !last ' + kind:18} | "
+                    f"{timed(lambda text: stats3.lastgame(1, text), texts):8.3f} ms/lookup"
+                )
+        # without fts5 !stats only finds exact nicks, nothing to compare with,
+        # its time includes counting the channel's pickups
+        stats3.name_search = True
+        print(
+            f"{'fts5 !stats prefix':18} | "
+            f"{timed(lambda text: stats3.stats(1, text), prefixes):8.3f} ms/lookup"
+        )
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Replaying a channel's whole ranked history, 1M player_pickups rows by default.
+
+Run from the repository root:
+
+    python -m bench.replay [rows]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from types import SimpleNamespace
+
+from pubobot import config, console, stats3
+
+PLAYERS = 5000
+TEAM = 4
+
+
+def history(rows):
+    """Synthetic 4v4 ranked matches, rank columns left for the replay."""
+    rnd = random.Random(0)
+    for pickup_id in range(rows // (2 * TEAM)):
+        players = rnd.sample(range(PLAYERS), 2 * TEAM)
+        alpha_won = rnd.random() < 0.5
+        for n, user_id in enumerate(players):
+            alpha = n < TEAM
+            yield (
+                pickup_id,
+                1,
+                user_id,
+                "player{0}".format(user_id),
+                "elim",
+                pickup_id,
+                "alpha" if alpha else "beta",
+                1,
+                int(alpha == alpha_won),
+                0,
+                0,
+                0,
+            )
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    console.init(enable_input=False)
+    config.init()
+    channel = SimpleNamespace(
+        id=1,
+        cfg={
+            "initial_rating": 1400,
+            "ranked_multiplayer": 32,
+            "ranked_calibrate": 1,
+            "ranked_streaks": 1,
+        },
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), config.db_pragmas())
+        stats3.c.executemany(
+            "INSERT INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at, team, is_ranked, is_winner, rank_after, rank_change, is_lastpick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            history(rows),
+        )
+        stats3.conn.commit()
+
+        print(f"{rows} rows, {PLAYERS} players")
+        for name in ("first replay", "replay again"):
+            start = time.perf_counter()
+            matches, players, changed = stats3.replay_ranks(channel)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:13} | {elapsed:6.2f} s | {rows / elapsed:9.0f} rows/s | "
+                f"{matches} matches, {changed} rows rewritten"
+            )
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
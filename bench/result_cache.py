@@ -0,0 +1,81 @@
+"""A channel spamming !top, !stats and !lb, with and without the result cache.
+
+Run from the repository root:
+
+    python -m bench.result_cache [rows]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+from pubobot import config, console, stats3
+
+PLAYERS = 500
+TEAM = 4
+CALLS = 2000
+
+
+def history(rows):
+    """Synthetic 4v4 matches as (pickups row, player_pickups rows)."""
+    rnd = random.Random(0)
+    for pickup_id in range(rows // (2 * TEAM)):
+        at = pickup_id * 600
+        players = rnd.sample(range(PLAYERS), 2 * TEAM)
+        yield (
+            (pickup_id, 1, "elim", at),
+            [
+                (pickup_id, 1, user_id, "player{0}".format(user_id), "elim", at)
+                for user_id in players
+            ],
+        )
+
+
+async def spam(rnd):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        command = rnd.randrange(3)
+        if command == 0:
+            await stats3.a_top(1, False, False)
+        elif command == 1:
+            await stats3.a_stats(1, "player{0}".format(rnd.randrange(20)))
+        else:
+            await stats3.a_get_ladder(1, rnd.randrange(3))
+    return (time.perf_counter() - start) / CALLS * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    console.init(enable_input=False)
+    config.init()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), config.db_pragmas())
+        for pickup, player_pickups in history(rows):
+            stats3.c.execute(
+                "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at) VALUES (?, ?, ?, ?)",
+                pickup,
+            )
+            stats3.c.executemany(
+                "INSERT INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at) VALUES (?, ?, ?, ?, ?, ?)",
+                player_pickups,
+            )
+        stats3.rebuild_counters()
+
+        print(f"{rows} rows, {CALLS} commands")
+        for name, ttl in (("uncached", 0), ("cached", 60)):
+            stats3.cache_results(1000, ttl)
+            stats3.result_cache.hits = stats3.result_cache.misses = 0
+            elapsed = asyncio.run(spam(random.Random(1)))
+            print(
+                f"{name:8} | {elapsed:7.3f} ms/command | "
+                f"{stats3.result_cache.hit_rate():4.0%} hits"
+            )
+        stats3.close()
+
+
+if __name__ == "__main__":
+    main()
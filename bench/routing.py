@@ -0,0 +1,87 @@
+"""Replaying messages through on_message with many pickup channels.
+
+Most messages come from channels without pickups, a few from pickup
+channels. Compares the channel registry with the previous scan over
+bot.channels.
+
+Run from the repository root:
+
+    python -m bench.routing [messages] [channels]
+"""
+
+import sys
+import time
+import random
+import asyncio
+from types import SimpleNamespace
+
+from pubobot import bot, client, config, console
+
+PICKUP_SHARE = 0.05  # messages sent in a pickup channel
+
+
+class FakeChannel:
+    def __init__(self, id):
+        self.id = id
+        self.processed = 0
+
+    async def processmsg(self, message):
+        self.processed += 1
+
+
+async def scan(message):
+    """The previous routing, after the !enable_pickups and DM checks."""
+    if message.content != "":
+        for channel in bot.channels:
+            if message.channel.id == channel.id:
+                await channel.processmsg(message)
+
+
+def replay(on_message, messages):
+    async def run():
+        start = time.perf_counter()
+        for message in messages:
+            await on_message(message)
+        return time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    console.init(enable_input=False)
+    config.init()
+    bot.init()
+    c = client.create_client(asyncio.new_event_loop())
+
+    for channel_id in range(channels):
+        bot.add_channel(FakeChannel(channel_id))
+    rnd = random.Random(0)
+    author = SimpleNamespace(id=1, display_name="player")
+    messages = [
+        SimpleNamespace(
+            channel=SimpleNamespace(
+                id=rnd.randrange(channels)
+                if rnd.random() < PICKUP_SHARE
+                else channels + rnd.randrange(100000)
+            ),
+            author=author,
+            content=rnd.choice(("!add elim", "gg", "hello there", "!who")),
+        )
+        for _ in range(count)
+    ]
+
+    print(f"{count} messages, {channels} pickup channels")
+    routed = []
+    for name, on_message in (("scan", scan), ("registry", c.on_message)):
+        elapsed = replay(on_message, messages)
+        routed.append([channel.processed for channel in bot.channels])
+        for channel in bot.channels:
+            channel.processed = 0
+        print(f"{name:8} | {elapsed:6.3f} s | {elapsed / count * 1e6:7.2f} us/message")
+    assert routed[0] == routed[1]
+
+
+if __name__ == "__main__":
+    main()
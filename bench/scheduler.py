@@ -0,0 +1,78 @@
+"""Microbenchmark for pubobot.scheduler with many pending !expire timers.
+
+Run from the repository root:
+
+    python -m bench.scheduler [timers]
+"""
+
+import sys
+import time
+import random
+
+from pubobot import scheduler
+
+
+def sorted_scheduler(n, delays, cancels):
+    """The previous implementation: re-sort every task on each change."""
+    tasks = {}
+    next_task = False
+
+    def define_next_task():
+        nonlocal next_task
+        if len(tasks):
+            next_task = sorted([(v, k) for (k, v) in tasks.items()])[0][1]
+        else:
+            next_task = False
+
+    start = time.perf_counter()
+    for i in range(n):
+        tasks[i] = [delays[i], None, (), None]
+        define_next_task()
+    added = time.perf_counter()
+    for i in cancels:
+        tasks.pop(i)
+        if next_task == i:
+            define_next_task()
+    cancelled = time.perf_counter()
+    return added - start, cancelled - added
+
+
+def heap_scheduler(n, delays, cancels):
+    scheduler.init()
+    func = lambda: None  # noqa: E731
+    start = time.perf_counter()
+    for i in range(n):
+        scheduler.add_task(i, delays[i], func, ())
+    added = time.perf_counter()
+    for i in cancels:
+        scheduler.cancel_task(i)
+    cancelled = time.perf_counter()
+    scheduler.run(time.time() + 1e9)
+    drained = time.perf_counter()
+    return added - start, cancelled - added, drained - cancelled
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rnd = random.Random(0)
+    delays = [rnd.uniform(60, 6 * 60 * 60) for _ in range(n)]
+    cancels = rnd.sample(range(n), n // 2)
+
+    add, cancel, drain = heap_scheduler(n, delays, cancels)
+    print(f"heap scheduler, {n} timers")
+    print(f"  add:    {add * 1000:9.2f} ms  ({add / n * 1e6:.2f} us/op)")
+    print(
+        f"  cancel: {cancel * 1000:9.2f} ms  ({cancel / len(cancels) * 1e6:.2f} us/op)"
+    )
+    print(f"  drain:  {drain * 1000:9.2f} ms  (one run() call)")
+
+    # the sort-everything version is quadratic, keep it to a sane size
+    m = min(n, 2000)
+    add, cancel = sorted_scheduler(m, delays[:m], [i for i in cancels if i < m])
+    print(f"sorted scheduler, {m} timers")
+    print(f"  add:    {add * 1000:9.2f} ms  ({add / m * 1e6:.2f} us/op)")
+    print(f"  cancel: {cancel * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
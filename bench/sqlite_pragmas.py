@@ -0,0 +1,42 @@
+"""Commits per second for small stats3 writes, default vs tuned pragmas.
+
+Run from the repository root:
+
+    python -m bench.sqlite_pragmas [commits]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from pubobot import config, console, stats3
+
+
+def commits_per_second(n, pragmas):
+    with tempfile.TemporaryDirectory() as tmp:
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), pragmas)
+        stats3.new_channel(1, "server", 2, "channel", 3)
+        start = time.perf_counter()
+        for i in range(n):
+            # the kind of one row write done by !expire and !set_default
+            stats3.set_expire(i % 50, i)
+        elapsed = time.perf_counter() - start
+        stats3.close()
+    return n / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    console.init(enable_input=False)
+    config.init()
+
+    default = commits_per_second(n, None)
+    tuned = commits_per_second(n, config.db_pragmas())
+    print(f"{n} commits")
+    print(f"  default pragmas: {default:9.0f} commits/s")
+    print(f"  tuned pragmas:   {tuned:9.0f} commits/s  ({tuned / default:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Commits and throughput of stats3 writes under a synthetic !add/!remove storm.
+
+Every !add looks up bans and phrases and every few commands someone changes
+their !expire or phrase, or a moderator hands out a !noadd.
+
+Run from the repository root:
+
+    python -m bench.write_behind [commands]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from pubobot import config, console, scheduler, stats3
+
+
+def storm(n, batch_size, pragmas):
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler.init()
+        stats3.init(os.path.join(tmp, "bench.sqlite3"), pragmas)
+        stats3.write_behind(batch_size, 1.0)
+        stats3.metrics.update(writes=0, commits=0, durable_commits=0)
+        stats3.new_channel(1, "server", 1, "channel", 1)
+
+        start = time.perf_counter()
+        for i in range(n):
+            user_id = rnd.randrange(200)
+            roll = rnd.random()
+            stats3.check_memberid(1, user_id)
+            if roll < 0.2:
+                stats3.set_expire(user_id, rnd.randrange(3600))
+            elif roll < 0.3:
+                stats3.set_phrase(1, user_id, "phrase {0}".format(i))
+            elif roll < 0.35:
+                stats3.noadd(1, user_id, "user", 60, "admin")
+            elif roll < 0.4:
+                stats3.forgive(1, user_id, "user", "admin")
+        stats3.flush()
+        elapsed = time.perf_counter() - start
+
+        metrics = dict(stats3.metrics)
+        stats3.close()
+        stats3.write_behind(0, 0)
+    return elapsed, metrics
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    console.init(enable_input=False)
+    config.init()
+
+    print(f"{n} commands")
+    for name, pragmas in (("default pragmas", None), ("tuned", config.db_pragmas())):
+        for batch_size in (0, 100):
+            elapsed, metrics = storm(n, batch_size, pragmas)
+            print(
+                f"  {name:15} batch {batch_size:3}: {metrics['writes']:5} writes, "
+                f"{metrics['commits']:5} commits, {n / elapsed:8.0f} commands/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
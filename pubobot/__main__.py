@@ -29,8 +29,12 @@ def main():
     console.init(args.logs, enable_input)
     scheduler.init()
     bot.init()
-    stats3.init(args.db)
     config.init(args.config)
+    stats3.init(args.db, config.db_pragmas())
+    stats3.schedule_checkpoint(config.cfg.DB_CHECKPOINT_INTERVAL)
+    stats3.write_behind(config.cfg.DB_BATCH_SIZE, config.cfg.DB_FLUSH_INTERVAL)
+    stats3.cache_ranks(config.cfg.RANK_CACHE_SIZE)
+    stats3.cache_results(config.cfg.RESULT_CACHE_SIZE, config.cfg.RESULT_CACHE_TTL)
     client.init()
 
     loop = client.c.loop
@@ -43,18 +47,19 @@ def main():
 
 
 async def bot_run():  # background thinking
-    while True:
-        if console.alive:
-            frametime = time.time()
-            bot.run(frametime)
-            scheduler.run(frametime)
-            console.run()
-            await client.send()
-            await asyncio.sleep(0.5)
-        else:
-            await client.close()
-            print("QUIT NOW.")
-            os._exit(0)
+    scheduler.attach(asyncio.get_running_loop())
+    client.start_sender()
+    while console.alive:
+        frametime = time.time()
+        bot.run(frametime)
+        scheduler.run(frametime)
+        console.run()
+        # sleep until a timer or a match is due, or something wakes us up
+        await scheduler.wait(bot.next_deadline())
+
+    await client.close()
+    print("QUIT NOW.")
+    os._exit(0)
 
 
 def cleanly_exit(sig):
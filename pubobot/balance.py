@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+# encoding: utf-8
+"""Split players into two teams with rating sums as close as possible."""
+
+import math
+import time
+import random
+from bisect import bisect_left
+from itertools import combinations
+
+# rosters with at most this many splits are searched exhaustively by arrange()
+EXHAUSTIVE = 512
+
+
+def split(ratings, size=None, budget=0.05, seed=None, engine="auto"):
+    """Return the indices of `ratings` that make up the first team.
+
+    The first team gets `size` players, half of them by default.
+    "exact" always finds the best split, "local" is a fast heuristic and
+    "auto" tries the exact search for `budget` seconds before falling back.
+    """
+    if size is None:
+        size = len(ratings) // 2
+    deadline = time.perf_counter() + budget if budget else None
+    return engines[engine](list(ratings), size, deadline, random.Random(seed))
+
+
+def auto(ratings, size, deadline, rnd):
+    try:
+        return exact(ratings, size, deadline, rnd)
+    except TimeoutError:
+        return local(ratings, size, None, rnd)
+
+
+def subset_sums(ratings):
+    """{count: [(sum, bitmask), ...] sorted by sum} for every subset."""
+    subsets = [(0, 0, 0)]
+    for i, rating in enumerate(ratings):
+        bit = 1 << i
+        subsets += [(s + rating, mask | bit, k + 1) for s, mask, k in subsets]
+
+    by_count = {}
+    for s, mask, k in subsets:
+        by_count.setdefault(k, []).append((s, mask))
+    for entries in by_count.values():
+        entries.sort()
+    return by_count
+
+
+def exact(ratings, size, deadline, rnd=None):
+    """Meet in the middle, O(2^(n/2) * n) instead of O(n choose n/2)."""
+    total = sum(ratings)
+    half = len(ratings) // 2
+    left = subset_sums(ratings[:half])
+    right = subset_sums(ratings[half:])
+    if deadline and time.perf_counter() > deadline:
+        raise TimeoutError()
+
+    best = None  # (|2 * sum - total|, left mask, right mask)
+    checked = 0
+    for k in sorted(left):
+        other = right.get(size - k)
+        if not other:
+            continue
+        keys = [s for s, _ in other]
+        for s, mask in left[k]:
+            # the ideal right sum is total / 2 - s, look at its neighbours
+            i = bisect_left(keys, total / 2 - s)
+            for j in (i - 1, i):
+                if 0 <= j < len(keys):
+                    diff = abs(2 * (s + keys[j]) - total)
+                    if best is None or diff < best[0]:
+                        best = (diff, mask, other[j][1])
+
+            checked += 1
+            if deadline and not checked % 1024 and time.perf_counter() > deadline:
+                raise TimeoutError()
+        if best and best[0] == total % 2:
+            break  # can not do better than this
+
+    _, left_mask, right_mask = best
+    team = [i for i in range(half) if left_mask >> i & 1]
+    team += [half + i for i in range(len(ratings) - half) if right_mask >> i & 1]
+    return team
+
+
+def local(ratings, size, deadline, rnd):
+    """Greedy split refined by swapping pairs of players, with restarts."""
+    order = sorted(range(len(ratings)), key=lambda i: ratings[i], reverse=True)
+    best = refine(ratings, greedy(ratings, size, order))
+    total = sum(ratings)
+
+    # a few shuffled restarts, deterministic for a given seed
+    for _ in range(8):
+        if abs(2 * sum(ratings[i] for i in best) - total) == total % 2:
+            break
+        if deadline and time.perf_counter() > deadline:
+            break
+        rnd.shuffle(order)
+        team = refine(ratings, greedy(ratings, size, order))
+        if abs(2 * sum(ratings[i] for i in team) - total) < abs(
+            2 * sum(ratings[i] for i in best) - total
+        ):
+            best = team
+    return sorted(best)
+
+
+def greedy(ratings, size, order):
+    # give each player to the weaker team that still has room
+    team, other = [], []
+    team_sum = other_sum = 0
+    for i in order:
+        if len(other) >= len(ratings) - size or (
+            len(team) < size and team_sum <= other_sum
+        ):
+            team.append(i)
+            team_sum += ratings[i]
+        else:
+            other.append(i)
+            other_sum += ratings[i]
+    return team
+
+
+def refine(ratings, team):
+    team = set(team)
+    other = set(range(len(ratings))) - team
+    total = sum(ratings)
+    diff = 2 * sum(ratings[i] for i in team) - total
+    while True:
+        # best single swap, stop once none makes the teams closer
+        best = None
+        for a in team:
+            for b in other:
+                new = diff - 2 * (ratings[a] - ratings[b])
+                if abs(new) < abs(diff) and (best is None or abs(new) < abs(best[0])):
+                    best = (new, a, b)
+        if best is None:
+            return list(team)
+        diff, a, b = best
+        team.remove(a)
+        other.remove(b)
+        team.add(b)
+        other.add(a)
+
+
+engines = {"auto": auto, "exact": exact, "local": local}
+
+
+class Objectives:
+    """Weighted cost of a split, in rating points.
+
+    rating: half the difference between team rating sums
+    spread: the difference between the rating deviations inside each team
+    captain: each team left without a captains_role holder
+    repeat: each pair of teammates who also played together last time
+    """
+
+    def __init__(
+        self, ratings, captains=(), teammates=(), spread=0.5, captain=1000, repeat=25
+    ):
+        self.ratings = list(ratings)
+        self.captains = [i in set(captains) for i in range(len(self.ratings))]
+        self.partners = [[] for _ in self.ratings]
+        for a, b in teammates:
+            self.partners[a].append(b)
+            self.partners[b].append(a)
+        self.weights = (spread, captain, repeat)
+
+    def state(self, team):
+        """[count, sum, sum of squares, captains] per team plus repeats."""
+        side = [False] * len(self.ratings)
+        for i in team:
+            side[i] = True
+        teams = ([0, 0, 0, 0], [0, 0, 0, 0])
+        for i, rating in enumerate(self.ratings):
+            t = teams[0 if side[i] else 1]
+            t[0] += 1
+            t[1] += rating
+            t[2] += rating * rating
+            t[3] += self.captains[i]
+        repeat = sum(
+            side[a] == side[b]
+            for a, partners in enumerate(self.partners)
+            for b in partners
+            if a < b
+        )
+        return side, teams, repeat
+
+    def parts(self, team):
+        """The unweighted (rating, spread, captain, repeat) of a split."""
+        _, teams, repeat = self.state(team)
+        return self.measure(teams[0], teams[1], repeat)
+
+    def measure(self, first, second, repeat):
+        rating = abs(first[1] - second[1]) / 2
+        spread = abs(deviation(*first[:3]) - deviation(*second[:3]))
+        captain = 0
+        if first[3] + second[3] >= 2:
+            captain = (not first[3]) + (not second[3])
+        return rating, spread, captain, repeat
+
+    def cost(self, team):
+        _, teams, repeat = self.state(team)
+        return self.weigh(teams[0], teams[1], repeat)
+
+    def weigh(self, first, second, repeat):
+        rating, spread, captain, repeat = self.measure(first, second, repeat)
+        w_spread, w_captain, w_repeat = self.weights
+        return rating + w_spread * spread + w_captain * captain + w_repeat * repeat
+
+
+def deviation(count, total, squares):
+    if not count:
+        return 0
+    mean = total / count
+    return max(squares / count - mean * mean, 0) ** 0.5
+
+
+def arrange(objectives, size=None, budget=0.01, seed=None, restarts=4):
+    """Search for the split with the lowest objectives.cost().
+
+    Small rosters are checked split by split, starting from the exact
+    rating split so it wins ties. Larger ones start from split() in "auto"
+    mode and improve it by swapping players, restarting from shuffled
+    greedy splits until `restarts` in a row found nothing better or
+    `budget` seconds are spent.
+    """
+    ratings = objectives.ratings
+    if size is None:
+        size = len(ratings) // 2
+    deadline = time.perf_counter() + budget
+    rnd = random.Random(seed)
+
+    start = split(ratings, size, budget, seed, engine="auto")
+    if math.comb(len(ratings), size) <= EXHAUSTIVE:
+        best, best_cost = start, objectives.cost(start)
+        for team in combinations(range(len(ratings)), size):
+            cost = objectives.cost(team)
+            if cost < best_cost:
+                best, best_cost = team, cost
+        return sorted(best)
+
+    best, best_cost = descend(objectives, start)
+    order = list(range(len(ratings)))
+    stale = 0
+    while best_cost and stale < restarts and time.perf_counter() < deadline:
+        rnd.shuffle(order)
+        team, cost = descend(objectives, greedy(ratings, size, order))
+        stale += 1
+        if cost < best_cost:
+            best, best_cost, stale = team, cost, 0
+    return sorted(best)
+
+
+def descend(objectives, team):
+    """Apply the best single swap until none lowers the cost."""
+    ratings, captains, partners = (
+        objectives.ratings,
+        objectives.captains,
+        objectives.partners,
+    )
+    side, (first, second), repeat = objectives.state(team)
+    cost = objectives.weigh(first, second, repeat)
+    while True:
+        best = None
+        for a in range(len(side)):
+            if not side[a]:
+                continue
+            ra, ca = ratings[a], captains[a]
+            for b in range(len(side)):
+                if side[b]:
+                    continue
+                rb, cb = ratings[b], captains[b]
+                # every partner of a or b changes between same and other team
+                swapped = repeat
+                for p in partners[a]:
+                    if p != b:
+                        swapped += -1 if side[p] else 1
+                for p in partners[b]:
+                    if p != a:
+                        swapped += 1 if side[p] else -1
+                new_first = [
+                    first[0],
+                    first[1] - ra + rb,
+                    first[2] - ra * ra + rb * rb,
+                    first[3] - ca + cb,
+                ]
+                new_second = [
+                    second[0],
+                    second[1] - rb + ra,
+                    second[2] - rb * rb + ra * ra,
+                    second[3] - cb + ca,
+                ]
+                new = objectives.weigh(new_first, new_second, swapped)
+                if new < cost and (best is None or new < best[0]):
+                    best = (new, a, b, new_first, new_second, swapped)
+        if best is None:
+            return [i for i in range(len(side)) if side[i]], cost
+        cost, a, b, first, second, repeat = best
+        side[a], side[b] = False, True
@@ -2,16 +2,25 @@
 # encoding: utf-8
 
 import time
+import asyncio
 import datetime
 import re
 import random
-from collections import OrderedDict
-from itertools import combinations
+from collections import OrderedDict, namedtuple
 from typing import List
 
 from discord import errors, Member
 
-from . import client, config, console, memberformatter, stats3, scheduler, utils
+from . import (
+    balance,
+    client,
+    config,
+    console,
+    memberformatter,
+    stats3,
+    scheduler,
+    utils,
+)
 
 max_expire_time = 6 * 60 * 60  # 6 hours
 max_bantime = 30 * 24 * 60 * 60 * 12 * 3  # 30 days * 12 * 3
@@ -43,9 +52,13 @@ team_emojis = [
 
 
 channels = []
+channels_by_id = {}  # {channel_id: Channel}, the same channels for message routing
 channels_list = []
 active_pickups = []
 active_matches = []
+# {member_id: {pickup or match: None}}, the active ones a member is in, kept by Players
+pickups_by_member = {}
+matches_by_member = {}
 allowoffline = []  # users with !allowoffline
 waiting_reactions = {}  # {message_id: function}
 
@@ -53,26 +66,125 @@ waiting_reactions = {}  # {message_id: function}
 def init():
     global \
         channels, \
+        channels_by_id, \
         channels_list, \
         active_pickups, \
         active_matches, \
+        pickups_by_member, \
+        matches_by_member, \
         allowoffline, \
         waiting_reactions
     channels = []
+    channels_by_id = {}
     channels_list = []
     active_pickups = []
     active_matches = []
+    pickups_by_member = {}
+    matches_by_member = {}
     allowoffline = []
     waiting_reactions = {}
 
 
+def check_index():
+    """Compare the member index with active_pickups and active_matches.
+
+    Returns the ids of the members whose entries differ, empty if consistent.
+    """
+    differ = set()
+    for active, index in (
+        (active_pickups, pickups_by_member),
+        (active_matches, matches_by_member),
+    ):
+        expected = {}
+        for owner in active:
+            for member in owner.players:
+                expected.setdefault(member.id, set()).add(owner)
+        for member_id in set(expected) | set(index):
+            if expected.get(member_id) != set(index.get(member_id, ())):
+                differ.add(member_id)
+    return tuple(sorted(differ))
+
+
+class Players(list):
+    """Players of a pickup or a match, mirrored into the member index.
+
+    Pickups are always indexed, matches only while they are active.
+    """
+
+    __slots__ = ("owner", "indexed")
+
+    def __init__(self, owner, players=(), indexed=True):
+        super().__init__(players)
+        self.owner = owner
+        self.indexed = False
+        if indexed:
+            self.attach()
+
+    def index(self):
+        if isinstance(self.owner, Match):
+            return matches_by_member
+        return pickups_by_member
+
+    def ids(self):
+        return set(member.id for member in self)
+
+    def attach(self):
+        if not self.indexed:
+            self.indexed = True
+            self.sync(set(), self.ids())
+
+    def detach(self):
+        if self.indexed:
+            self.sync(self.ids(), set())
+            self.indexed = False
+
+    def sync(self, before, after):
+        index = self.index()
+        for member_id in before - after:
+            entries = index[member_id]
+            entries.pop(self.owner, None)
+            if not entries:
+                del index[member_id]
+        for member_id in after - before:
+            index.setdefault(member_id, {})[self.owner] = None
+
+
+def _tracked(method):
+    def mutate(self, *args):
+        if not self.indexed:
+            return method(self, *args)
+        before = self.ids()
+        result = method(self, *args)
+        self.sync(before, self.ids())
+        return result
+
+    return mutate
+
+
+for mutator in (
+    "append",
+    "extend",
+    "insert",
+    "remove",
+    "pop",
+    "clear",
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+):
+    setattr(Players, mutator, _tracked(getattr(list, mutator)))
+
+
 class UnpickedPool:
+    __slots__ = ("position_to_players", "player_positions")
+
     def __init__(self, players):
         self.position_to_players = OrderedDict()
+        self.player_positions = {}  # {player id: position}
         players_copy = players[:]
         random.shuffle(players_copy)
         for i, player in enumerate(players_copy, 1):
-            self.position_to_players[i] = player
+            self.add(player, i)
 
     def __len__(self):
         return len(self.position_to_players)
@@ -95,10 +207,8 @@ class UnpickedPool:
         return self.position_to_players.get(position)
 
     def get_by_player_id(self, player_id):
-        for position in self.position_to_players:
-            if self.position_to_players[position].id == player_id:
-                return position, self.position_to_players[position]
-        return (None, None)
+        position = self.player_positions.get(player_id)
+        return position, self.position_to_players.get(position)
 
     def pick_by_position(self, position):
         """Pick a player by their position from the arbitrary position assignments they were given."""
@@ -108,21 +218,18 @@ class UnpickedPool:
 
     def pick_by_player_id(self, player_id):
         """Pick a player by the player/member id of their discord user."""
-        for position in self.position_to_players:
-            if self.position_to_players[position].id == player_id:
-                player = self.position_to_players[position]
-                self.remove(position)
-                return player
+        position = self.player_positions.get(player_id)
+        if position is not None:
+            return self.pick_by_position(position)
 
     def find_player(self, player):
         """Returns a players position if they exist in the unpicked pool"""
-        for position, player_ in self.position_to_players.items():
-            if player == player_:
-                return position
+        return self.player_positions.get(player.id)
 
     def remove(self, position):
         """Remove a player by their position in the unpicked pool."""
-        del self.position_to_players[position]
+        player = self.position_to_players.pop(position)
+        del self.player_positions[player.id]
 
     def remove_player(self, player):
         pos, player = self.get_by_player_id(player.id)
@@ -132,35 +239,71 @@ class UnpickedPool:
     def add(self, player, position):
         """Adds a player to the unpicked pool with a pre-assigned position"""
         self.position_to_players[position] = player
+        self.player_positions[player.id] = position
 
     def clear(self):
         """removes all players from unpicked pool."""
         self.position_to_players = OrderedDict()
+        self.player_positions = {}
 
     def __contains__(self, player):
         """Returns True if player is in unpicked pool else False"""
-        if self.find_player(player):
-            return True
-        else:
-            return False
+        return player.id in self.player_positions
 
 
 class Match:
+    __slots__ = (
+        "_players",
+        "id",
+        "ready_message",
+        "settings",
+        "maxplayers",
+        "pick_teams",
+        "require_ready",
+        "ready_expire",
+        "pick_order",
+        "ranked",
+        "ranked_streaks",
+        "ranks",
+        "captains_role",
+        "map",
+        "state",
+        "pickup",
+        "channel",
+        "winner",
+        "unpicked_pool",
+        "lastpick",
+        "beta_draw",
+        "alpha_draw",
+        "beta_cancel",
+        "alpha_cancel",
+        "captains",
+        "pick_step",
+        "players_ready",
+        "alpha_icon",
+        "beta_icon",
+        "team_names",
+        "alpha_team",
+        "beta_team",
+        "start_time",
+    )
+
     def __init__(self, pickup, players: List[Member]):
         global matches_step
+        self._players = Players(self, indexed=False)  # indexed while active
         # set match id
         stats3.last_match += 1
         self.id = stats3.last_match
         self.ready_message = None
         # these values cannot be changed until match end, so we need to save them
+        self.settings = pickup.channel.settings(pickup)
+        cfg = self.settings.values
         self.maxplayers = pickup.cfg["maxplayers"]
-        self.pick_teams = pickup.channel.get_value("pick_teams", pickup)
-        self.require_ready = pickup.channel.get_value("require_ready", pickup)
-        self.ready_expire = pickup.channel.get_value("ready_expire", pickup)
+        self.pick_teams = cfg["pick_teams"]
+        self.require_ready = cfg["require_ready"]
+        self.ready_expire = cfg["ready_expire"]
         self.pick_order = pickup.cfg["pick_order"]
-        self.ranked = bool(
-            pickup.channel.get_value("ranked", pickup) and self.pick_teams != "no_teams"
-        )
+        self.ranked = bool(cfg["ranked"] and self.pick_teams != "no_teams")
         self.ranked_streaks = pickup.channel.cfg["ranked_streaks"]
         if self.ranked:
             self.ranks = stats3.get_ranks(pickup.channel, [i.id for i in players])
@@ -169,8 +312,8 @@ class Match:
             )
         else:
             self.players = list(players)
-        self.captains_role = pickup.channel.get_value("captains_role", pickup)
-        maps = pickup.channel.get_value("maps", pickup)
+        self.captains_role = cfg["captains_role"]
+        maps = cfg["maps"]
         if maps:
             maps = [i.strip() for i in maps.split(",")]
             if pickup.lastmap and len(maps) > 1 and pickup.lastmap in maps:
@@ -192,7 +335,7 @@ class Match:
         self.beta_cancel = False
         self.alpha_cancel = False
 
-        pick_captains = self.pickup.channel.get_value("pick_captains", pickup)
+        pick_captains = cfg["pick_captains"]
         if pick_captains and len(players) > 2 and self.pick_teams != "auto":
             if self.ranked:
                 if pick_captains == 1:
@@ -247,15 +390,13 @@ class Match:
                 ):
                     self.players_ready.append(user.id)
 
-        emojis = pickup.channel.get_value("team_emojis", pickup)
+        emojis = cfg["team_emojis"]
         if emojis:
             self.alpha_icon, self.beta_icon = emojis.split(" ")
         else:
             self.alpha_icon, self.beta_icon = random.sample(team_emojis, 2)
 
-        self.team_names = (
-            pickup.channel.get_value("team_names", pickup) or "alpha beta"
-        ).split(" ")
+        self.team_names = (cfg["team_names"] or "alpha beta").split(" ")
 
         if len(players) > 2:
             if self.pick_teams == "no_teams" or self.pick_teams == None:
@@ -278,16 +419,31 @@ class Match:
                 # form balanced teams by rank
                 if self.ranked:
                     teamlen = int(len(self.players) / 2)
-                    perfect_rank = sum(self.ranks.values()) / 2
-                    best_diff = 10000
-                    best_team = None
-                    for team in combinations(self.players, teamlen):
-                        rank = sum([self.ranks[i.id] for i in team])
-                        if abs(perfect_rank - rank) < best_diff:
-                            best_diff = abs(perfect_rank - rank)
-                            best_team = list(team)
-
-                    self.alpha_team = best_team
+                    user_ids = [i.id for i in self.players]
+                    index = {user_id: i for i, user_id in enumerate(user_ids)}
+                    objectives = balance.Objectives(
+                        [self.ranks[user_id] for user_id in user_ids],
+                        [
+                            i
+                            for i, p in enumerate(self.players)
+                            if self.captains_role
+                            and self.captains_role in [role.id for role in p.roles]
+                        ],
+                        [
+                            (index[a], index[b])
+                            for a, b in stats3.last_teammates(
+                                pickup.channel.id, user_ids
+                            )
+                        ],
+                        config.cfg.BALANCE_SPREAD_WEIGHT,
+                        config.cfg.BALANCE_CAPTAIN_WEIGHT,
+                        config.cfg.BALANCE_REPEAT_WEIGHT,
+                    )
+                    alpha = balance.arrange(
+                        objectives, teamlen, config.cfg.BALANCE_TIME_BUDGET
+                    )
+
+                    self.alpha_team = [self.players[i] for i in alpha]
                     self.beta_team = list(
                         filter(lambda i: i not in self.alpha_team, self.players)
                     )
@@ -332,8 +488,20 @@ class Match:
         # set state and start time
         self.start_time = time.time()
         active_matches.append(self)
+        self.players.attach()
+        scheduler.wakeup()
         self.next_state()
 
+    @property
+    def players(self) -> List[Member]:
+        return self._players
+
+    @players.setter
+    def players(self, players):
+        indexed = self._players.indexed
+        self._players.detach()
+        self._players = Players(self, players, indexed)
+
     def think(self, frametime):
         alive_time = frametime - self.start_time
         if self.state == "waiting_ready":
@@ -349,7 +517,7 @@ class Match:
                     f"{not_ready_str} {was_were} not ready in time!\r\nReverting **{self.pickup.name}** pickup to gathering state...",
                 )
 
-                self.players: List[Member] = list(
+                self.players = list(
                     filter(lambda x: x.id in self.players_ready, self.players)
                 )
                 self.ready_fallback()
@@ -361,6 +529,15 @@ class Match:
             )
             self.cancel_match()
 
+    @property
+    def deadline(self):
+        """Time at which think() will act on this match."""
+        if self.state == "waiting_ready":
+            return self.start_time + self.require_ready
+        return self.start_time + (
+            self.pickup.channel.cfg["match_livetime"] or max_match_alive_time
+        )
+
     def _teams_to_str(self):
         alpha_str = f"{self.alpha_icon} {self._team_to_str(self.alpha_team, True)}"
         beta_str = f"{self.beta_icon} {self._team_to_str(self.beta_team, True)}"
@@ -409,11 +586,7 @@ class Match:
         return f"{match_id_str}\n{self.alpha_icon} {alpha_str}\n{self.beta_icon} {beta_str}\n\n__Unpicked__:\n{unpicked_str}"
 
     def _startmsg_to_str(self):
-        ipstr = self.pickup.channel.get_value("startmsg", self.pickup)
-        ip = self.pickup.channel.get_value("ip", self.pickup)
-        password = self.pickup.channel.get_value("password", self.pickup)
-        ipstr = ipstr.replace("%ip%", ip or "").replace("%password%", password or "")
-        return ipstr
+        return self.settings.startmsg
 
     def _players_to_str(self, players):
         return memberformatter.format_list(players, True)
@@ -517,15 +690,36 @@ class Match:
         elif self.state == "waiting_report":
             self.finish_match()
 
+        scheduler.wakeup()  # the deadline depends on the state
+
     def finish_match(self):
-        new_ranks = stats3.register_pickup(self)
-        self.pickup.channel.lastgame_cache = stats3.lastgame(self.pickup.channel.id)
+        # queued right away so matches are stored in the order they finished
+        job = stats3.submit(self._store)
+        self.pickup.channel.lastgame_job = job
         self.pickup.unmark_user_ready(*self.players)
         active_matches.remove(self)
+        self.players.detach()
         if self.state == "waiting_report":
             client.notice(
                 self.channel, "Match *({0})* has been finished.".format(self.id)
             )
+        asyncio.ensure_future(self._announce_ranks(job))
+
+    def _store(self):  # runs on the database thread
+        new_ranks = stats3.register_pickup(self)
+        self.pickup.channel.lastgame_cache = stats3.lastgame(self.pickup.channel.id)
+        return new_ranks
+
+    async def _announce_ranks(self, job):
+        try:
+            new_ranks = await asyncio.wrap_future(job)
+        except Exception as e:
+            console.display(
+                "ERROR| Could not save match {0}: {1}".format(self.id, str(e))
+            )
+            return
+
+        if self.state == "waiting_report":
             if len(new_ranks):
                 summary = "\n".join(
                     [
@@ -555,6 +749,7 @@ class Match:
             waiting_reactions.pop(self.ready_message.id)
 
         active_matches.remove(self)
+        self.players.detach()
 
     def draw_match(self):
         # client.notice(self.channel, "Match {0} finished. Your match has ended in a draw.".format(self.id))
@@ -642,6 +837,7 @@ class Match:
 
     def pickup_fallback(self):
         active_matches.remove(self)
+        self.players.detach()
         newplayers = list(self.pickup.players)
         self.pickup.players = list(self.players)
         while len(self.pickup.players) < self.pickup.cfg["maxplayers"] and len(
@@ -651,7 +847,7 @@ class Match:
         if len(self.pickup.players) == self.pickup.cfg["maxplayers"]:
             self.pickup.channel.start_pickup(self.pickup)
             self.pickup.players = newplayers
-        if len(self.pickup.players):
+        if len(self.pickup.players) and self.pickup not in active_pickups:
             active_pickups.append(self.pickup)
         self.pickup.channel.update_topic()
 
@@ -668,6 +864,8 @@ class Match:
 
 
 class ReadyMark:
+    __slots__ = ("user", "time")
+
     def __init__(self, user):
         self.user = user
         self.time = 0.0
@@ -678,14 +876,34 @@ class ReadyMark:
 
 
 class Pickup:
+    __slots__ = (
+        "_players",
+        "settings",
+        "users_last_ready",
+        "name",
+        "lastmap",
+        "channel",
+        "cfg",
+    )
+
     def __init__(self, channel, cfg):
-        self.players: List[Member] = []
+        self._players = Players(self)
+        self.settings = None  # EffectiveConfig, see Channel.settings
         self.users_last_ready = {}
         self.name = cfg["pickup_name"]
         self.lastmap = None
         self.channel = channel
         self.cfg = cfg
 
+    @property
+    def players(self) -> List[Member]:
+        return self._players
+
+    @players.setter
+    def players(self, players):
+        self._players.detach()
+        self._players = Players(self, players)
+
     def mark_user_ready(self, *users):
         ready_time = time.time()
         for u in users:
@@ -708,6 +926,62 @@ class Pickup:
         return ready_users
 
 
+class Template:
+    """A message with %variable% placeholders, split up once."""
+
+    def __init__(self, text):
+        self.parts = re.split(r"%(\w+)%", text or "")
+
+    def render(self, **values):
+        """Fill in the given variables, others are left as they are."""
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            if parts[i] in values:
+                parts[i] = str(values[parts[i]])
+            else:
+                parts[i] = "%" + parts[i] + "%"
+        return "".join(parts)
+
+
+class EffectiveConfig:
+    """The config of a pickup with the channel defaults filled in.
+
+    Built on first use by Channel.settings and replaced whenever the
+    channel or pickup config is updated, so matches can keep one.
+    Messages with variables known up front are rendered here.
+    """
+
+    def __init__(self, channel, pickup):
+        self.values = {
+            key: channel.cfg.get(key) if value is None else value
+            for key, value in pickup.cfg.items()
+        }
+        get = self.values.get
+        ip, password = get("ip") or "", get("password") or ""
+        role = get("promotion_role")
+        role = "<@&{0}>".format(role) if role else ""
+
+        self.startmsg = Template(get("startmsg")).render(ip=ip, password=password)
+        self.start_pm_msg = get("start_pm_msg") and Template(
+            get("start_pm_msg")
+        ).render(
+            channel="<#{0}>".format(channel.id),
+            pickup_name=pickup.name,
+            ip=ip,
+            password=password,
+        )
+        self.submsg = Template(
+            get("submsg")
+            or "%promotion_role% NEED SUB @ **%pickup_name%**, please connect to %ip%."
+        ).render(pickup_name=pickup.name, ip=ip, password=password, promotion_role=role)
+        self.promotemsg = Template(
+            Template(
+                get("promotemsg")
+                or "%promotion_role% please !add %pickup_name%, %required_players% players to go!"
+            ).render(promotion_role=role, pickup_name=pickup.name)
+        )  # %required_players% is left for promote_pickup
+
+
 class Channel:
     def __init__(self, channel, cfg):
         self.channel = channel
@@ -715,6 +989,8 @@ class Channel:
         self.name = "{0}>{1}".format(channel.guild.name, channel.name)
         self.guild = channel.guild
         self.cfg = cfg
+        self.pickups = []
+        self.pickups_by_name = {}  # {lowercase name: Pickup}, as ordered in pickups
         self.update_channel_config("channel_name", channel.name)
         self.update_channel_config("server_name", channel.guild.name)
         if not self.cfg["startmsg"]:
@@ -726,10 +1002,12 @@ class Channel:
                 "%promotion_role% SUB NEEDED @ **%pickup_name%**. Please connect to steam://connect/%ip%/%password%",
             )
         self.oldtime = 0
-        self.pickups = []
         self.init_pickups()
         self.pickup_groups = stats3.get_pickup_groups(self.id)
         self.lastgame_cache = stats3.lastgame(self.id)
+        self.lastgame_job = (
+            None  # match being saved, lastgame_cache is stale until done
+        )
         self.lastgame_pickup = None
         self.oldtopic = "[**no pickups**]"
         self.to_remove = []  # players
@@ -738,7 +1016,7 @@ class Channel:
         pickups = stats3.get_pickups(self.id)
         for i in pickups:
             try:
-                self.pickups.append(Pickup(self, i))
+                self.add_pickup(Pickup(self, i))
             except Exception as e:
                 console.display(
                     "ERROR| Failed to init a pickup of channel {0}({1}) @ {2}.".format(
@@ -746,6 +1024,28 @@ class Channel:
                     )
                 )
 
+    def add_pickup(self, pickup):
+        self.pickups.append(pickup)
+        self.pickups_by_name[pickup.name.lower()] = pickup
+
+    def drop_pickup(self, pickup):
+        self.pickups.remove(pickup)
+        del self.pickups_by_name[pickup.name.lower()]
+
+    def get_pickup(self, name):
+        return self.pickups_by_name.get(name.lower())
+
+    def get_pickups(self, names):
+        """Resolve pickup and pickup group names, in the order of self.pickups."""
+        found = set()
+        for name in names:
+            name = name.lower()
+            for name in self.pickup_groups.get(name, (name,)):
+                pickup = self.pickups_by_name.get(name.lower())
+                if pickup:
+                    found.add(pickup)
+        return sorted(found, key=self.pickups.index)
+
     def start_pickup(self, pickup):
         if len(pickup.players) < 2:
             client.notice(
@@ -756,12 +1056,7 @@ class Channel:
         players = list(pickup.players)
         affected_channels = list()
 
-        pmsg = self.get_value("start_pm_msg", pickup)
-        if pmsg:
-            pmsg = pmsg.replace("%channel%", "<#{0}>".format(self.id))
-            pmsg = pmsg.replace("%pickup_name%", pickup.name)
-            pmsg = pmsg.replace("%ip%", self.get_value("ip", pickup) or "")
-            pmsg = pmsg.replace("%password%", self.get_value("password", pickup) or "")
+        pmsg = self.settings(pickup).start_pm_msg
 
         for i in players:
             if i in allowoffline:
@@ -770,9 +1065,7 @@ class Channel:
                 scheduler.cancel_task(i.id)
             if pmsg:
                 client.private_reply(i, pmsg)
-            for pu in (
-                pu for pu in list(active_pickups) if i.id in [x.id for x in pu.players]
-            ):
+            for pu in list(pickups_by_member.get(i.id, ())):
                 pu.players.remove(i)
                 if not len(pu.players):
                     active_pickups.remove(pu)
@@ -800,252 +1093,86 @@ class Channel:
         self.lastgame_pickup = pickup
 
     async def processmsg(self, msg):
+        first = msg.content[:1].lower()
+        if first not in ("+", "-") and first != self.cfg["prefix"]:
+            return  # most of the chat is not a command
+
         member = msg.author
         msgtup = msg.content.split(" ")
         lower = [i.lower() for i in msgtup]
-        msglen = len(lower)
-        role_ids = [i.id for i in member.roles]
-        if (
-            self.cfg["admin_role"] in role_ids
-            or member.id == self.cfg["admin_id"]
-            or self.channel.permissions_for(member).administrator
-        ):
-            access_level = 2
-        elif self.cfg["moderator_role"] in role_ids:
-            access_level = 1
-        else:
-            access_level = 0
 
-        if re.match("^\+..", lower[0]):
+        if add_pattern.match(lower[0]):
             lower[0] = lower[0].lstrip(":+")
-            self.add_player(member, lower[0:msglen])
+            await self.add_player(member, lower[:])
 
         elif lower[0] == "++":
-            self.add_player(member, [])
+            await self.add_player(member, [])
 
-        elif re.match("^-..", lower[0]):
+        elif remove_pattern.match(lower[0]):
             lower[0] = lower[0].lstrip(":-")
-            self.remove_player(member, lower[0:msglen])
+            self.remove_player(member, lower[:])
 
         elif lower[0] == "--":
             self.remove_player(member, [])
 
-        prefix, lower[0] = lower[0][0], lower[0][1:]
-        if prefix == self.cfg["prefix"]:
-            console.display(
-                "CHAT| {0}>{1}>{2}: {3}".format(
-                    msg.guild, msg.channel, msg.author.display_name, msg.content
-                )
+        prefix, name = lower[0][:1], lower[0][1:]
+        if prefix != self.cfg["prefix"]:
+            return
+        console.display(
+            "CHAT| {0}>{1}>{2}: {3}".format(
+                msg.guild, msg.channel, msg.author.display_name, msg.content
             )
+        )
 
-            if lower[0] in ["add", "j"]:
-                self.add_player(member, lower[1:msglen])
-
-            elif lower[0] in ["remove", "l"]:
-                self.remove_player(member, lower[1:msglen])
-
-            elif lower[0] == "lva":
-                self.remove_player(member, [])
-
-            elif lower[0] == "expire":
-                self.expire(member, lower[1:msglen])
-
-            elif lower[0] == "default_expire":
-                self.default_expire(member, lower[1:msglen])
-
-            elif lower[0] == "allowoffline" or lower[0] == "ao":
-                self.switch_allowoffline(member)
-
-            elif lower[0] == "remove_player" and msglen == 2:
-                self.remove_players(member, lower[1], access_level)
-
-            elif lower[0] in ["who", "list", "ls"]:
-                self.who(member, lower[1:msglen])
-
-            elif lower[0] == "start":
-                self.user_start_pickup(member, lower[1:msglen], access_level)
-
-            elif lower[0] in ["pickups", "pugs"]:
-                self.replypickups(member)
-
-            elif lower[0] == "promote" or lower[0] == "pro" or lower[0] == "spam":
-                await self.promote_pickup(member, lower[1:2])
-
-            elif lower[0] == "subscribe":
-                await self.subscribe(member, lower[1:msglen], False)
-
-            elif lower[0] == "unsubscribe":
-                await self.subscribe(member, lower[1:msglen], True)
-
-            elif last_match := re.match(r"last(t*)", lower[0]):
-                t_count = len(last_match.group(1))
-                # dont let mouthbreathers do lasttttttttttttttttttttttttttttttttttttt
-                if t_count <= 5:
-                    self.lastgame(member, msgtup[1:msglen], t_count)
-
-            elif lower[0] == "liast":
-                self.who(member, lower[1:msglen])
-                self.lastgame(member, msgtup[1:msglen])
-
-            elif lower[0] == "sub":
-                await self.sub_request(member)
-
-            elif lower[0] in ["cointoss", "ct"]:
-                self.cointoss(member, lower[1:2])
-
-            elif lower[0] == "p":
-                self.pick_player(member, lower[1:])
-
-            elif lower[0] == "pick":
-                self.pick_player(member, lower[1:])
-
-            elif lower[0] == "put":
-                await self.put_player(member, lower[1:3], access_level)
-
-            elif lower[0] == "capfor":
-                if self.cfg["capfor_enabled"] == 1:
-                    self.capfor(member, lower[1:2])
-
-            elif lower[0] == "subfor":
-                await self.subfor(member, lower[1:2])
-
-            elif lower[0] in ["teams", "turn"]:
-                self.print_teams(member)
-
-            elif lower[0] == "matches":
-                self.get_matches()
-
-            elif lower[0] == "cancel_match":
-                self.cancel_match(member, lower[1:2], access_level)
-
-            elif lower[0] == "cancel":
-                self.cancel_match(member, lower[1:2], access_level)
-
-            elif lower[0] in ["reportwin", "rw"]:
-                self.report_match(member, args=lower[1:3], access_level=access_level)
-
-            elif lower[0] in ["reportlose", "rl"]:
-                self.report_match(member)
-
-            elif lower[0] in ["reportdraw", "draw", "rd"]:
-                self.report_draw(member)
-
-            elif lower[0] in ["reportcancel", "rc"]:
-                self.report_cancel(member)
-
-            elif lower[0] in ["ready", "r"]:
-                self.set_ready(member, True)
-
-            elif lower[0] in ["notready", "nr"]:
-                self.set_ready(member, False)
-
-            elif lower[0] == "stats":
-                self.getstats(member, msg.content.split(" ", 1)[1:])
-
-            elif lower[0] == "top":
-                self.gettop(member, msgtup[1:msglen])
-
-            elif lower[0] == "set_ao_for_all":
-                self.set_ao_for_all(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "add_pickups":
-                self.add_pickups(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "remove_pickups":
-                self.remove_pickups(member, lower[1:msglen], access_level)
-
-            elif lower[0] == "add_pickup_group":
-                self.add_pickup_group(member, lower[1:msglen], access_level)
-
-            elif lower[0] == "remove_pickup_group":
-                self.remove_pickup_group(member, lower[1:msglen], access_level)
-
-            elif lower[0] == "pickup_groups":
-                self.show_pickup_groups()
-
-            elif lower[0] == "maps":
-                self.show_maps(member, lower[1:msglen], False)
-
-            elif lower[0] == "map":
-                self.show_maps(member, lower[1:msglen], True)
-
-            elif lower[0] == "ip":
-                self.getip(member, lower[1:2])
-
-            elif lower[0] == "noadd" and msglen > 1:
-                await self.noadd(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "forgive" and msglen == 2:
-                await self.forgive(member, msgtup[1], access_level)
-
-            elif lower[0] == "noadds":
-                self.getnoadds(member, msgtup[1:2])
-
-            elif lower[0] == "reset":
-                self.reset_players(member, lower[1:msglen], access_level)
-
-            elif lower[0] == "reset_picks":
-                self.reset_picks(member, lower[1:2], access_level)
-
-            elif lower[0] == "reset_stats":
-                self.reset_stats(member, access_level)
-
-            elif lower[0] == "phrase":
-                await self.set_phrase(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "commands":
-                client.reply(self.channel, member, config.cfg.COMMANDS_LINK)
-
-            elif lower[0] == "cfg":
-                self.show_config(member, msgtup[1:2])
-
-            elif lower[0] == "pickup_cfg":
-                self.show_pickup_config(member, msgtup[1:3])
-
-            elif lower[0] == "set_default" and msglen > 2:
-                self.configure_default(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "set_pickups" and msglen > 3:
-                self.configure_pickups(member, msgtup[1:msglen], access_level)
-
-            elif lower[0] == "help":
-                self.help_answer(member, lower[1:])
-
-            elif self.cfg["ranked"]:
-                if lower[0] in ["leaderboard", "lb"]:
-                    self.get_leaderboard(lower[1:2])
-
-                elif lower[0] == "rank":
-                    self.get_rank_details(member, lower[1 : len(lower)])
-
-                elif lower[0] == "ranks_table":
-                    self.show_ranks_table()
-
-                elif lower[0] == "undo_ranks":
-                    self.undo_ranks(member, lower[1:2], access_level)
+        command = commands.get(name)
+        if command is None:
+            last = last_pattern.match(name)
+            # dont let mouthbreathers do lasttttttttttttttttttttttttttttttttttttt
+            if last and len(last.group(1)) <= 5:
+                await self.lastgame(member, msgtup[1:], len(last.group(1)))
+            return
+        if command.ranked and not self.cfg["ranked"]:
+            return
+        if not command.min_args <= len(msgtup) - 1 <= command.max_args:
+            return
 
-                elif lower[0] == "reset_ranks":
-                    self.reset_ranks(member, access_level)
+        access_level = self.access_level(member) if command.access else 0
+        call = Call(msg, member, msgtup[1:], lower[1:], access_level)
+        if command.is_async:
+            await command.handler(self, call)
+        else:
+            command.handler(self, call)
 
-                elif lower[0] == "seed":
-                    await self.seed_player(member, lower[1:msglen], access_level)
+    def access_level(self, member):
+        role_ids = [i.id for i in member.roles]
+        if (
+            self.cfg["admin_role"] in role_ids
+            or member.id == self.cfg["admin_id"]
+            or self.channel.permissions_for(member).administrator
+        ):
+            return 2
+        elif self.cfg["moderator_role"] in role_ids:
+            return 1
+        else:
+            return 0
 
     ### COMMANDS ###
 
-    def add_player(self, member, target_pickups):
-        match = self._match_by_player(member)
-        if match:
-            client.reply(self.channel, member, "You are already in an active match.")
-            return
-
+    async def add_player(self, member, target_pickups):
         # check noadds and phrases
-        l = stats3.check_memberid(
+        l = await stats3.a_check_memberid(
             self.id, member.id
         )  # is_banned, phrase, default_expire
         if l[0] == True:  # if banned
             client.reply(self.channel, member, l[1])
             return
 
+        # after the await, a pickup the member is in may have started meanwhile
+        match = self._match_by_player(member)
+        if match:
+            client.reply(self.channel, member, "You are already in an active match.")
+            return
+
         changes = False
         # ADD GUY TO TEH GAMES
         if (
@@ -1062,16 +1189,10 @@ class Channel:
                     )
                 )
             else:
-                for i in list(target_pickups):
-                    if i in self.pickup_groups.keys():
-                        target_pickups.remove(i)
-                        target_pickups += self.pickup_groups[i]
-                filtered_pickups = list(
-                    filter(lambda p: p.name.lower() in target_pickups, self.pickups)
-                )
+                filtered_pickups = self.get_pickups(target_pickups)
 
         for pickup in filtered_pickups:
-            if member.id not in [i.id for i in pickup.players]:
+            if pickup not in pickups_by_member.get(member.id, ()):
                 # check if pickup have blacklist or whitelist
                 whitelist_role = self.get_value("whitelist_role", pickup)
                 blacklist_role = self.get_value("blacklist_role", pickup)
@@ -1132,35 +1253,25 @@ class Channel:
     def remove_player(self, member, args, reason="online"):
         changes = []
         allpickups = True
+        targets = self.get_pickups(args)  # pickup groups included
 
-        # add pickups from pickup_groups
-        for i in list(args):
-            if i in self.pickup_groups.keys():
-                args.remove(i)
-                args += self.pickup_groups[i]
         # remove player from games
-        for pickup in list(active_pickups):
-            if member.id in [i.id for i in pickup.players]:
-                if pickup.channel.id == self.id and (
-                    args == [] or pickup.name.lower() in args
-                ):
-                    changes.append(pickup.name)
-                    pickup.players.remove(member)
-                    pickup.unmark_user_ready(member)
-                    if len(pickup.players) == 0:
-                        active_pickups.remove(pickup)
-                elif allpickups:
-                    allpickups = False
-
-        for match in list(active_matches):
-            if member.id in [i.id for i in match.players]:
-                if match.channel.id == self.id and (
-                    args == [] or pickup.name.lower() in args
-                ):
-                    if match.state == "waiting_ready":
-                        match.ready_notready(member)
-                    else:
-                        match.player_left(member)
+        for pickup in list(pickups_by_member.get(member.id, ())):
+            if pickup.channel.id == self.id and (args == [] or pickup in targets):
+                changes.append(pickup.name)
+                pickup.players.remove(member)
+                pickup.unmark_user_ready(member)
+                if len(pickup.players) == 0:
+                    active_pickups.remove(pickup)
+            elif allpickups:
+                allpickups = False
+
+        for match in list(matches_by_member.get(member.id, ())):
+            if match.channel.id == self.id and (args == [] or match.pickup in targets):
+                if match.state == "waiting_ready":
+                    match.ready_notready(member)
+                else:
+                    match.player_left(member)
 
         # update topic and warn player
         if changes != []:
@@ -1247,9 +1358,7 @@ class Channel:
     def user_start_pickup(self, member, args, access_level):
         target = None
         if len(args):
-            for pickup in self.pickups:
-                if pickup.name.lower() == args[0]:
-                    target = pickup
+            target = self.get_pickup(args[0])
         elif len(self.pickups) == 1:
             target = self.pickups[0]
 
@@ -1266,13 +1375,15 @@ class Channel:
         else:
             client.reply(self.channel, member, "You have no right for this!")
 
-    def lastgame(self, member, args, index):
+    async def lastgame(self, member, args, index=0):
         # `.last` -- use cache
         if args == [] and index == 0:
+            if self.lastgame_job and not self.lastgame_job.done():
+                await asyncio.wait([asyncio.wrap_future(self.lastgame_job)])
             l = self.lastgame_cache
         # `.last[tttt] [gametype]` -- use db
         else:
-            l = stats3.lastgame(
+            l = await stats3.a_lastgame(
                 self.id, args[0] if args else None, index
             )  # id, ago, gametype, players, alpha_players, beta_players
 
@@ -1301,20 +1412,7 @@ class Channel:
 
         self.newtime = time.time()
         if self.newtime - self.oldtime > int(self.cfg["promotion_delay"]):
-            promotion_role = self.get_value("promotion_role", self.lastgame_pickup)
-            if promotion_role:
-                promotion_role = "<@&{0}>".format(promotion_role)
-            ip = self.get_value("ip", self.lastgame_pickup)
-            password = self.get_value("password", self.lastgame_pickup)
-            submsg = self.get_value("submsg", self.lastgame_pickup)
-            if not submsg:
-                submsg = "%promotion_role% NEED SUB @ **%pickup_name%**, please connect to %ip%."
-
-            submsg = submsg.replace("%pickup_name%", self.lastgame_pickup.name)
-            submsg = submsg.replace("%ip%", ip or "")
-            submsg = submsg.replace("%password%", password or "")
-            submsg = submsg.replace("%promotion_role%", str(promotion_role or ""))
-
+            submsg = self.settings(self.lastgame_pickup).submsg
             promotion_role = self.get_value("promotion_role", self.lastgame_pickup)
             edit_role = False
             if promotion_role:
@@ -1372,10 +1470,7 @@ class Channel:
 
     # next
     def _match_by_player(self, member):
-        for i in active_matches:
-            if member in i.players:
-                return i
-        return None
+        return next(iter(matches_by_member.get(member.id, ())), None)
 
     def pick_player(self, member, args):
         match = self._match_by_player(member)
@@ -1548,7 +1643,7 @@ class Channel:
             client.reply(self.channel, member, "Not enough arguments.")
 
     async def subfor(self, member, args):
-        l = stats3.check_memberid(self.id, member.id)
+        l = await stats3.a_check_memberid(self.id, member.id)
         if l[0] == True:  # if banned
             client.reply(self.channel, member, l[1])
             return
@@ -1604,7 +1699,9 @@ class Channel:
 
             if can_sub:
                 if match.ranked:
-                    match.ranks = stats3.get_ranks(self, [i.id for i in match.players])
+                    match.ranks = await stats3.a_get_ranks(
+                        self, [i.id for i in match.players]
+                    )
                     match.players = list(
                         sorted(
                             match.players, key=lambda p: match.ranks[p.id], reverse=True
@@ -1764,8 +1861,8 @@ class Channel:
         #!reportlose
         else:
             match = None
-            for i in active_matches:
-                if i.pickup.channel.id == self.id and member in i.players:
+            for i in matches_by_member.get(member.id, ()):
+                if i.pickup.channel.id == self.id:
                     match = i
                     if match.state != "waiting_report":
                         client.reply(
@@ -1802,8 +1899,8 @@ class Channel:
     def report_cancel(self, member):
         # !cancel
         match = None
-        for i in active_matches:
-            if i.pickup.channel.id == self.id and member in i.players:
+        for i in matches_by_member.get(member.id, ()):
+            if i.pickup.channel.id == self.id:
                 match = i
                 if match.state != "waiting_report":
                     client.reply(
@@ -1867,8 +1964,8 @@ class Channel:
     def report_draw(self, member):
         # !draw
         match = None
-        for i in active_matches:
-            if i.pickup.channel.id == self.id and member in i.players:
+        for i in matches_by_member.get(member.id, ()):
+            if i.pickup.channel.id == self.id:
                 match = i
                 if match.state != "waiting_report":
                     client.reply(
@@ -1946,18 +2043,21 @@ class Channel:
         else:
             client.notice(self.channel, "There is no active matches right now.")
 
-    def get_leaderboard(self, page):
-        try:
-            page = int(page[0]) - 1
-        except:
-            page = 0
+    async def get_leaderboard(self, member, page):
+        if page == ["me"]:
+            first, data = await stats3.a_get_ladder_around(self.id, member.id)
+        else:
+            try:
+                page = int(page[0]) - 1
+            except:
+                page = 0
+            first = page * 10 + 1
+            data = await stats3.a_get_ladder(self.id, page)  # [rank, nick, wins, loses]
 
-        print(page)
-        data = stats3.get_ladder(self.id, page)  # [rank, nick, wins, loses]
         if len(data):
             l = [
                 "{0:^3}|{1:^11}|{2:^25.25}|{3:^9}| {4}".format(
-                    (page * 10) + (n + 1),
+                    first + n,
                     str(data[n][0]) + utils.rating_to_icon(data[n][0]),
                     data[n][1],
                     int(data[n][2] + data[n][3]),
@@ -1978,11 +2078,15 @@ class Channel:
         else:
             client.notice(self.channel, "Nothing found.")
 
-    def get_rank_details(self, member, args):
+    async def get_rank_details(self, member, args):
         if len(args):
-            details, matches = stats3.get_rank_details(self.id, nick=" ".join(args))
+            details, matches = await stats3.a_get_rank_details(
+                self.id, nick=" ".join(args)
+            )
         else:
-            details, matches = stats3.get_rank_details(self.id, user_id=member.id)
+            details, matches = await stats3.a_get_rank_details(
+                self.id, user_id=member.id
+            )
 
         if details:
             details_str = (
@@ -2022,7 +2126,7 @@ class Channel:
         s += "```"
         client.notice(self.channel, s)
 
-    def undo_ranks(self, member, args, access_level):
+    async def undo_ranks(self, member, args, access_level):
         if access_level < 1:
             client.reply(self.channel, member, "You have no right for this.")
             return
@@ -2031,10 +2135,10 @@ class Channel:
             client.reply(self.channel, member, "You must specify a match id.")
             return
 
-        reply = stats3.undo_ranks(self.id, int(args[0]))
+        reply = await stats3.a_undo_ranks(self.id, int(args[0]))
         client.notice(self.channel, reply)
 
-    def reset_ranks(self, member, access_level):
+    async def reset_ranks(self, member, access_level):
         if access_level < 2:
             client.reply(
                 self.channel,
@@ -2043,7 +2147,7 @@ class Channel:
             )
             return
         else:
-            stats3.reset_ranks(self.id)
+            await stats3.a_reset_ranks(self.id)
             client.reply(self.channel, member, "All rating data has been flushed.")
 
     async def seed_player(self, member, args, access_level):
@@ -2069,7 +2173,7 @@ class Channel:
             client.reply(self.channel, member, "Invalid member highlight specified.")
             return
 
-        stats3.seed_player(self.channel.id, target.id, int(args[1]))
+        await stats3.a_seed_player(self.channel.id, target.id, int(args[1]))
         client.reply(self.channel, member, "done.")
 
     def set_ready(self, member, isready):
@@ -2137,10 +2241,7 @@ class Channel:
             # get pickup to promote
             pickup = False
             if args != []:
-                for i in self.pickups:
-                    if i.name.lower() == args[0]:
-                        pickup = i
-                        break
+                pickup = self.get_pickup(args[0])
                 if not pickup:
                     client.reply(
                         self.channel,
@@ -2180,18 +2281,9 @@ class Channel:
                                 remove_role_players.append(player)
                                 await client.remove_roles(player, role_obj)
 
-                promotemsg = (
-                    self.get_value("promotemsg", pickup)
-                    or "%promotion_role% please !add %pickup_name%, %required_players% players to go!"
+                promotemsg = self.settings(pickup).promotemsg.render(
+                    required_players=players_left
                 )
-                if promotion_role:
-                    promotemsg = promotemsg.replace(
-                        "%promotion_role%", "<@&" + str(promotion_role) + ">"
-                    )
-                else:
-                    promotemsg = promotemsg.replace("%promotion_role%", "")
-                promotemsg = promotemsg.replace("%pickup_name%", pickup.name)
-                promotemsg = promotemsg.replace("%required_players%", str(players_left))
                 await self.channel.send(promotemsg)
                 if edit_role:
                     for player in remove_role_players:
@@ -2237,11 +2329,7 @@ class Channel:
 
         found_roles = []
         for arg in args:
-            pickup = False
-            for i in self.pickups:
-                if i.name.lower() == arg:
-                    pickup = i
-                    break
+            pickup = self.get_pickup(arg)
             if not pickup:
                 client.reply(
                     self.channel,
@@ -2256,7 +2344,9 @@ class Channel:
                     client.reply(
                         self.channel,
                         member,
-                        "Promotion role for '{0}' pickup is not set.".format(i.name),
+                        "Promotion role for '{0}' pickup is not set.".format(
+                            pickup.name
+                        ),
                     )
                     return
 
@@ -2267,7 +2357,7 @@ class Channel:
                 client.reply(
                     self.channel,
                     member,
-                    "Promotion role for '{0}' pickup is not set.".format(i.name),
+                    "Promotion role for '{0}' pickup is not set.".format(pickup.name),
                 )
                 return
 
@@ -2361,10 +2451,10 @@ class Channel:
             )
 
     # next
-    def default_expire(self, member, timelist):
+    async def default_expire(self, member, timelist):
         # print user default expire time
         if timelist == []:
-            timeint = stats3.get_expire(member.id)
+            timeint = await stats3.a_get_expire(member.id)
             timeint = timeint if timeint != None else self.cfg["global_expire"]
             if timeint:
                 client.reply(
@@ -2383,13 +2473,13 @@ class Channel:
 
         # set expire time to afk
         elif timelist[0] == "afk":
-            stats3.set_expire(member.id, 0)
+            await stats3.a_set_expire(member.id, 0)
             client.reply(
                 self.channel, member, "You will be removed on AFK status by default."
             )
 
         elif timelist[0] == "none":
-            stats3.set_expire(member.id, None)
+            await stats3.a_set_expire(member.id, None)
             client.reply(
                 self.channel,
                 member,
@@ -2404,7 +2494,7 @@ class Channel:
                 client.reply(self.channel, member, str(e))
                 return
             if timeint > 0 and timeint <= max_expire_time:
-                stats3.set_expire(member.id, timeint)
+                await stats3.a_set_expire(member.id, timeint)
                 client.reply(
                     self.channel,
                     member,
@@ -2433,14 +2523,14 @@ class Channel:
                 "you will be immune from offline kicks until your next pickup",
             )
 
-    def getstats(self, member, target):
+    async def getstats(self, member, target):
         if target == []:
-            s = stats3.stats(self.id)
+            s = await stats3.a_stats(self.id)
         else:
-            s = stats3.stats(self.id, target[0])
+            s = await stats3.a_stats(self.id, target[0])
         client.notice(self.channel, s)
 
-    def gettop(self, member, arg):
+    async def gettop(self, member, arg):
         pickup = False
         if len(arg):
             if arg[0] not in ["daily", "weekly", "monthly", "yearly"]:
@@ -2466,7 +2556,10 @@ class Channel:
             client.reply(self.channel, member, "Bad argument.")
             return
 
-        top10 = stats3.top(self.id, timegap, pickup)
+        if timegap:
+            # whole minutes, so repeated calls can share a cached result
+            timegap -= timegap % 60
+        top10 = await stats3.a_top(self.id, timegap, pickup)
         if top10:
             if pickup:
                 client.reply(
@@ -2479,9 +2572,9 @@ class Channel:
         else:
             client.reply(self.channel, member, "Nothing found.")
 
-    def getnoadds(self, member, args):
+    async def getnoadds(self, member, args):
         if args == []:
-            l = stats3.noadds(self.id)
+            l = await stats3.a_noadds(self.id)
         else:
             try:
                 index = int(args[0])
@@ -2492,7 +2585,7 @@ class Channel:
                     self.channel, member, "Index argument must be a positive number."
                 )
                 return
-            l = stats3.noadds(self.id, index)
+            l = await stats3.a_noadds(self.id, index)
         if l != []:
             client.notice(self.channel, "\r\n".join(l))
         else:
@@ -2524,7 +2617,10 @@ class Channel:
                 try:
                     name, players = targs[i].split(":")
                     if int(players) > 1:
-                        if name.lower() not in [i.name.lower() for i in self.pickups]:
+                        if (
+                            name.lower() not in self.pickups_by_name
+                            and name.lower() not in [i[0].lower() for i in newpickups]
+                        ):
                             newpickups.append([name, int(players)])
                         else:
                             client.reply(
@@ -2548,7 +2644,7 @@ class Channel:
             if newpickups != []:
                 for i in newpickups:
                     cfg = stats3.new_pickup(self.id, i[0], i[1])
-                    self.pickups.append(Pickup(self, cfg))
+                    self.add_pickup(Pickup(self, cfg))
                 self.replypickups(member)
         else:
             client.reply(self.channel, member, "You have no right for this!")
@@ -2560,7 +2656,7 @@ class Channel:
             ]
             if len(toremove) > 0:
                 for i in toremove:
-                    self.pickups.remove(i)
+                    self.drop_pickup(i)
                     stats3.delete_pickup(self.id, i.name)
                 self.replypickups(member)
             else:
@@ -2573,7 +2669,7 @@ class Channel:
             if len(args) > 1:
                 group_name = args[0]
                 desired_pickup_names = args[1 : len(args)]
-                pickup_names = [i.name.lower() for i in self.pickups]
+                pickup_names = self.pickups_by_name
                 for i in desired_pickup_names:
                     if i not in pickup_names:
                         client.reply(
@@ -2636,30 +2732,27 @@ class Channel:
 
     def show_maps(self, member, args, pick):
         if len(args):
-            pickupname = args[0].lower()
-            for pickup in self.pickups:
-                if pickup.name.lower() == pickupname:
-                    maps = self.get_value("maps", pickup)
-                    if not maps:
-                        client.reply(
+            pickup = self.get_pickup(args[0])
+            if pickup:
+                maps = self.get_value("maps", pickup)
+                if not maps:
+                    client.reply(
+                        self.channel,
+                        member,
+                        "No maps set for **{0}** pickup".format(pickup.name),
+                    )
+                else:
+                    if pick:
+                        client.notice(
                             self.channel,
-                            member,
-                            "No maps set for **{0}** pickup".format(pickup.name),
+                            "**{0}**".format(random.choice(maps.split(",")).strip()),
                         )
                     else:
-                        if pick:
-                            client.notice(
-                                self.channel,
-                                "**{0}**".format(
-                                    random.choice(maps.split(",")).strip()
-                                ),
-                            )
-                        else:
-                            client.notice(
-                                self.channel,
-                                "Maps for [**{0}**]: {1}.".format(pickup.name, maps),
-                            )
-                    return
+                        client.notice(
+                            self.channel,
+                            "Maps for [**{0}**]: {1}.".format(pickup.name, maps),
+                        )
+                return
             client.reply(
                 self.channel, member, "Pickup '{0}' not found!".format(args[0])
             )
@@ -2681,11 +2774,7 @@ class Channel:
     def getip(self, member, args):  # GET IP FOR GAME
         # find desired parameter
         if args != []:
-            pickup = False
-            for i in self.pickups:
-                if i.name.lower() == args[0]:
-                    pickup = i
-                    break
+            pickup = self.get_pickup(args[0])
             if not pickup:
                 client.reply(
                     self.channel,
@@ -2726,7 +2815,7 @@ class Channel:
                         client.reply(self.channel, member, "Phrase has been removed.")
                     else:
                         client.reply(self.channel, member, "Phrase has been set.")
-                    stats3.set_phrase(self.id, target.id, phrase)
+                    await stats3.a_set_phrase(self.id, target.id, phrase)
                 else:
                     client.reply(
                         self.channel, member, "Target must be a Member highlight."
@@ -2775,7 +2864,7 @@ class Channel:
 
             if target:
                 self.remove_player(target, [], "banned")
-                s = stats3.noadd(
+                s = await stats3.a_noadd(
                     self.id, target.id, target.name, duratation, member.name, reason
                 )
                 client.notice(self.channel, s)
@@ -2794,7 +2883,9 @@ class Channel:
             if highlight:
                 target = await self.guild.fetch_member(int(highlight.group(1)))
                 if target:
-                    s = stats3.forgive(self.id, target.id, target.name, member.name)
+                    s = await stats3.a_forgive(
+                        self.id, target.id, target.name, member.name
+                    )
                     client.reply(self.channel, member, s)
                 else:
                     client.reply(
@@ -2819,11 +2910,7 @@ class Channel:
                     active_pickups.remove(pickup)
             if removed != []:
                 for player in removed:
-                    allpickups = True
-                    for pickup in active_pickups:
-                        if player in pickup.players:
-                            allpickups = False
-                            break
+                    allpickups = player.id not in pickups_by_member
                     if allpickups and player.id in scheduler.tasks.keys():
                         scheduler.cancel_task(player.id)
                 if args == []:
@@ -2865,10 +2952,9 @@ class Channel:
                         match = i
             # otherwise match is an active match member is in
             else:
-                for match_ in list(active_matches):
-                    if member.id in [player.id for player in match_.players]:
-                        if match_.channel.id == self.id:
-                            match = match_
+                for match_ in matches_by_member.get(member.id, ()):
+                    if match_.channel.id == self.id:
+                        match = match_
             # if match is successfully found, reset picks
             if match:
                 if match.state == "teams_picking":
@@ -2902,37 +2988,42 @@ class Channel:
         else:
             client.reply(self.channel, member, "You have no right for this!")
 
-    def reset_stats(self, member, access_level):
+    async def reset_stats(self, member, access_level):
         if access_level > 1:
-            stats3.reset_stats(self.id)
+            await stats3.a_reset_stats(self.id)
             client.reply(self.channel, member, "Done.")
         else:
             client.reply(self.channel, member, "You have no right for this!")
 
     def help_answer(self, member, args):
         if args != []:
-            answer = None
-            for p in self.pickups:
-                if args[0] == p.name.lower():
-                    answer = self.get_value("help_answer", p)
+            pickup = self.get_pickup(args[0])
+            answer = self.get_value("help_answer", pickup) if pickup else None
         else:
             answer = self.cfg["help_answer"]
         if answer:
             client.notice(self.channel, answer)
 
+    def settings(self, pickup):
+        if pickup.settings is None:
+            pickup.settings = EffectiveConfig(self, pickup)
+        return pickup.settings
+
     def get_value(self, variable, pickup):
-        if pickup.cfg[variable] != None:
-            return pickup.cfg[variable]
-        else:
-            return self.cfg[variable]
+        return self.settings(pickup).values[variable]
 
     def update_channel_config(self, variable, value):
         self.cfg[variable] = value
+        for pickup in self.pickups:
+            pickup.settings = None
         stats3.update_channel_config(self.id, variable, value)
+        scheduler.wakeup()  # match deadlines may have moved
 
     def update_pickup_config(self, pickup, variable, value):
         pickup.cfg[variable] = value
+        pickup.settings = None
         stats3.update_pickup_config(self.id, pickup.name, variable, value)
+        scheduler.wakeup()
 
     def show_config(self, member, args):
         if len(args):
@@ -2958,37 +3049,35 @@ class Channel:
     def show_pickup_config(self, member, args):
         if len(args):
             args[0] = args[0].lower()
-            for pickup in self.pickups:
-                if pickup.name.lower() == args[0]:
-                    if len(args) > 1:
-                        if args[1] in pickup.cfg.keys():
-                            client.private_reply(
-                                member,
-                                "[{0}] {1}: '{2}'".format(
-                                    pickup.name, args[1], str(pickup.cfg[args[1]])
-                                ),
-                            )
-                            return
-                        else:
-                            client.reply(
-                                self.channel,
-                                member,
-                                "No such variable '{0}'.".format(args[1]),
-                            )
-                            return
-                    else:
+            pickup = self.get_pickup(args[0])
+            if pickup:
+                if len(args) > 1:
+                    if args[1] in pickup.cfg.keys():
                         client.private_reply(
                             member,
-                            "\r\n".join(
-                                [
-                                    "[{0}] {1}: '{2}'".format(
-                                        pickup.name, key, str(value)
-                                    )
-                                    for (key, value) in pickup.cfg.items()
-                                ]
+                            "[{0}] {1}: '{2}'".format(
+                                pickup.name, args[1], str(pickup.cfg[args[1]])
                             ),
                         )
                         return
+                    else:
+                        client.reply(
+                            self.channel,
+                            member,
+                            "No such variable '{0}'.".format(args[1]),
+                        )
+                        return
+                else:
+                    client.private_reply(
+                        member,
+                        "\r\n".join(
+                            [
+                                "[{0}] {1}: '{2}'".format(pickup.name, key, str(value))
+                                for (key, value) in pickup.cfg.items()
+                            ]
+                        ),
+                    )
+                    return
             client.reply(
                 self.channel, member, "Pickup '{0}' not found.".format(args[0])
             )
@@ -3610,9 +3699,9 @@ class Channel:
             args.remove(i)
             if i != "":
                 i = i.strip().lower()
-                f = list(filter(lambda x: x.name.lower() == i, self.pickups))
-                if len(f):
-                    pickups.append(f[0])
+                pickup = self.get_pickup(i)
+                if pickup:
+                    pickups.append(pickup)
                 else:
                     variable = i.lower()
                     break
@@ -4225,32 +4314,203 @@ class Channel:
             )
 
     def find_pickip(self, pickup_name):
-        # should have used a dict for pickups, because this is obviously going to take O(n)
-        for p in self.pickups:
-            if p.channel.id == self.channel.id and p.name == pickup_name:
-                return p
-        raise ValueError("there is no pickup with this name")
+        pickup = self.get_pickup(pickup_name)
+        if pickup is None:
+            raise ValueError("there is no pickup with this name")
+        return pickup
+
+
+Command = namedtuple(
+    "Command", ["handler", "is_async", "access", "ranked", "min_args", "max_args"]
+)
+Call = namedtuple("Call", ["msg", "member", "words", "lower", "access_level"])
+commands = {}  # {name or alias: Command}, see Channel.processmsg
+add_pattern = re.compile(r"\+..")
+remove_pattern = re.compile(r"-..")
+last_pattern = re.compile(r"last(t*)")  # !last, !lastt, ... and !lastgame too
+
+
+def command(
+    *names, is_async=False, access=0, ranked=False, min_args=0, max_args=float("inf")
+):
+    """Register handler(channel, call) under `names`.
+
+    `access` is the level the handler checks itself, the member's level is
+    only looked up for commands that need one. `ranked` commands only work
+    on ranked channels and messages with a word count outside min_args and
+    max_args are ignored.
+    """
+
+    def register(handler):
+        for name in names:
+            commands[name] = Command(
+                handler, is_async, access, ranked, min_args, max_args
+            )
+        return handler
+
+    return register
+
+
+async def liast(channel, call):
+    channel.who(call.member, call.lower)
+    await channel.lastgame(call.member, call.words)
+
+
+command("add", "j", is_async=True)(lambda ch, c: ch.add_player(c.member, c.lower))
+command("remove", "l")(lambda ch, c: ch.remove_player(c.member, c.lower))
+command("lva")(lambda ch, c: ch.remove_player(c.member, []))
+command("expire")(lambda ch, c: ch.expire(c.member, c.lower))
+command("default_expire", is_async=True)(
+    lambda ch, c: ch.default_expire(c.member, c.lower)
+)
+command("allowoffline", "ao")(lambda ch, c: ch.switch_allowoffline(c.member))
+command("remove_player", is_async=True, access=1, min_args=1, max_args=1)(
+    lambda ch, c: ch.remove_players(c.member, c.lower[0], c.access_level)
+)
+command("who", "list", "ls")(lambda ch, c: ch.who(c.member, c.lower))
+command("start", access=1)(
+    lambda ch, c: ch.user_start_pickup(c.member, c.lower, c.access_level)
+)
+command("pickups", "pugs")(lambda ch, c: ch.replypickups(c.member))
+command("promote", "pro", "spam", is_async=True)(
+    lambda ch, c: ch.promote_pickup(c.member, c.lower[:1])
+)
+command("subscribe", is_async=True)(
+    lambda ch, c: ch.subscribe(c.member, c.lower, False)
+)
+command("unsubscribe", is_async=True)(
+    lambda ch, c: ch.subscribe(c.member, c.lower, True)
+)
+command("liast", is_async=True)(liast)
+command("sub", is_async=True)(lambda ch, c: ch.sub_request(c.member))
+command("cointoss", "ct")(lambda ch, c: ch.cointoss(c.member, c.lower[:1]))
+command("p", "pick")(lambda ch, c: ch.pick_player(c.member, c.lower))
+command("put", is_async=True, access=1)(
+    lambda ch, c: ch.put_player(c.member, c.lower[:2], c.access_level)
+)
+command("capfor")(
+    lambda ch, c: ch.cfg["capfor_enabled"] == 1 and ch.capfor(c.member, c.lower[:1])
+)
+command("subfor", is_async=True)(lambda ch, c: ch.subfor(c.member, c.lower[:1]))
+command("teams", "turn")(lambda ch, c: ch.print_teams(c.member))
+command("matches")(lambda ch, c: ch.get_matches())
+command("cancel_match", "cancel", access=1)(
+    lambda ch, c: ch.cancel_match(c.member, c.lower[:1], c.access_level)
+)
+command("reportwin", "rw", access=1)(
+    lambda ch, c: ch.report_match(
+        c.member, args=c.lower[:2], access_level=c.access_level
+    )
+)
+command("reportlose", "rl")(lambda ch, c: ch.report_match(c.member))
+command("reportdraw", "draw", "rd")(lambda ch, c: ch.report_draw(c.member))
+command("reportcancel", "rc")(lambda ch, c: ch.report_cancel(c.member))
+command("ready", "r")(lambda ch, c: ch.set_ready(c.member, True))
+command("notready", "nr")(lambda ch, c: ch.set_ready(c.member, False))
+command("stats", is_async=True)(
+    lambda ch, c: ch.getstats(c.member, c.msg.content.split(" ", 1)[1:])
+)
+command("top", is_async=True)(lambda ch, c: ch.gettop(c.member, c.words))
+command("set_ao_for_all", access=2)(
+    lambda ch, c: ch.set_ao_for_all(c.member, c.words, c.access_level)
+)
+command("add_pickups", access=2)(
+    lambda ch, c: ch.add_pickups(c.member, c.words, c.access_level)
+)
+command("remove_pickups", access=2)(
+    lambda ch, c: ch.remove_pickups(c.member, c.lower, c.access_level)
+)
+command("add_pickup_group", access=2)(
+    lambda ch, c: ch.add_pickup_group(c.member, c.lower, c.access_level)
+)
+command("remove_pickup_group", access=2)(
+    lambda ch, c: ch.remove_pickup_group(c.member, c.lower, c.access_level)
+)
+command("pickup_groups")(lambda ch, c: ch.show_pickup_groups())
+command("maps")(lambda ch, c: ch.show_maps(c.member, c.lower, False))
+command("map")(lambda ch, c: ch.show_maps(c.member, c.lower, True))
+command("ip")(lambda ch, c: ch.getip(c.member, c.lower[:1]))
+command("noadd", is_async=True, access=1, min_args=1)(
+    lambda ch, c: ch.noadd(c.member, c.words, c.access_level)
+)
+command("forgive", is_async=True, access=1, min_args=1, max_args=1)(
+    lambda ch, c: ch.forgive(c.member, c.words[0], c.access_level)
+)
+command("noadds", is_async=True)(lambda ch, c: ch.getnoadds(c.member, c.words[:1]))
+command("reset", access=1)(
+    lambda ch, c: ch.reset_players(c.member, c.lower, c.access_level)
+)
+command("reset_picks", access=1)(
+    lambda ch, c: ch.reset_picks(c.member, c.lower[:1], c.access_level)
+)
+command("reset_stats", is_async=True, access=2)(
+    lambda ch, c: ch.reset_stats(c.member, c.access_level)
+)
+command("phrase", is_async=True, access=1)(
+    lambda ch, c: ch.set_phrase(c.member, c.words, c.access_level)
+)
+command("commands")(
+    lambda ch, c: client.reply(ch.channel, c.member, config.cfg.COMMANDS_LINK)
+)
+command("cfg")(lambda ch, c: ch.show_config(c.member, c.words[:1]))
+command("pickup_cfg")(lambda ch, c: ch.show_pickup_config(c.member, c.words[:2]))
+command("set_default", access=2, min_args=2)(
+    lambda ch, c: ch.configure_default(c.member, c.words, c.access_level)
+)
+command("set_pickups", access=2, min_args=3)(
+    lambda ch, c: ch.configure_pickups(c.member, c.words, c.access_level)
+)
+command("help")(lambda ch, c: ch.help_answer(c.member, c.lower))
+command("leaderboard", "lb", is_async=True, ranked=True)(
+    lambda ch, c: ch.get_leaderboard(c.member, c.lower[:1])
+)
+command("rank", is_async=True, ranked=True)(
+    lambda ch, c: ch.get_rank_details(c.member, c.lower)
+)
+command("ranks_table", ranked=True)(lambda ch, c: ch.show_ranks_table())
+command("undo_ranks", is_async=True, ranked=True, access=1)(
+    lambda ch, c: ch.undo_ranks(c.member, c.lower[:1], c.access_level)
+)
+command("reset_ranks", is_async=True, ranked=True, access=2)(
+    lambda ch, c: ch.reset_ranks(c.member, c.access_level)
+)
+command("seed", is_async=True, ranked=True, access=1)(
+    lambda ch, c: ch.seed_player(c.member, c.lower, c.access_level)
+)
+
+
+def add_channel(channel):
+    channels.append(channel)
+    channels_by_id[channel.id] = channel
 
 
 def delete_channel(channel):
     for match in list(active_matches):
         if match.pickup.channel.id == channel.id:
             active_matches.remove(match)
+            match.players.detach()
+    for pickup in channel.pickups:
+        if pickup in active_pickups:
+            active_pickups.remove(pickup)
+        pickup.players = []
 
     channels.remove(channel)
+    channels_by_id.pop(channel.id, None)
     stats3.delete_channel(channel.id)
 
 
 def member_left(member):  # when a user left a guild
     affected_pickups = [
         p
-        for p in active_pickups
-        if p.channel.guild.id == member.guild.id and member in p.players
+        for p in pickups_by_member.get(member.id, ())
+        if p.channel.guild.id == member.guild.id
     ]
 
     if len(affected_pickups):
         for p in affected_pickups:
             p.players.remove(member)
+            if len(p.players) == 0:
+                active_pickups.remove(p)
 
         for i in set((p.channel for p in affected_pickups)):
             i.update_topic()
@@ -4272,18 +4532,16 @@ def global_remove(member, reason):
     # removes player from pickups on all channels
     affected_channels = []
 
-    if reason == "scheduler":
-        affected_pickups = list(active_pickups)
-    else:
-        affected_pickups = [p for p in active_pickups if not p.cfg["allow_offline"]]
+    affected_pickups = list(pickups_by_member.get(member.id, ()))
+    if reason != "scheduler":
+        affected_pickups = [p for p in affected_pickups if not p.cfg["allow_offline"]]
 
     for p in affected_pickups:
-        if member.id in [i.id for i in p.players]:
-            p.players.remove(member)
-            if len(p.players) == 0:
-                active_pickups.remove(p)
-            if p.channel not in affected_channels:
-                affected_channels.append(p.channel)
+        p.players.remove(member)
+        if len(p.players) == 0:
+            active_pickups.remove(p)
+        if p.channel not in affected_channels:
+            affected_channels.append(p.channel)
 
     for i in affected_channels:
         i.update_topic()
@@ -4302,5 +4560,9 @@ def global_remove(member, reason):
 
 
 def run(frametime):
-    for match in active_matches:
+    for match in list(active_matches):
         match.think(frametime)
+
+
+def next_deadline():
+    return min((match.deadline for match in active_matches), default=None)
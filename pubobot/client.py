@@ -2,18 +2,36 @@
 # encoding: utf-8
 import discord
 import traceback
+import asyncio
 import time
-from . import console, config, bot, stats3
+from collections import deque
+from . import console, config, bot, scheduler, stats3, utils
 
 
 ready = False
-send_queue = []
+send_queues = {}  # {destination id: deque of [func, kwargs]}
+drainers = {}  # {destination id: task sending its queue}
+limiters = {}  # {destination id: RateLimiter}
+send_slots = None  # bounds the number of requests in flight
+send_event = None
+sender_task = None
+held_notices = {}  # {channel id: [channel, [notices]]} waiting to be merged
+held_edits = {}  # {message id: [message, content]} waiting for EDIT_DEBOUNCE
+pickup_switches = ("!enable_pickups", "!disable_pickups")  # work in any channel
 
 
 def init():
-    global ready, send_queue
+    global ready, send_queues, drainers, limiters, send_slots, send_event, sender_task
+    global held_notices, held_edits
     ready = False
-    send_queue = []
+    send_queues = {}
+    drainers = {}
+    limiters = {}
+    send_slots = asyncio.Semaphore(config.cfg.SEND_CONCURRENCY)
+    send_event = None
+    sender_task = None
+    held_notices = {}
+    held_edits = {}
 
 
 def process_connection():
@@ -33,7 +51,7 @@ def process_connection():
             # todo: delete channel
         else:
             chan = bot.Channel(discord_channel, cfg)
-            bot.channels.append(chan)
+            bot.add_channel(chan)
             console.display(
                 "SYSTEM| '{0}>{1}#' channel init successfull".format(
                     chan.cfg["server_name"], chan.cfg["channel_name"]
@@ -46,21 +64,77 @@ def get_empty_servers():
     for serv in c.guilds:
         n = 0
         for chan in serv.channels:
-            if chan.id in [i.cfg["channel_id"] for i in bot.channels]:
+            if chan.id in bot.channels_by_id:
                 n = 1
                 break
         if not n:
             console.display("server name: {0}, id: {1}".format(serv.name, serv.id))
 
 
-async def send():  # send messages in queue
-    global send_queue
-    if len(send_queue):
-        for func, kwargs in send_queue:
-            callback = kwargs.pop("callback", None)
+class RateLimiter:
+    """Token bucket allowing `rate` requests per `period` seconds, 0 disables it."""
+
+    def __init__(self, rate, period):
+        self.rate = rate
+        self.period = period
+        self.tokens = rate
+        self.stamp = time.monotonic()
 
+    def refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(
+                self.rate, self.tokens + (now - self.stamp) * self.rate / self.period
+            )
+        self.stamp = now
+
+    def full(self):
+        self.refill()
+        return self.tokens >= self.rate
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        self.refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
+            self.refill()
+        self.tokens -= 1
+
+    def backoff(self):
+        # discord told us we are over the limit, wait a whole period
+        self.refill()
+        self.tokens = 1 - self.rate
+
+
+async def deliver(limiter, func, kwargs):
+    for attempt in range(2):
+        await limiter.acquire()
+        try:
+            async with send_slots:
+                return await func(**kwargs)
+        except discord.HTTPException as e:
+            if e.status != 429 or attempt:
+                raise
+            console.display("SEND| rate limited, backing off ({0})".format(str(func)))
+            limiter.backoff()
+            if not limiter.rate:
+                await asyncio.sleep(config.cfg.SEND_RATE_PERIOD)
+
+
+async def drain(destination):  # send messages queued for one channel in order
+    pending = send_queues[destination]
+    limiter = limiters.get(destination)
+    if limiter is None:
+        limiter = RateLimiter(config.cfg.SEND_RATE, config.cfg.SEND_RATE_PERIOD)
+        limiters[destination] = limiter
+
+    try:
+        while pending:
+            func, kwargs = pending.popleft()
             try:
-                result = await func(**kwargs)
+                callback = kwargs.pop("callback", None)
+                result = await deliver(limiter, func, kwargs)
             except Exception as e:
                 console.display(
                     "ERROR| could not send data ({0}). {1}".format(str(func), str(e))
@@ -72,8 +146,65 @@ async def send():  # send messages in queue
                     callback(result)
                 except Exception as e:
                     console.display(f"ERROR| callback {callback!r} raised {e}")
+    finally:
+        drainers.pop(destination, None)
+        if not pending:
+            send_queues.pop(destination, None)
+        if limiter.full():
+            limiters.pop(destination, None)
+
+
+def start_drainers():
+    for destination, pending in list(send_queues.items()):
+        if pending and destination not in drainers:
+            drainers[destination] = asyncio.ensure_future(drain(destination))
+
+
+async def send():  # send messages in queue
+    while True:
+        start_drainers()
+        if not drainers:
+            return
+        await asyncio.gather(*drainers.values())
+
+
+def queue_depth(destination=None):
+    """Number of messages waiting for `destination`, or for all of them."""
+    if destination is None:
+        return sum(len(pending) for pending in send_queues.values())
+    pending = send_queues.get(destination)
+    return len(pending) if pending else 0
+
+
+def start_sender():
+    # keep a reference, the loop only holds a weak one to running tasks
+    global sender_task
+    sender_task = asyncio.ensure_future(sender())
+
+
+async def sender():  # deliver messages as soon as they are queued
+    global send_event
+    send_event = asyncio.Event()
+    while True:
+        await send_event.wait()
+        send_event.clear()
+        try:
+            start_drainers()
+        except Exception as e:
+            console.display("ERROR| sender failed: {0}".format(str(e)))
 
-        send_queue = []
+
+def queue_send(func, kwargs, destination=None):
+    # messages to the same destination keep their order, others go in parallel
+    # unless concurrency is 1, then everything shares one queue in order
+    if config.cfg.SEND_CONCURRENCY <= 1:
+        destination = None
+    pending = send_queues.get(destination)
+    if pending is None:
+        pending = send_queues[destination] = deque()
+    pending.append([func, kwargs])
+    if send_event is not None:
+        send_event.set()
 
 
 async def close():  # on quit
@@ -121,32 +252,98 @@ async def add_roles(member, *roles):
 
 def notice(channel, msg, callback=None):
     console.display("SEND| {0}> {1}".format(channel.name, msg))
-    send_queue.append([channel.send, {"content": msg, "callback": callback}])
+    if callback is None and config.cfg.COALESCE_NOTICES:
+        hold_notice(channel, msg)
+    else:
+        flush_notices(channel.id)
+        queue_send(channel.send, {"content": msg, "callback": callback}, channel.id)
+
+
+def hold_notice(channel, msg):
+    # merge plain notices sent to a channel within COALESCE_WINDOW seconds
+    held = held_notices.get(channel.id)
+    if held is None:
+        held_notices[channel.id] = [channel, [msg]]
+        scheduler.add_task(
+            "notices#{0}".format(channel.id),
+            config.cfg.COALESCE_WINDOW,
+            flush_notices,
+            (channel.id,),
+        )
+    else:
+        held[1].append(msg)
+
+
+def flush_notices(channel_id):
+    held = held_notices.pop(channel_id, None)
+    if held is None:
+        return
+
+    name = "notices#{0}".format(channel_id)
+    if name in scheduler.tasks:
+        scheduler.cancel_task(name)
+
+    channel, notices = held
+    for text in utils.split_large_message("\n".join(notices)):
+        queue_send(channel.send, {"content": text}, channel.id)
 
 
 def reply(channel, member, msg):
     console.display(
         "SEND| {0}> {1}, {2}".format(channel.name, member.nick or member.name, msg)
     )
-    send_queue.append([channel.send, {"content": "<@{0}>, {1}".format(member.id, msg)}])
+    flush_notices(channel.id)
+    queue_send(
+        channel.send, {"content": "<@{0}>, {1}".format(member.id, msg)}, channel.id
+    )
 
 
 def private_reply(member, msg):
     console.display("SEND_PM| {0}> {1}".format(member.name, msg))
-    send_queue.append([member.send, {"content": msg}])
+    queue_send(member.send, {"content": msg}, member.id)
 
 
 def delete_message(msg):
-    send_queue.append([msg.delete, {}])
+    drop_edit(msg.id)  # no point editing it first
+    queue_send(msg.delete, {}, msg.channel.id)
 
 
 def edit_message(msg, new_content):
     console.display("EDIT| {0}> {1}".format(msg.channel.name, new_content))
-    send_queue.append([msg.edit, {"content": new_content}])
+    if not config.cfg.EDIT_DEBOUNCE:
+        queue_send(msg.edit, {"content": new_content}, msg.channel.id)
+        return
+
+    # only the latest content of a burst of edits gets sent
+    held = held_edits.get(msg.id)
+    if held is None:
+        held_edits[msg.id] = [msg, new_content]
+        scheduler.add_task(
+            "edit#{0}".format(msg.id),
+            config.cfg.EDIT_DEBOUNCE,
+            flush_edit,
+            (msg.id,),
+        )
+    else:
+        held[1] = new_content
+
+
+def drop_edit(msg_id):
+    name = "edit#{0}".format(msg_id)
+    if name in scheduler.tasks:
+        scheduler.cancel_task(name)
+    return held_edits.pop(msg_id, None)
+
+
+def flush_edit(msg_id):
+    held = drop_edit(msg_id)
+    if held is not None:
+        msg, content = held
+        queue_send(msg.edit, {"content": content}, msg.channel.id)
 
 
 def add_reaction(msg, emoji):
-    send_queue.append([msg.add_reaction, {"emoji": emoji}])
+    queue_send(msg.add_reaction, {"emoji": emoji}, msg.channel.id)
 
 
 def get_member_by_nick(channel, nick):
@@ -186,22 +383,26 @@ def create_client(loop=None):
     async def on_message(message):
         # if message.author.bot:
         # return
-        if (
-            isinstance(message.channel, discord.abc.PrivateChannel)
-            and message.author.id != c.user.id
-        ):
-            console.display(
-                "PRIVATE| {0}>{1}>{2}: {3}".format(
-                    message.guild,
-                    message.channel,
-                    message.author.display_name,
-                    message.content,
-                )
-            )
-            private_reply(message.author, config.cfg.HELPINFO)
-        elif message.content == "!enable_pickups":
+        channel = bot.channels_by_id.get(message.channel.id)
+        if channel is None:
+            if isinstance(message.channel, discord.abc.PrivateChannel):
+                if message.author.id != c.user.id:
+                    console.display(
+                        "PRIVATE| {0}>{1}>{2}: {3}".format(
+                            message.guild,
+                            message.channel,
+                            message.author.display_name,
+                            message.content,
+                        )
+                    )
+                    private_reply(message.author, config.cfg.HELPINFO)
+                return
+            if message.content not in pickup_switches:
+                return  # most of what the bot sees is outside pickup channels
+
+        if message.content == "!enable_pickups":
             if message.channel.permissions_for(message.author).manage_channels:
-                if message.channel.id not in [x.id for x in bot.channels]:
+                if channel is None:
                     newcfg = stats3.new_channel(
                         message.guild.id,
                         message.guild.name,
@@ -209,7 +410,7 @@ def create_client(loop=None):
                         message.channel.name,
                         message.author.id,
                     )
-                    bot.channels.append(bot.Channel(message.channel, newcfg))
+                    bot.add_channel(bot.Channel(message.channel, newcfg))
                     reply(
                         message.channel, message.author, config.cfg.FIRST_INIT_MESSAGE
                     )
@@ -227,20 +428,19 @@ def create_client(loop=None):
                 )
         elif message.content == "!disable_pickups":
             if message.channel.permissions_for(message.author).manage_channels:
-                for chan in bot.channels:
-                    if chan.id == message.channel.id:
-                        bot.delete_channel(chan)
-                        reply(
-                            message.channel,
-                            message.author,
-                            "pickups on this channel have been disabled.",
-                        )
-                        return
-                reply(
-                    message.channel,
-                    message.author,
-                    "pickups on this channel has not been set up yet!",
-                )
+                if channel is not None:
+                    bot.delete_channel(channel)
+                    reply(
+                        message.channel,
+                        message.author,
+                        "pickups on this channel have been disabled.",
+                    )
+                else:
+                    reply(
+                        message.channel,
+                        message.author,
+                        "pickups on this channel has not been set up yet!",
+                    )
             else:
                 reply(
                     message.channel,
@@ -248,16 +448,14 @@ def create_client(loop=None):
                     "You must have permission to manage channels to disable pickups.",
                 )
         elif message.content != "":
-            for channel in bot.channels:
-                if message.channel.id == channel.id:
-                    try:
-                        await channel.processmsg(message)
-                    except:
-                        console.display(
-                            "ERROR| Error processing message: {0}".format(
-                                traceback.format_exc()
-                            )
-                        )
+            try:
+                await channel.processmsg(message)
+            except:
+                console.display(
+                    "ERROR| Error processing message: {0}".format(
+                        traceback.format_exc()
+                    )
+                )
 
     @c.event
     async def on_member_update(before, after):
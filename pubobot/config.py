@@ -14,6 +14,27 @@ class Config:
     COMMANDS_LINK = "https://link-to-commands"
     HELPINFO = "A helpful message"
     FIRST_INIT_MESSAGE = "Pickups enabled"
+    SEND_CONCURRENCY = 8  # requests to discord in flight at once
+    SEND_RATE = 5  # messages per channel every SEND_RATE_PERIOD seconds, 0 = off
+    SEND_RATE_PERIOD = 5.0
+    COALESCE_NOTICES = 0  # merge bursts of notices to a channel into one message
+    COALESCE_WINDOW = 0.5
+    DB_JOURNAL_MODE = "WAL"
+    DB_SYNCHRONOUS = "NORMAL"  # with WAL only checkpoints wait for fsync
+    DB_MMAP_SIZE = 64 * 1024 * 1024  # bytes
+    DB_CACHE_SIZE = -16000  # pages, or KiB if negative
+    DB_TEMP_STORE = "MEMORY"
+    DB_CHECKPOINT_INTERVAL = 300  # seconds between WAL checkpoints, 0 = off
+    DB_BATCH_SIZE = 0  # group this many writes into one commit, 0 = commit each
+    DB_FLUSH_INTERVAL = 1.0  # seconds a grouped write may wait for its commit
+    RANK_CACHE_SIZE = 100000  # player ratings kept in memory over all channels
+    RESULT_CACHE_SIZE = 1000  # !stats, !top, !lb, !rank and !noadds replies kept
+    RESULT_CACHE_TTL = 60  # seconds a kept reply may be reused, 0 = off
+    BALANCE_TIME_BUDGET = 0.1  # seconds to search for the best auto teams
+    BALANCE_SPREAD_WEIGHT = 0.5  # rating points per point of team deviation gap
+    BALANCE_CAPTAIN_WEIGHT = 1000  # rating points per team without a captain
+    BALANCE_REPEAT_WEIGHT = 25  # rating points per pair of repeated teammates
+    EDIT_DEBOUNCE = 0.25  # send only the last of the edits to a message within, 0 = off
 
 
 cfg = Config()
@@ -48,6 +69,27 @@ def init(config_file="config.cfg"):
         ("PUBOBOT_COMMANDS_LINK", str, "COMMANDS_LINK"),
         ("PUBOBOT_HELPINFO", str, "HELPINFO"),
         ("PUBOBOT_FIRST_INIT_MESSAGE", str, "FIRST_INIT_MESSAGE"),
+        ("PUBOBOT_SEND_CONCURRENCY", int, "SEND_CONCURRENCY"),
+        ("PUBOBOT_SEND_RATE", int, "SEND_RATE"),
+        ("PUBOBOT_SEND_RATE_PERIOD", float, "SEND_RATE_PERIOD"),
+        ("PUBOBOT_COALESCE_NOTICES", int, "COALESCE_NOTICES"),
+        ("PUBOBOT_COALESCE_WINDOW", float, "COALESCE_WINDOW"),
+        ("PUBOBOT_EDIT_DEBOUNCE", float, "EDIT_DEBOUNCE"),
+        ("PUBOBOT_BALANCE_TIME_BUDGET", float, "BALANCE_TIME_BUDGET"),
+        ("PUBOBOT_BALANCE_SPREAD_WEIGHT", float, "BALANCE_SPREAD_WEIGHT"),
+        ("PUBOBOT_BALANCE_CAPTAIN_WEIGHT", float, "BALANCE_CAPTAIN_WEIGHT"),
+        ("PUBOBOT_BALANCE_REPEAT_WEIGHT", float, "BALANCE_REPEAT_WEIGHT"),
+        ("PUBOBOT_DB_JOURNAL_MODE", str, "DB_JOURNAL_MODE"),
+        ("PUBOBOT_DB_SYNCHRONOUS", str, "DB_SYNCHRONOUS"),
+        ("PUBOBOT_DB_MMAP_SIZE", int, "DB_MMAP_SIZE"),
+        ("PUBOBOT_DB_CACHE_SIZE", int, "DB_CACHE_SIZE"),
+        ("PUBOBOT_DB_TEMP_STORE", str, "DB_TEMP_STORE"),
+        ("PUBOBOT_DB_CHECKPOINT_INTERVAL", int, "DB_CHECKPOINT_INTERVAL"),
+        ("PUBOBOT_DB_BATCH_SIZE", int, "DB_BATCH_SIZE"),
+        ("PUBOBOT_DB_FLUSH_INTERVAL", float, "DB_FLUSH_INTERVAL"),
+        ("PUBOBOT_RANK_CACHE_SIZE", int, "RANK_CACHE_SIZE"),
+        ("PUBOBOT_RESULT_CACHE_SIZE", int, "RESULT_CACHE_SIZE"),
+        ("PUBOBOT_RESULT_CACHE_TTL", int, "RESULT_CACHE_TTL"),
     ]
 
     for var, attr_type, attr in env_vars:
@@ -63,12 +105,22 @@ def init(config_file="config.cfg"):
         os._exit(0)
 
 
+def db_pragmas():
+    return {
+        "journal_mode": cfg.DB_JOURNAL_MODE,
+        "synchronous": cfg.DB_SYNCHRONOUS,
+        "mmap_size": cfg.DB_MMAP_SIZE,
+        "cache_size": cfg.DB_CACHE_SIZE,
+        "temp_store": cfg.DB_TEMP_STORE,
+    }
+
+
 def new_channel(channel, admin):
     path = "channels/" + channel.id
     shutil.copytree("channels/default", path)
     c = bot.Channel(channel)
     c.update_config("ADMINID", admin.id)
-    bot.channels.append(c)
+    bot.add_channel(c)
     console.display(
         "SYSTEM| CREATED NEW PICKUP CHANNEL: {0}>{1}".format(
             channel.server.name, channel.name
@@ -80,6 +132,7 @@ def delete_channel(channelid):
     for i in bot.channels:
         if i.id == channelid:
             bot.channels.remove(i)
+            bot.channels_by_id.pop(i.id, None)
             i.stats.close()
 
     oldpath = "channels/" + channelid
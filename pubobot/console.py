@@ -2,7 +2,7 @@
 # encoding: utf-8
 
 from threading import Thread
-from multiprocessing import Queue
+from queue import Queue, Empty
 import sys
 import os
 import datetime
@@ -10,7 +10,7 @@ import time
 
 import readline
 
-from . import bot, client, config, stats3
+from . import bot, client, config, scheduler, stats3
 
 
 class ConsoleCompleter(object):  # Custom completer
@@ -31,6 +31,9 @@ class ConsoleCompleter(object):  # Custom completer
                 "delete_unused_channels",
                 "echo_empty_servers",
                 "leave_server",
+                "replay_ranks",
+                "rebuild_stats",
+                "check_stats",
             ]
         )
         self.modules = sorted(["bot", "client", "config"])
@@ -102,87 +105,134 @@ def userinput():
     while 1:
         inputcmd = input()
         userinput_queue.put(inputcmd)
+        scheduler.wakeup()
 
 
 def run():
-    try:
-        cmd = userinput_queue.get(False)
-        display("CONSOLE| /" + cmd)
+    # handle every command typed since the last wakeup
+    while True:
         try:
-            l = cmd.split(" ", 1)
-            if l[0] == "help":
-                display("CONSOLE| " + help)
-            elif l[0] == "notice":
-                for i in bot.channels:
-                    client.notice(i.channel, l[1])
-            elif l[0] == "say":
-                channel, text = l[1].split("#", 1)
-                for i in bot.channels:
-                    if i.name == channel:
-                        client.notice(i.channel, text)
-                        return
-            elif l[0] == "disable_pickups":
-                channel = rstrip("#")
-                for i in bot.channels:
-                    if i.name == channel:
-                        config.delete_channel(i.channel)
-            elif l[0] == "status":
-                display(
-                    "CONSOLE| Total pickup channels: {0}. {1} messages to send waiting in queue.".format(
-                        len(bot.channels), len(client.send_queue)
-                    )
+            cmd = userinput_queue.get(False)
+        except Empty:
+            return
+        execute(cmd)
+
+
+def execute(cmd):
+    display("CONSOLE| /" + cmd)
+    try:
+        l = cmd.split(" ", 1)
+        if l[0] == "help":
+            display("CONSOLE| " + help)
+        elif l[0] == "notice":
+            for i in bot.channels:
+                client.notice(i.channel, l[1])
+        elif l[0] == "say":
+            channel, text = l[1].split("#", 1)
+            for i in bot.channels:
+                if i.name == channel:
+                    client.notice(i.channel, text)
+                    return
+        elif l[0] == "disable_pickups":
+            channel = rstrip("#")
+            for i in bot.channels:
+                if i.name == channel:
+                    config.delete_channel(i.channel)
+        elif l[0] == "status":
+            display(
+                "CONSOLE| Total pickup channels: {0}. {1} messages to send waiting in {2} queues.".format(
+                    len(bot.channels), client.queue_depth(), len(client.send_queues)
+                )
+            )
+            display(
+                "CONSOLE| Database: {writes} writes in {commits} commits ({durable_commits} durable), {0} waiting.".format(
+                    stats3.pending_writes, **stats3.metrics
+                )
+            )
+            display(
+                "CONSOLE| Rating cache: {0.hits} hits, {0.misses} misses, {0.size} players in {1} channels.".format(
+                    stats3.rank_cache, len(stats3.rank_cache.channels)
                 )
-            elif l[0] == "pickups":
-                channels = []
-                for c in bot.channels:
-                    pickups = []
-                    for p in c.pickups:
-                        if p.players != []:
-                            pickups.append(
-                                "[{0} ({1}/{2})]".format(
-                                    p.name, len(p.players), p.cfg["maxplayers"]
-                                )
+            )
+            display(
+                "CONSOLE| Result cache: {0.hits} hits, {0.misses} misses ({1:.0%}), {2} entries.".format(
+                    stats3.result_cache,
+                    stats3.result_cache.hit_rate(),
+                    len(stats3.result_cache.entries),
+                )
+            )
+        elif l[0] == "pickups":
+            channels = []
+            for c in bot.channels:
+                pickups = []
+                for p in c.pickups:
+                    if p.players != []:
+                        pickups.append(
+                            "[{0} ({1}/{2})]".format(
+                                p.name, len(p.players), p.cfg["maxplayers"]
                             )
-                    if pickups != []:
-                        channels.append("{0} {1}".format(c.name, " ".join(pickups)))
-                display("All pickups: {0}".format(" | ".join(channels)))
-            elif l[0] == "stats":
-                for c in bot.channels:
-                    display("STATS| {0}: {1}".format(c.name, stats3.stats(c.id)))
-            elif l[0] == "channels":
-                display(
-                    "CONSOLE| Pickup channels: {0}".format(
-                        " | ".join([i.name for i in bot.channels])
-                    )
+                        )
+                if pickups != []:
+                    channels.append("{0} {1}".format(c.name, " ".join(pickups)))
+            display("All pickups: {0}".format(" | ".join(channels)))
+        elif l[0] == "stats":
+            for c in bot.channels:
+                display("STATS| {0}: {1}".format(c.name, stats3.stats(c.id)))
+        elif l[0] == "channels":
+            display(
+                "CONSOLE| Pickup channels: {0}".format(
+                    " | ".join([i.name for i in bot.channels])
                 )
-            elif l[0] == "exec":
-                exec(l[1])
-            elif l[0] == "reset_players":
-                comment = False
-                if len(l) > 1:
-                    comment = l[1]
-                for i in bot.channels:
-                    i.reset_players(comment=comment)
-            elif l[0] == "delete_unused_channels":
-                if len(l) > 1:
-                    delete_unused_channels(False, int(l[1]))
-                else:
-                    delete_unused_channels(False)
-            elif l[0] == "echo_unused_channels":
-                if len(l) > 1:
-                    delete_unused_channels(True, int(l[1]))
-                else:
-                    delete_unused_channels(True)
-            elif l[0] == "echo_empty_servers":
-                client.get_empty_servers()
-            elif l[0] == "leave_server":
-                client.send_queue.append(["leave_server", l[1]])
-            elif l[0] == "quit":
-                terminate()
-        except Exception as e:
-            display("CONSOLE| ERROR: " + str(e))
-    except:
-        pass
+            )
+        elif l[0] == "exec":
+            exec(l[1])
+        elif l[0] == "reset_players":
+            comment = False
+            if len(l) > 1:
+                comment = l[1]
+            for i in bot.channels:
+                i.reset_players(comment=comment)
+        elif l[0] == "delete_unused_channels":
+            if len(l) > 1:
+                delete_unused_channels(False, int(l[1]))
+            else:
+                delete_unused_channels(False)
+        elif l[0] == "echo_unused_channels":
+            if len(l) > 1:
+                delete_unused_channels(True, int(l[1]))
+            else:
+                delete_unused_channels(True)
+        elif l[0] == "echo_empty_servers":
+            client.get_empty_servers()
+        elif l[0] == "leave_server":
+            guild = client.c.get_guild(int(l[1]))
+            if guild:
+                client.queue_send(guild.leave, {})
+            else:
+                display("CONSOLE| No such server.")
+        elif l[0] == "replay_ranks":
+            for i in bot.channels:
+                if str(i.id) == l[1]:
+                    display(
+                        "CONSOLE| Replaying ranked matches of {0}...".format(i.name)
+                    )
+                    stats3.submit(stats3.replay_ranks, i).add_done_callback(replay_done)
+                    return
+            display("CONSOLE| No such channel.")
+        elif l[0] in ("rebuild_stats", "check_stats"):
+            # one channel by id or all of them
+            channel_id = int(l[1]) if len(l) > 1 else None
+            if l[0] == "rebuild_stats":
+                display("CONSOLE| Recounting !stats and !top counters...")
+                future = stats3.submit(stats3.rebuild_counters, channel_id)
+                future.add_done_callback(rebuild_stats_done)
+            else:
+                future = stats3.submit(stats3.check_counters, channel_id)
+                future.add_done_callback(check_stats_done)
+        elif l[0] == "quit":
+            terminate()
+    except Exception as e:
+        display("CONSOLE| ERROR: " + str(e))
 
 
 def display(data):
@@ -198,6 +248,49 @@ def display(data):
         log.write(text + "\r\n")
 
 
+def replay_done(future):
+    # called on the database thread once replay_ranks is over
+    try:
+        matches, players, changed = future.result()
+    except Exception as e:
+        display("CONSOLE| ERROR: Replay failed: " + str(e))
+        return
+    display(
+        "CONSOLE| Replayed {0} matches of {1} players, {2} ratings changed.".format(
+            matches, players, changed
+        )
+    )
+
+
+def rebuild_stats_done(future):
+    try:
+        pickup_rows, player_rows = future.result()
+    except Exception as e:
+        display("CONSOLE| ERROR: Recount failed: " + str(e))
+        return
+    display(
+        "CONSOLE| Recounted {0} pickup days and {1} player days.".format(
+            pickup_rows, player_rows
+        )
+    )
+
+
+def check_stats_done(future):
+    try:
+        pickup_rows, player_rows = future.result()
+    except Exception as e:
+        display("CONSOLE| ERROR: Check failed: " + str(e))
+        return
+    if pickup_rows or player_rows:
+        display(
+            "CONSOLE| {0} pickup days and {1} player days are off, run rebuild_stats.".format(
+                pickup_rows, player_rows
+            )
+        )
+    else:
+        display("CONSOLE| !stats and !top counters match the match history.")
+
+
 # delete all channels with no activity within a month
 def delete_unused_channels(echo, tl=30):
     todel = []
@@ -229,6 +322,7 @@ def terminate():
     stats3.close()
     print("Waiting for connection to close...")
     alive = False
+    scheduler.wakeup()
 
 
 help = """Commands:
@@ -246,4 +340,7 @@ help = """Commands:
   delete_unused_channels [days] - delete all channels without activity for a month or for specified number of days.
   echo_empty_servers - list of servers without pickup channels.
   leave_server id - leave server.
+  replay_ranks %channel_id% - recompute a channel's ratings from its ranked matches.
+  rebuild_stats [channel_id] - recount the !stats and !top counters of a channel or of all channels.
+  check_stats [channel_id] - compare the !stats and !top counters with the match history.
   quit - save and quit."""
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# encoding: utf-8
+"""A channel's players kept sorted by rating, best first."""
+
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """Sorted (-rank, -user_id) keys with bisect lookups.
+
+    `rated` holds every player with a rating, like !rank counts them, and
+    `ladder` only the ones who played a ranked match, like !lb lists them.
+    """
+
+    def __init__(self, players=()):
+        self.rows = {}  # {user_id: (rank, nick, wins, loses)}
+        self.nicks = {}  # {lowercase nick: {user_id, ...}}
+        self.rated = []
+        self.ladder = []
+        for user_id, rank, nick, wins, loses in players:
+            self.rows[user_id] = (rank, nick, wins, loses)
+            self.index_nick(user_id, nick)
+            if rank is not None:
+                self.rated.append((-rank, -user_id))
+                if on_ladder(wins, loses):
+                    self.ladder.append((-rank, -user_id))
+        self.rated.sort()
+        self.ladder.sort()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, user_id, rank, nick, wins, loses):
+        old = self.rows.get(user_id)
+        if old is not None:
+            if old[0] is not None:
+                discard(self.rated, (-old[0], -user_id))
+                if on_ladder(old[2], old[3]):
+                    discard(self.ladder, (-old[0], -user_id))
+            if old[1] and self.nicks.get(old[1].lower()):
+                self.nicks[old[1].lower()].discard(user_id)
+
+        self.rows[user_id] = (rank, nick, wins, loses)
+        self.index_nick(user_id, nick)
+        if rank is not None:
+            insort(self.rated, (-rank, -user_id))
+            if on_ladder(wins, loses):
+                insort(self.ladder, (-rank, -user_id))
+
+    def index_nick(self, user_id, nick):
+        if nick:
+            self.nicks.setdefault(nick.lower(), set()).add(user_id)
+
+    def find(self, nick):
+        """The best rated player going by `nick`, case insensitive."""
+        user_ids = [
+            user_id
+            for user_id in self.nicks.get(nick.lower(), ())
+            if self.rows[user_id][0] is not None
+        ]
+        if user_ids:
+            return min(user_ids, key=lambda i: (-self.rows[i][0], -i))
+
+    def position(self, user_id):
+        """1-based place among rated players or None."""
+        row = self.rows.get(user_id)
+        if row is None or row[0] is None:
+            return None
+        return bisect_left(self.rated, (-row[0], -user_id)) + 1
+
+    def page(self, page, size=10):
+        """[(rank, nick, wins, loses), ...] of ladder page `page`, from 0."""
+        keys = self.ladder[page * size : (page + 1) * size]
+        return [self.rows[-user_id] for _, user_id in keys]
+
+    def around(self, user_id, radius=5):
+        """(first place, rows) of the ladder around `user_id`."""
+        row = self.rows.get(user_id)
+        if row is None or row[0] is None or not on_ladder(row[2], row[3]):
+            return None, []
+        i = bisect_left(self.ladder, (-row[0], -user_id))
+        start = max(i - radius, 0)
+        keys = self.ladder[start : i + radius + 1]
+        return start + 1, [self.rows[-user_id] for _, user_id in keys]
+
+
+def on_ladder(wins, loses):
+    # the same as 'wins+loses > 0' in SQL, where NULL never passes
+    return wins is not None and loses is not None and wins + loses > 0
+
+
+def discard(keys, key):
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
@@ -1,60 +1,121 @@
 import time
+import heapq
+import asyncio
+import itertools
 
 from . import console
 
 
-tasks = {}
-next_task = False
+tasks = {}  # {name: [time to run task, func, args, comment]}
+queue = []  # heap of (time to run task, sequence, name, task)
+stale = 0  # number of cancelled entries still sitting in the queue
+sequence = itertools.count()
+wakeup_loop = None
+wakeup_event = None
+slack = 0.01  # oversleep a bit so strict 'frametime > deadline' checks pass
 
 
 def init():
-    global tasks, next_task
+    global tasks, queue, stale, sequence, wakeup_loop, wakeup_event
     tasks = {}
-    next_task = False
+    queue = []
+    stale = 0
+    sequence = itertools.count()
+    wakeup_loop = None
+    wakeup_event = None
 
 
 def run(frametime):
-    if next_task:
-        if frametime > tasks[next_task][0]:
-            current_task = tasks.pop(next_task)
-            try:
-                current_task[1](*current_task[2])
-            except Exception as e:
-                console.display(
-                    "SCHEDULER| ERROR: Task function failed @ {0} {1}, Exception: {2}".format(
-                        current_task[1], current_task[2], e
-                    )
+    global stale
+    # run every task that is due, not just the first one
+    while queue and frametime > queue[0][0]:
+        _, _, name, task = heapq.heappop(queue)
+        if tasks.get(name) is not task:
+            stale = max(stale - 1, 0)
+            continue
+
+        tasks.pop(name)
+        try:
+            task[1](*task[2])
+        except Exception as e:
+            console.display(
+                "SCHEDULER| ERROR: Task function failed @ {0} {1}, Exception: {2}".format(
+                    task[1], task[2], e
                 )
-            define_next_task()
+            )
 
 
 def add_task(name, delay, func, args, comment=None):
     if name not in tasks:
-        tasks[name] = [
+        task = [
             time.time() + delay,
             func,
             args,
             comment,
         ]  # time to run task, func
-        define_next_task()
+        tasks[name] = task
+        heapq.heappush(queue, (task[0], next(sequence), name, task))
+        if queue[0][3] is task:
+            wakeup()
     else:
         console.display("SCHEDULER| ERROR: Task with this name already exist!")
 
 
 def cancel_task(name):
+    global stale
     if name in tasks:
+        # leave the queue entry in place, it is skipped once it surfaces
         tasks.pop(name)
-        if next_task == name:
-            define_next_task()
+        stale += 1
+        if stale > len(tasks) + 64:
+            compact()
     else:
         console.display("SCHEDULER| ERROR: No such task")
 
 
-def define_next_task():
-    global next_task
-    if len(list(tasks.keys())) > 0:
-        sorted_tasks = sorted([(value, key) for (key, value) in list(tasks.items())])
-        if next_task != sorted_tasks[0][1]:
-            next_task = sorted_tasks[0][1]
+def compact():
+    # rebuild the queue without cancelled entries once they outnumber live ones
+    global queue, stale
+    queue = [entry for entry in queue if tasks.get(entry[2]) is entry[3]]
+    heapq.heapify(queue)
+    stale = 0
+
+
+def next_deadline():
+    """Return the time of the earliest pending task or None."""
+    global stale
+    while queue and tasks.get(queue[0][2]) is not queue[0][3]:
+        heapq.heappop(queue)
+        stale = max(stale - 1, 0)
+    return queue[0][0] if queue else None
+
+
+def attach(loop):
+    """Bind the main loop wait() sleeps on, must be called from within it."""
+    global wakeup_loop, wakeup_event
+    wakeup_loop = loop
+    wakeup_event = asyncio.Event()
+
+
+def wakeup():
+    """Interrupt wait() early, safe to call from any thread."""
+    if wakeup_event is not None:
+        wakeup_loop.call_soon_threadsafe(wakeup_event.set)
+
+
+async def wait(deadline=None):
+    """Sleep until the next task or `deadline` is due, or until woken up."""
+    task_deadline = next_deadline()
+    if deadline is None or (task_deadline is not None and task_deadline < deadline):
+        deadline = task_deadline
+
+    if deadline is None:
+        timeout = None
     else:
-        next_task = False
+        timeout = max(deadline - time.time(), 0) + slack
+
+    try:
+        await asyncio.wait_for(wakeup_event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    wakeup_event.clear()
@@ -1,31 +1,320 @@
 #!/usr/bin/python2
 import sqlite3
+import asyncio
+import inspect
+import functools
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from time import time
 from os.path import isfile
 from decimal import Decimal
 
-from . import console
+from . import console, scheduler
+from .leaderboard import Leaderboard
 
 # INIT
-version = 14
+version = 18
+
+# accepted values for the pragmas init() applies, int means any integer
+pragma_values = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+    "mmap_size": int,
+    "cache_size": int,
+}
 
 
 conn = None
 c = None
 last_match = -1
+batch_size = 0  # writes grouped into one commit, 0 commits every write
+pending_writes = 0
+metrics = {"writes": 0, "commits": 0, "durable_commits": 0}
+lock = threading.RLock()  # the connection is shared by the loop, console and db threads
+executor = None  # the single thread async callers run their queries on
+name_search = False  # the FTS5 nick index is there, see setup_search()
+DAY = 86400  # seconds in a pickup_days / player_days bucket
+
+
+def serialized(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _commit(durable=False):
+    global pending_writes
+    metrics["writes"] += 1
+    pending_writes += 1
+    if durable:
+        metrics["durable_commits"] += 1
+    if durable or pending_writes >= batch_size:
+        flush()
+
+
+@serialized
+def flush():
+    """Commit the writes held back by the write-behind mode."""
+    global pending_writes
+    if pending_writes:
+        conn.commit()
+        metrics["commits"] += 1
+        pending_writes = 0
+
+
+def write_behind(size, interval):
+    """Commit every `size` writes or `interval` seconds, whichever is first."""
+    global batch_size
+    batch_size = size
+    if "db_flush" in scheduler.tasks:
+        scheduler.cancel_task("db_flush")
+    if not size or not interval:
+        return
+
+    def task():
+        try:
+            flush()
+        finally:
+            scheduler.add_task("db_flush", interval, task, ())
+
+    scheduler.add_task("db_flush", interval, task, ())
+
+
+class RankCache:
+    """Write-through copy of channel_players ratings, loaded a channel at a time.
+
+    Holds {channel_id: {user_id: [rank, wins, loses, streak, is_seeded, nick]}}
+    and drops the least recently used channels once more than `max_players`
+    rows are cached. Channels that fit also get a Leaderboard on demand.
+    """
+
+    def __init__(self, max_players=100000):
+        self.channels = OrderedDict()
+        self.boards = {}
+        self.size = 0
+        self.max_players = max_players
+        self.hits = 0
+        self.misses = 0
 
+    def players(self, channel_id):
+        players = self.channels.get(channel_id)
+        if players is not None:
+            self.hits += 1
+            self.channels.move_to_end(channel_id)
+            return players
 
-def init(db_file="database.sqlite3"):
-    global conn, c, last_match
+        self.misses += 1
+        c.execute(
+            "SELECT user_id, rank, wins, loses, streak, is_seeded, nick FROM channel_players WHERE channel_id = ?",
+            (channel_id,),
+        )
+        players = {user_id: row for user_id, *row in c.fetchall()}
+        self.channels[channel_id] = players
+        self.size += len(players)
+        self.evict()
+        return players
+
+    def board(self, channel_id):
+        """The channel's Leaderboard, None if it is too big to cache."""
+        players = self.players(channel_id)
+        if len(players) > self.max_players:
+            return None
+        board = self.boards.get(channel_id)
+        if board is None:
+            board = self.boards[channel_id] = Leaderboard(
+                (user_id, row[0], row[5], row[1], row[2])
+                for user_id, row in players.items()
+            )
+        return board
+
+    def update(self, channel_id, user_id, **values):
+        # only channels already loaded are kept up to date
+        players = self.channels.get(channel_id)
+        if players is None:
+            return
+        if user_id not in players:
+            players[user_id] = [None] * len(rank_fields)
+            self.size += 1
+        row = players[user_id]
+        for name, value in values.items():
+            row[rank_fields.index(name)] = value
+        if channel_id in self.boards:
+            self.boards[channel_id].update(user_id, row[0], row[5], row[1], row[2])
+
+    def invalidate(self, channel_id):
+        players = self.channels.pop(channel_id, None)
+        self.boards.pop(channel_id, None)
+        if players is not None:
+            self.size -= len(players)
+
+    def evict(self):
+        while self.size > self.max_players and len(self.channels) > 1:
+            channel_id, players = self.channels.popitem(last=False)
+            self.boards.pop(channel_id, None)
+            self.size -= len(players)
+
+
+rank_fields = ("rank", "wins", "loses", "streak", "is_seeded", "nick")
+rank_cache = RankCache()
+
+
+def cache_ranks(max_players):
+    """Bound the rating cache to `max_players` rows over all channels."""
+    rank_cache.max_players = max_players
+    with lock:
+        rank_cache.evict()
+
+
+class ResultCache:
+    """Results of read only queries by (function, channel_id, args).
+
+    Entries live `ttl` seconds at most, the least recently used go first
+    once there are more than `max_entries`, and writes drop their channel's
+    entries. Has its own lock so lookups never wait for a running query.
+    """
+
+    def __init__(self, max_entries=1000, ttl=60):
+        self.entries = OrderedDict()  # {key: (expires, result)}
+        self.channels = {}  # {channel_id: {key, ...}}
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return missing
+            if entry[0] < time():
+                self.drop(key)
+                return missing
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, result, ttl=None):
+        with self.lock:
+            self.misses += 1
+            if not self.max_entries or not self.ttl:
+                return
+            self.entries[key] = (time() + min(ttl or self.ttl, self.ttl), result)
+            self.entries.move_to_end(key)
+            self.channels.setdefault(key[1], set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.drop(next(iter(self.entries)))
+
+    def drop(self, key):
+        del self.entries[key]
+        keys = self.channels[key[1]]
+        keys.discard(key)
+        if not keys:
+            del self.channels[key[1]]
+
+    def invalidate(self, channel_id=None):
+        """Forget a channel's results, or everything without a channel."""
+        with self.lock:
+            if channel_id is None:
+                self.entries.clear()
+                self.channels.clear()
+                return
+            for key in self.channels.pop(channel_id, ()):
+                del self.entries[key]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+
+missing = object()
+result_cache = ResultCache()
+
+
+def cache_results(max_entries, ttl):
+    """Keep up to `max_entries` query results for at most `ttl` seconds."""
+    result_cache.max_entries = max_entries
+    result_cache.ttl = ttl
+    result_cache.invalidate()
+
+
+def memoized(ttl=None):
+    """Cache func(channel_id, ...) in result_cache, goes inside @serialized."""
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def cache_key(*args, **kwargs):
+            # the same key however the arguments are passed
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            channel_id, *rest = bound.arguments.values()
+            return (func.__name__, channel_id, tuple(rest))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = cache_key(*args, **kwargs)
+            result = result_cache.get(key)
+            if result is missing:
+                result = func(*args, **kwargs)
+                result_cache.put(key, result, ttl)
+            return result
+
+        wrapper.cache_key = cache_key
+        return wrapper
+
+    return decorator
+
+
+def submit(func, *args):
+    """Queue func(*args) on the database thread, returns a concurrent future."""
+    return executor.submit(func, *args)
+
+
+def run_async(func, *args):
+    """Await func(*args) on the database thread without blocking the loop."""
+    return asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(func, *args)
+    )
+
+
+async def run_memoized(func, *args):
+    # a cached result needs no trip to the database thread
+    result = result_cache.get(func.cache_key(*args))
+    if result is missing:
+        result = await run_async(func, *args)
+    return result
+
+
+@serialized
+def init(db_file="database.sqlite3", pragmas=None):
+    global conn, c, last_match, executor, pending_writes, rank_cache, result_cache
     dbexists = isfile(db_file)
 
     if conn:
+        conn.commit()
         conn.close()
+    pending_writes = 0
+    rank_cache = RankCache(rank_cache.max_players)
+    result_cache = ResultCache(result_cache.max_entries, result_cache.ttl)
 
-    conn = sqlite3.connect(db_file)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stats3")
+
+    conn = sqlite3.connect(db_file, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
+    if pragmas:
+        apply_pragmas(pragmas)
     if dbexists:
         try:
             check_db()
@@ -36,6 +325,7 @@ def init(db_file="database.sqlite3"):
     else:
         console.display("DATATBASE| Creating new database...")
         create_tables()
+    setup_search()
 
     c.execute("SELECT pickup_id from pickups ORDER BY pickup_id DESC LIMIT 1")
     result = c.fetchone()
@@ -45,6 +335,50 @@ def init(db_file="database.sqlite3"):
         last_match = -1
 
 
+def apply_pragmas(pragmas):
+    for name, value in pragmas.items():
+        if value is None:
+            continue
+        allowed = pragma_values.get(name)
+        if allowed is None:
+            console.display("DATABASE| Unknown pragma '{0}', skipping.".format(name))
+            continue
+        try:
+            if allowed is int:
+                value = int(value)
+            elif str(value).upper() in allowed:
+                value = str(value).upper()
+            else:
+                raise ValueError("must be one of " + ", ".join(allowed))
+        except ValueError as e:
+            console.display(
+                "DATABASE| Bad value '{0}' for pragma {1}: {2}".format(value, name, e)
+            )
+            continue
+        c.execute("PRAGMA {0} = {1}".format(name, value))
+
+
+@serialized
+def checkpoint():
+    # fold the WAL back into the database so it does not grow without bound
+    c.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    return c.fetchone()
+
+
+def schedule_checkpoint(interval):
+    if not interval:
+        return
+
+    def task():
+        try:
+            checkpoint()
+        finally:
+            scheduler.add_task("db_checkpoint", interval, task, ())
+
+    scheduler.add_task("db_checkpoint", interval, task, ())
+
+
+@serialized
 def get_channels():
     l = []
     c.execute("SELECT * from channels")
@@ -60,6 +394,7 @@ def get_channels():
     return l
 
 
+@serialized
 def get_pickups(channel_id):
     c.execute("SELECT * from pickup_configs WHERE channel_id = ?", (channel_id,))
     pickups = c.fetchall()
@@ -69,6 +404,7 @@ def get_pickups(channel_id):
     return l
 
 
+@serialized
 def get_pickup_groups(channel_id):
     c.execute(
         "SELECT group_name, pickup_names FROM pickup_groups WHERE channel_id = ?",
@@ -81,39 +417,43 @@ def get_pickup_groups(channel_id):
     return d
 
 
+@serialized
 def new_pickup_group(channel_id, group_name, pickup_names):
     c.execute(
         "INSERT OR REPLACE INTO pickup_groups (channel_id, group_name, pickup_names) VALUES (?, ?, ?)",
         (channel_id, group_name, " ".join(pickup_names)),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def delete_pickup_group(channel_id, group_name):
     c.execute(
         "DELETE FROM pickup_groups WHERE channel_id = ? AND group_name = ?",
         (channel_id, group_name),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def new_channel(server_id, server_name, channel_id, channel_name, admin_id):
     c.execute(
         "INSERT OR REPLACE INTO channels (server_id, server_name, channel_id, channel_name, first_init, admin_id) VALUES (?, ?, ?, ?, ?, ?)",
         (server_id, server_name, channel_id, channel_name, str(int(time())), admin_id),
     )
-    conn.commit()
+    _commit()
     c.execute("SELECT * from channels WHERE channel_id = ?", (channel_id,))
     chan = c.fetchone()
     return dict(chan)
 
 
+@serialized
 def new_pickup(channel_id, pickup_name, maxplayers):
     c.execute(
         "INSERT INTO pickup_configs (channel_id, pickup_name, maxplayers) VALUES (?, ?, ?)",
         (channel_id, pickup_name, maxplayers),
     )
-    conn.commit()
+    _commit()
     c.execute(
         "SELECT * from pickup_configs WHERE channel_id = ? AND pickup_name = ?",
         (channel_id, pickup_name),
@@ -122,14 +462,16 @@ def new_pickup(channel_id, pickup_name, maxplayers):
     return dict(result)
 
 
+@serialized
 def delete_pickup(channel_id, pickup_name):
     c.execute(
         "DELETE FROM pickup_configs WHERE channel_id = ? AND pickup_name = ? COLLATE NOCASE",
         (channel_id, pickup_name),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def delete_channel(channel_id):
     c.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
     c.execute("DELETE FROM channel_players WHERE channel_id = ?", (channel_id,))
@@ -137,16 +479,27 @@ def delete_channel(channel_id):
     c.execute("DELETE FROM pickup_configs WHERE channel_id = ?", (channel_id,))
     c.execute("DELETE FROM player_pickups WHERE channel_id = ?", (channel_id,))
     c.execute("DELETE FROM pickups WHERE channel_id = ?", (channel_id,))
+    c.execute("DELETE FROM pickup_roster WHERE channel_id = ?", (channel_id,))
+    c.execute("DELETE FROM pickup_days WHERE channel_id = ?", (channel_id,))
+    c.execute("DELETE FROM player_days WHERE channel_id = ?", (channel_id,))
     c.execute("DELETE FROM pickup_groups WHERE channel_id = ?", (channel_id,))
-    conn.commit()
+    rank_cache.invalidate(channel_id)
+    result_cache.invalidate(channel_id)
+    _commit()
 
 
+@serialized
 def reset_stats(channel_id):
     c.execute("DELETE FROM pickups WHERE channel_id = ?", (channel_id,))
     c.execute("DELETE FROM player_pickups WHERE channel_id = ?", (channel_id,))
-    conn.commit()
+    c.execute("DELETE FROM pickup_roster WHERE channel_id = ?", (channel_id,))
+    c.execute("DELETE FROM pickup_days WHERE channel_id = ?", (channel_id,))
+    c.execute("DELETE FROM player_days WHERE channel_id = ?", (channel_id,))
+    result_cache.invalidate(channel_id)
+    _commit()
 
 
+@serialized
 def undo_ranks(channel_id, match_id):
     c.execute(
         "SELECT user_id, user_name, rank_change, is_winner FROM player_pickups WHERE channel_id = ? AND pickup_id = ? AND is_ranked = 1",
@@ -163,12 +516,15 @@ def undo_ranks(channel_id, match_id):
                 "UPDATE channel_players SET rank=rank-(?), wins=wins-?, loses=loses-? WHERE channel_id = ? AND user_id = ?",
                 (rank_change, is_winner, 1 - is_winner, channel_id, user_id),
             )
-        conn.commit()
+        rank_cache.invalidate(channel_id)
+        result_cache.invalidate(channel_id)
+        _commit()
         return "\n".join(["`{0}` - **{1:+}** points".format(i[1], 0 - i[2]) for i in l])
     else:
         return "No changes made."
 
 
+@serialized
 def seed_player(channel_id, user_id, rating):
     c.execute(
         "SELECT user_id FROM channel_players WHERE channel_id = ? AND user_id = ?",
@@ -184,22 +540,86 @@ def seed_player(channel_id, user_id, rating):
             "INSERT INTO channel_players (channel_id, user_id, rank, is_seeded) VALUES (?, ?, ?, ?)",
             (channel_id, user_id, rating, True),
         )
+    rank_cache.update(channel_id, user_id, rank=rating, is_seeded=True)
+    result_cache.invalidate(channel_id)
+    _commit()
 
 
+@serialized
 def reset_ranks(channel_id):
     c.execute(
         "UPDATE channel_players SET rank = NULL, wins = NULL, loses = NULL, streak = NULL, is_seeded = NULL WHERE channel_id = ?",
         (channel_id,),
     )
-    conn.commit()
+    rank_cache.invalidate(channel_id)
+    result_cache.invalidate(channel_id)
+    _commit()
+
+
+def rating_change(rank_k, calibrate, streaks, score, expected, history):
+    """Rating change for one player and their new streak.
+
+    history is the player's (wins, loses, streak, is_seeded) before the match.
+    """
+    wins, loses, streak, is_seeded = history
+    rank_change = int(rank_k * (score - expected))
+    # if we need to calibrate this player add additional rank gain/loss boost
+    if calibrate and wins + loses < 8 and not is_seeded:
+        rank_change = int(rank_change * ((10 - (wins + loses)) / 2.0))
+
+    if streaks:
+        if streak.__gt__(0) != score.__gt__(0):
+            streak = 0
+        if score == 1:
+            streak += 1
+        elif score == 0.5:
+            streak = 0
+        else:
+            streak -= 1
+        if abs(streak) > 2:
+            rank_change = int(rank_change * (min([abs(streak), 6]) / 2.0))
+    else:
+        streak = 0
+
+    return rank_change, streak
+
+
+def expected_scores(alpha_rank, beta_rank):
+    # [alpha, beta]
+    return [
+        1 / (1 + 10 ** ((beta_rank - alpha_rank) / 400)),
+        1 / (1 + 10 ** ((alpha_rank - beta_rank) / 400)),
+    ]
 
 
+def match_scores(winner):
+    # [alpha, beta]
+    if winner == "alpha":
+        return [1, 0]
+    elif winner == "draw":
+        return [0.5, 0.5]
+    return [0, 1]
+
+
+@serialized
 def register_pickup(match):
     new_ranks = dict()
     at = int(time())
-    match.ranks = get_ranks(
-        match.pickup.channel, [i.id for i in match.players]
-    )  # Update players ratings incase of changes
+    channel = match.pickup.channel
+    user_ids = [i.id for i in match.players]
+
+    # ratings and history of every player in one go, like get_ranks()
+    cached = rank_cache.players(channel.id)
+    history = dict()
+    match.ranks = dict()  # Update players ratings incase of changes
+    for user_id in user_ids:
+        if user_id in cached:
+            rank, *player_history, _ = cached[user_id]
+            history[user_id] = [i or 0 for i in player_history]
+            if rank:
+                match.ranks[user_id] = rank
+        if user_id not in match.ranks:
+            match.ranks[user_id] = channel.cfg["initial_rating"] or 1400
 
     playersstr = " " + " ".join([i.nick or i.name for i in match.players]) + " "
     if match.alpha_team and match.beta_team:
@@ -213,7 +633,7 @@ def register_pickup(match):
         "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at, players, alpha_players, beta_players, is_ranked, winner_team) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
         (
             match.id,
-            match.pickup.channel.id,
+            channel.id,
             match.pickup.name,
             at,
             playersstr,
@@ -233,19 +653,11 @@ def register_pickup(match):
             sum([match.ranks[player.id] for player in match.beta_team])
             / len(match.beta_team)
         )
+        expected = expected_scores(alpha_rank, beta_rank)
+        scores = match_scores(match.winner)
 
-        # [alpha, beta]
-        expected_scores = [
-            1 / (1 + 10 ** ((beta_rank - alpha_rank) / 400)),
-            1 / (1 + 10 ** ((alpha_rank - beta_rank) / 400)),
-        ]
-        if match.winner == "alpha":
-            scores = [1, 0]
-        elif match.winner == "draw":
-            scores = [0.5, 0.5]
-        else:
-            scores = [0, 1]
-
+    player_rows = []
+    player_pickup_rows = []
     for player in [
         player for player in match.players if player not in match.unpicked_pool
     ]:
@@ -261,59 +673,40 @@ def register_pickup(match):
                 team = "beta"
 
         if match.ranked and match.winner and team:
-            c.execute(
-                "INSERT OR IGNORE INTO channel_players (channel_id, user_id, nick, rank, wins, loses, phrase) VALUES (?, ?, ?, ?, 0, 0, NULL)",
-                (match.pickup.channel.id, player.id, user_name, match.ranks[player.id]),
-            )
-
-            # if we need to calibrate this player add additional rank gain/loss boost
-            rank_k = match.pickup.channel.cfg["ranked_multiplayer"]
-            c.execute(
-                "SELECT wins, loses, streak, is_seeded FROM channel_players WHERE channel_id = ? AND user_id = ?",
-                (match.pickup.channel.id, player.id),
+            wins, loses, streak, is_seeded = history.get(player.id, (0, 0, 0, 0))
+            rank_change, streak = rating_change(
+                channel.cfg["ranked_multiplayer"],
+                channel.cfg["ranked_calibrate"],
+                match.ranked_streaks,
+                scores[team_num],
+                expected[team_num],
+                (wins, loses, streak, is_seeded),
             )
-            result = c.fetchone()
-            wins, loses, streak, is_seeded = [i or 0 for i in result]
 
             is_ranked = True
-            rank_change = int(rank_k * (scores[team_num] - expected_scores[team_num]))
-            if (
-                match.pickup.channel.cfg["ranked_calibrate"]
-                and wins + loses < 8
-                and not is_seeded
-            ):
-                rank_change = int(rank_change * ((10 - (wins + loses)) / 2.0))
-
-            if match.ranked_streaks:
-                if streak.__gt__(0) != scores[team_num].__gt__(0):
-                    streak = 0
-                if scores[team_num] == 1:
-                    streak += 1
-                elif scores[team_num] == 0.5:
-                    streak = 0
-                else:
-                    streak -= 1
-                if abs(streak) > 2:
-                    rank_change = int(rank_change * (min([abs(streak), 6]) / 2.0))
-            else:
-                streak = 0
-
             rank_after = match.ranks[player.id] + rank_change
             is_winner = scores[team_num]
-
-            c.execute(
-                "UPDATE channel_players SET nick = ?, rank = ?, wins=?, loses=?, streak=? WHERE channel_id = ? AND user_id = ?",
+            player_rows.append(
                 (
+                    channel.id,
+                    player.id,
                     user_name,
                     rank_after,
                     wins + scores[team_num],
                     loses + abs(scores[team_num] - 1),
                     streak,
-                    match.pickup.channel.id,
-                    player.id,
-                ),
+                )
             )
             new_ranks[player.id] = [user_name, rank_after]
+            rank_cache.update(
+                channel.id,
+                player.id,
+                rank=rank_after,
+                nick=user_name,
+                wins=wins + scores[team_num],
+                loses=loses + abs(scores[team_num] - 1),
+                streak=streak,
+            )
 
         else:
             is_ranked = False
@@ -321,11 +714,10 @@ def register_pickup(match):
             rank_after = None
             is_winner = None
 
-        c.execute(
-            "INSERT OR IGNORE INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at, team, is_ranked, is_winner, rank_after, rank_change, is_lastpick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        player_pickup_rows.append(
             (
                 match.id,
-                match.pickup.channel.id,
+                channel.id,
                 player.id,
                 user_name,
                 match.pickup.name,
@@ -336,13 +728,162 @@ def register_pickup(match):
                 rank_after,
                 rank_change,
                 is_lastpick,
-            ),
+            )
         )
 
-    conn.commit()
+    c.executemany(
+        "INSERT INTO channel_players (channel_id, user_id, nick, rank, wins, loses, streak) VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (channel_id, user_id) DO UPDATE SET nick = excluded.nick, rank = excluded.rank, wins = excluded.wins, loses = excluded.loses, streak = excluded.streak",
+        player_rows,
+    )
+    c.executemany(
+        "INSERT OR IGNORE INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at, team, is_ranked, is_winner, rank_after, rank_change, is_lastpick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        player_pickup_rows,
+    )
+    c.execute(
+        "INSERT INTO pickup_days (channel_id, pickup_name, day, count) VALUES (?, ?, ?, 1) ON CONFLICT (channel_id, pickup_name, day) DO UPDATE SET count = count + 1",
+        (channel.id, match.pickup.name, at // DAY),
+    )
+    c.executemany(
+        "INSERT INTO player_days (channel_id, user_id, pickup_name, day, count, user_name) VALUES (?, ?, ?, ?, 1, ?) ON CONFLICT (channel_id, user_id, pickup_name, day) DO UPDATE SET count = count + 1, user_name = excluded.user_name",
+        [(row[1], row[2], row[4], at // DAY, row[3]) for row in player_pickup_rows],
+    )
+    c.executemany(
+        "INSERT INTO pickup_roster (pickup_id, channel_id, user_id, nick, team) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                match.id,
+                channel.id,
+                player.id,
+                player.nick or player.name,
+                "alpha"
+                if player in (match.alpha_team or ())
+                else "beta"
+                if player in (match.beta_team or ())
+                else None,
+            )
+            for player in match.players
+        ],
+    )
+
+    result_cache.invalidate(channel.id)
+    _commit(durable=True)  # a finished match must survive a crash
     return new_ranks
 
 
+@serialized
+def replay_ranks(channel):
+    """Recompute a channel's ladder from its ranked matches.
+
+    Replays player_pickups in pickup_id order with the register_pickup() rules
+    and the channel's current rating settings, then writes every changed
+    rating back in one transaction. Players start from the initial rating,
+    seeded ones from the rating they had before their first ranked match.
+    Returns (matches, players, changed rows).
+    """
+    rank_k = channel.cfg["ranked_multiplayer"]
+    calibrate = channel.cfg["ranked_calibrate"]
+    streaks = channel.cfg["ranked_streaks"]
+    initial = channel.cfg["initial_rating"] or 1400
+    c.execute(
+        "SELECT user_id FROM channel_players WHERE channel_id = ? AND is_seeded",
+        (channel.id,),
+    )
+    seeded = {user_id for (user_id,) in c.fetchall()}
+
+    # per player state, indexed through index[user_id]
+    index = {}
+    user_ids, nicks = [], []
+    ranks, streak = array("q"), array("q")
+    wins, loses = array("d"), array("d")
+
+    changed = []
+    matches = 0
+    rows = conn.cursor()
+    rows.row_factory = None  # plain tuples, a lot cheaper for millions of rows
+    rows.execute(
+        "SELECT pickup_id, user_id, user_name, team, is_winner, rank_after, rank_change FROM player_pickups WHERE channel_id = ? AND is_ranked = 1 ORDER BY pickup_id",
+        (channel.id,),
+    )
+    for pickup_id, group in groupby(rows, itemgetter(0)):
+        group = list(group)
+        teams = ([], [])
+        for _, user_id, user_name, team, _, rank_after, rank_change in group:
+            i = index.get(user_id)
+            if i is None:
+                i = index[user_id] = len(user_ids)
+                user_ids.append(user_id)
+                nicks.append(user_name)
+                if user_id in seeded:
+                    ranks.append(rank_after - rank_change)
+                else:
+                    ranks.append(initial)
+                streak.append(0)
+                wins.append(0)
+                loses.append(0)
+            nicks[i] = user_name
+            teams[team == "beta"].append(i)
+        if not teams[0] or not teams[1]:
+            continue
+
+        matches += 1
+        expected = expected_scores(
+            int(sum(ranks[i] for i in teams[0]) / len(teams[0])),
+            int(sum(ranks[i] for i in teams[1]) / len(teams[1])),
+        )
+        changes = []
+        for _, user_id, _, team, score, rank_after, rank_change in group:
+            i = index[user_id]
+            new_change, streak[i] = rating_change(
+                rank_k,
+                calibrate,
+                streaks,
+                score,
+                expected[team == "beta"],
+                (wins[i], loses[i], streak[i], user_id in seeded),
+            )
+            changes.append((i, new_change))
+            wins[i] += score
+            loses[i] += abs(score - 1)
+            if (ranks[i] + new_change, new_change) != (rank_after, rank_change):
+                changed.append(
+                    (ranks[i] + new_change, new_change, channel.id, pickup_id, user_id)
+                )
+        for i, new_change in changes:
+            ranks[i] += new_change
+
+    c.executemany(
+        "UPDATE player_pickups SET rank_after = ?, rank_change = ? WHERE channel_id = ? AND pickup_id = ? AND user_id = ?",
+        changed,
+    )
+    c.executemany(
+        "INSERT INTO channel_players (channel_id, user_id, nick, rank, wins, loses, streak) VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (channel_id, user_id) DO UPDATE SET nick = excluded.nick, rank = excluded.rank, wins = excluded.wins, loses = excluded.loses, streak = excluded.streak",
+        [
+            (
+                channel.id,
+                user_id,
+                nicks[i],
+                ranks[i],
+                whole(wins[i]),
+                whole(loses[i]),
+                streak[i],
+            )
+            for user_id, i in index.items()
+        ],
+    )
+    rank_cache.invalidate(channel.id)
+    result_cache.invalidate(channel.id)
+    _commit(durable=True)
+    return matches, len(index), len(changed)
+
+
+def whole(number):
+    # wins and loses only get halves from draws
+    return int(number) if number == int(number) else number
+
+
+@serialized
 def lastgame(channel_id, text=False, offset=0):
     select_statement = "SELECT pickup_id, at, pickup_name, players, alpha_players, beta_players, winner_team FROM pickups WHERE channel_id = ?"
     if not text:
@@ -356,6 +897,42 @@ def lastgame(channel_id, text=False, offset=0):
         c.execute(query, (channel_id, text, offset))
         result = c.fetchone()
         if result is None:
+            # a player's games, by mention, current nick or nick at the time
+            mention = text.strip("<@!>")
+            c.execute(
+                "SELECT pickup_id FROM pickup_roster WHERE channel_id = ? AND user_id IN (SELECT ? UNION SELECT user_id FROM channel_players WHERE channel_id = ? AND nick = ? COLLATE NOCASE) UNION SELECT pickup_id FROM pickup_roster WHERE channel_id = ? AND nick = ? COLLATE NOCASE ORDER BY pickup_id DESC LIMIT 1 OFFSET ?",
+                (
+                    channel_id,
+                    int(mention) if mention.isdigit() else None,
+                    channel_id,
+                    text,
+                    channel_id,
+                    text,
+                    offset,
+                ),
+            )
+            found = c.fetchone()
+            if found:
+                c.execute(
+                    "{} AND pickup_id = ?".format(select_statement),
+                    (channel_id, found[0]),
+                )
+                result = c.fetchone()
+        if result is None and name_search:
+            # a nick starting with the text
+            c.execute(
+                "SELECT DISTINCT r.pickup_id FROM name_search JOIN pickup_roster r ON r.rowid = name_search.rowid WHERE name_search MATCH ? AND r.channel_id = ? ORDER BY r.pickup_id DESC LIMIT 1 OFFSET ?",
+                (search_query(text), channel_id, offset),
+            )
+            found = c.fetchone()
+            if found:
+                c.execute(
+                    "{} AND pickup_id = ?".format(select_statement),
+                    (channel_id, found[0]),
+                )
+                result = c.fetchone()
+        elif result is None:
+            # part of a nick, the slow way
             query = (
                 "{} AND players LIKE ? ORDER BY pickup_id DESC LIMIT 1 OFFSET ?".format(
                     select_statement
@@ -366,57 +943,135 @@ def lastgame(channel_id, text=False, offset=0):
     return result
 
 
+@serialized
 def get_ranks(channel, user_ids):
     d = dict()
-    c.execute(
-        "SELECT user_id, rank FROM channel_players WHERE channel_id = ? AND user_id in ({seq})".format(
-            seq=",".join(["?"] * len(user_ids))
-        ),
-        (channel.id, *user_ids),
-    )
-    results = c.fetchall()
-    for user_id, rank in results:
-        if rank:
-            d[user_id] = rank
+    cached = rank_cache.players(channel.id)
     for user_id in user_ids:
-        if user_id not in d.keys():
+        if user_id in cached and cached[user_id][0]:
+            d[user_id] = cached[user_id][0]
+        else:
             d[user_id] = channel.cfg["initial_rating"] or 1400
     return d
 
 
-def get_rank_details(channel_id, user_id=False, nick=False):
+@serialized
+def last_teammates(channel_id, user_ids):
+    """Pairs of `user_ids` who were teammates in either one's last match."""
+    seq = ",".join(["?"] * len(user_ids))
     c.execute(
-        "SELECT user_id, nick, rank, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL ORDER BY rank DESC",
-        (channel_id,),
+        "SELECT user_id, MAX(pickup_id) FROM player_pickups WHERE channel_id = ? AND user_id IN ({seq}) GROUP BY user_id".format(
+            seq=seq
+        ),
+        (channel_id, *user_ids),
     )
-    lb = c.fetchall()
-    for i in lb:
-        if i[0] == user_id or i[1].lower() == nick:
+    last = dict(c.fetchall())
+    if not last:
+        return set()
+
+    teams = {}
+    c.execute(
+        "SELECT pickup_id, user_id, team FROM player_pickups WHERE channel_id = ? AND pickup_id IN ({seq}) AND team IS NOT NULL".format(
+            seq=",".join(["?"] * len(set(last.values())))
+        ),
+        (channel_id, *set(last.values())),
+    )
+    for pickup_id, user_id, team in c.fetchall():
+        teams.setdefault((pickup_id, team), []).append(user_id)
+
+    pairs = set()
+    for (pickup_id, _), members in teams.items():
+        members = [i for i in members if i in last]
+        for a in members:
+            for b in members:
+                # counts when the match was the last one for either player
+                if a < b and pickup_id in (last[a], last[b]):
+                    pairs.add((a, b))
+    return pairs
+
+
+@serialized
+@memoized()
+def get_rank_details(channel_id, user_id=False, nick=False):
+    board = rank_cache.board(channel_id)
+    if board is not None:
+        if nick:
+            user_id = board.find(nick)
+        place = board.position(user_id)
+        if place is None:
+            return [None, None]
+        rank, nick, wins, loses = board.rows[user_id]
+        i = [place, nick, rank, wins, loses]
+    else:
+        # too many players to cache, count the better rated on the index
+        if nick:
             c.execute(
-                "SELECT pickup_id, at, pickup_name, rank_change FROM player_pickups WHERE user_id = ? AND channel_id = ? AND is_ranked = 1 ORDER BY pickup_id DESC LIMIT 3",
-                (i[0], channel_id),
+                "SELECT user_id, nick, rank, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND lower(nick) = ? ORDER BY rank DESC, user_id DESC LIMIT 1",
+                (channel_id, nick),
+            )
+        else:
+            c.execute(
+                "SELECT user_id, nick, rank, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND user_id = ?",
+                (channel_id, user_id),
             )
-            matches = c.fetchall()
-            place = lb.index(i) + 1
-            i = list(i)
-            i[0] = place  # replace user_id with ladder position
-            print(i)
-            return [i, matches]
-    return [None, None]
+        row = c.fetchone()
+        if row is None:
+            return [None, None]
+        user_id, *i = row
+        c.execute(
+            "SELECT COUNT(*) + 1 FROM channel_players WHERE channel_id = ? AND (rank > ? OR (rank = ? AND user_id > ?))",
+            (channel_id, i[1], i[1], user_id),
+        )
+        i.insert(0, c.fetchone()[0])
+
+    c.execute(
+        "SELECT pickup_id, at, pickup_name, rank_change FROM player_pickups WHERE user_id = ? AND channel_id = ? AND is_ranked = 1 ORDER BY pickup_id DESC LIMIT 3",
+        (user_id, channel_id),
+    )
+    return [i, c.fetchall()]
 
 
+@serialized
+@memoized()
 def get_ladder(channel_id, page):
+    board = rank_cache.board(channel_id)
+    if board is not None:
+        return board.page(page)
+    c.execute(
+        "SELECT rank, nick, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND wins+loses > 0 ORDER BY rank DESC, user_id DESC LIMIT 10 OFFSET ?",
+        (channel_id, page * 10),
+    )
+    return c.fetchall()
+
+
+@serialized
+@memoized()
+def get_ladder_around(channel_id, user_id, radius=5):
+    """(first place, ladder rows) around the player, (None, []) if unranked."""
+    board = rank_cache.board(channel_id)
+    if board is not None:
+        return board.around(user_id, radius)
     c.execute(
-        "SELECT rank, nick, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND wins+loses > 0 ORDER BY rank desc LIMIT ?",
-        (channel_id, (page + 1) * 10),
+        "SELECT place FROM (SELECT user_id, ROW_NUMBER() OVER (ORDER BY rank DESC, user_id DESC) AS place FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND wins+loses > 0) WHERE user_id = ?",
+        (channel_id, user_id),
+    )
+    row = c.fetchone()
+    if row is None:
+        return None, []
+    first = max(row[0] - radius, 1)
+    c.execute(
+        "SELECT rank, nick, wins, loses FROM channel_players WHERE channel_id = ? AND rank IS NOT NULL AND wins+loses > 0 ORDER BY rank DESC, user_id DESC LIMIT ? OFFSET ?",
+        (channel_id, row[0] + radius - first + 1, first - 1),
     )
-    return c.fetchall()[page * 10 :]
+    return first, c.fetchall()
 
 
+@serialized
+@memoized()
 def stats(channel_id, text=False):
     if not text:  # return overall stats
         c.execute(
-            "SELECT pickup_name, count(pickup_name) FROM pickups WHERE channel_id = ? GROUP BY pickup_name",
+            "SELECT pickup_name, sum(count) FROM pickup_days WHERE channel_id = ? GROUP BY pickup_name",
             (channel_id,),
         )
         l = c.fetchall()
@@ -432,7 +1087,7 @@ def stats(channel_id, text=False):
     else:
         # get total pickups count
         c.execute(
-            "SELECT count(channel_id) FROM pickups WHERE channel_id = ? GROUP BY channel_id",
+            "SELECT sum(count) FROM pickup_days WHERE channel_id = ? GROUP BY channel_id",
             (channel_id,),
         )
         l = c.fetchone()
@@ -443,7 +1098,7 @@ def stats(channel_id, text=False):
 
         # try to find by pickup_name
         c.execute(
-            "SELECT pickup_name, count(pickup_name) FROM pickups WHERE channel_id = ? AND pickup_name = ? COLLATE NOCASE GROUP BY pickup_name ",
+            "SELECT pickup_name, sum(count) FROM pickup_days WHERE channel_id = ? AND pickup_name = ? COLLATE NOCASE GROUP BY pickup_name ",
             (channel_id, text),
         )
         l = c.fetchone()
@@ -457,6 +1112,13 @@ def stats(channel_id, text=False):
                 (channel_id, text),
             )
             l = c.fetchone()
+            if l is None and name_search:
+                # the latest player with a nick starting with the text
+                c.execute(
+                    "SELECT r.user_id, r.nick FROM name_search JOIN pickup_roster r ON r.rowid = name_search.rowid WHERE name_search MATCH ? AND r.channel_id = ? AND r.user_id IS NOT NULL ORDER BY r.pickup_id DESC LIMIT 1",
+                    (search_query(text), channel_id),
+                )
+                l = c.fetchone()
             if l != None:
                 user_id = l[0]
                 user_name = l[1]
@@ -464,7 +1126,7 @@ def stats(channel_id, text=False):
                 return "Nothing found."
 
             c.execute(
-                "SELECT pickup_name, count(pickup_name) FROM player_pickups WHERE channel_id = ? AND user_id = ? GROUP BY pickup_name",
+                "SELECT pickup_name, sum(count) FROM player_days WHERE channel_id = ? AND user_id = ? GROUP BY pickup_name",
                 (channel_id, user_id),
             )
             l = c.fetchall()
@@ -479,27 +1141,31 @@ def stats(channel_id, text=False):
             )
 
 
+@serialized
+@memoized()
 def top(channel_id, timegap=False, pickup=False):
-    if timegap and pickup:
-        c.execute(
-            "SELECT user_name, count(user_id) FROM player_pickups WHERE channel_id = ? and pickup_name = ? and at > ? GROUP BY user_id ORDER by count(user_id) DESC LIMIT 10",
-            (channel_id, pickup, timegap),
-        )
-    elif timegap:
-        c.execute(
-            "SELECT user_name, count(user_id) FROM player_pickups WHERE channel_id = ? and at > ? GROUP BY user_id ORDER by count(user_id) DESC LIMIT 10",
-            (channel_id, timegap),
-        )
-    elif pickup:
-        c.execute(
-            "SELECT user_name, count(user_id) FROM player_pickups WHERE channel_id = ? and pickup_name = ? GROUP BY user_id ORDER by count(user_id) DESC LIMIT 10",
-            (channel_id, pickup),
-        )
-    else:
-        c.execute(
-            "SELECT user_name, count(user_id) FROM player_pickups WHERE channel_id = ? GROUP BY user_id ORDER by count(user_id) DESC LIMIT 10",
-            (channel_id,),
+    days = "SELECT user_id, user_name, count, day FROM player_days WHERE channel_id = ?"
+    args = [channel_id]
+    if pickup:
+        days += " AND pickup_name = ?"
+        args.append(pickup)
+    if timegap:
+        # whole days from the buckets, the day timegap falls in from player_pickups
+        first = timegap // DAY
+        days += " AND day > ? UNION ALL SELECT user_id, user_name, 1, at / {0} FROM player_pickups WHERE channel_id = ? AND at > ? AND at < ?".format(
+            DAY
         )
+        args += [first, channel_id, timegap, (first + 1) * DAY]
+        if pickup:
+            days += " AND pickup_name = ?"
+            args.append(pickup)
+    # the name from the latest day goes with max(day)
+    c.execute(
+        "SELECT user_name, sum(count) AS total, max(day) FROM ({0}) GROUP BY user_id ORDER BY total DESC LIMIT 10".format(
+            days
+        ),
+        args,
+    )
 
     l = c.fetchall()
     if len(l):
@@ -508,6 +1174,7 @@ def top(channel_id, timegap=False, pickup=False):
     return None
 
 
+@serialized
 def noadd(channel_id, user_id, user_name, duratation, author_name, reason=""):
     c.execute(
         "SELECT * FROM bans WHERE user_id = ? AND channel_id = ? AND active = 1",
@@ -519,7 +1186,8 @@ def noadd(channel_id, user_id, user_name, duratation, author_name, reason=""):
             "UPDATE bans SET at=?, duratation=?, author_name=?, reason=? WHERE user_id = ? AND channel_id = ? AND active = 1",
             (int(time()), duratation, author_name, reason, user_id, channel_id),
         )
-        conn.commit()
+        result_cache.invalidate(channel_id)
+        _commit()
         return "Updated {0}'s noadd to {1} from now.".format(
             user_name, str(timedelta(seconds=duratation))
         )
@@ -538,7 +1206,8 @@ def noadd(channel_id, user_id, user_name, duratation, author_name, reason=""):
                 author_name,
             ),
         )
-        conn.commit()
+        result_cache.invalidate(channel_id)
+        _commit()
         # Get a quote!
         c.execute("SELECT * FROM nukem_quotes ORDER BY RANDOM() LIMIT 1")
         quote = c.fetchone()
@@ -547,6 +1216,7 @@ def noadd(channel_id, user_id, user_name, duratation, author_name, reason=""):
         )
 
 
+@serialized
 def forgive(channel_id, user_id, user_name, unban_author_name):
     c.execute(
         "SELECT * FROM bans WHERE user_id = ? AND channel_id = ? AND active = 1",
@@ -558,11 +1228,14 @@ def forgive(channel_id, user_id, user_name, unban_author_name):
             "UPDATE bans SET active = 0, unban_author_name = ? WHERE user_id = ? AND channel_id = ? AND active = 1",
             (unban_author_name, user_id, channel_id),
         )
-        conn.commit()
+        result_cache.invalidate(channel_id)
+        _commit()
         return "{0} forgiven.".format(user_name)
     return "Ban not found!"
 
 
+@serialized
+@memoized(ttl=10)  # the time left in the text goes stale
 def noadds(channel_id, index=None):
     if index == None:
         c.execute(
@@ -594,6 +1267,7 @@ def noadds(channel_id, index=None):
     return bans_str
 
 
+@serialized
 def check_memberid(channel_id, user_id):  # check on bans and phrases
     # returns (bool is_banned, string phrase, int default_expire)
 
@@ -621,7 +1295,8 @@ def check_memberid(channel_id, user_id):  # check on bans and phrases
                 "UPDATE bans SET active = 0, unban_author_name = ? WHERE user_id = ? AND channel_id = ? AND active = 1",
                 ("time", user_id, channel_id),
             )
-            conn.commit()
+            result_cache.invalidate(channel_id)
+            _commit()
             return (False, "Be nice next time, please.", None)
 
     # no bans, find phrases!
@@ -645,6 +1320,7 @@ def check_memberid(channel_id, user_id):  # check on bans and phrases
 
 
 # get default user !expire time
+@serialized
 def get_expire(user_id):
     c.execute("SELECT default_expire FROM players WHERE user_id = ?", (user_id,))
     l = c.fetchone()
@@ -655,15 +1331,17 @@ def get_expire(user_id):
 
 
 # set default user !expire time
+@serialized
 def set_expire(user_id, seconds):
     # create user if not exists
     c.execute("INSERT OR IGNORE INTO players (user_id) VALUES (?)", (user_id,))
     c.execute(
         "UPDATE players SET default_expire = ? WHERE user_id = ?", (seconds, user_id)
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def set_phrase(channel_id, user_id, phrase):
     # create user if not exists
     c.execute(
@@ -674,9 +1352,10 @@ def set_phrase(channel_id, user_id, phrase):
         "UPDATE channel_players SET phrase = ? WHERE user_id = ? AND channel_id = ?",
         (phrase, user_id, channel_id),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def save_config(channel_id, cfg, pickups):
     c.execute(
         "INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
@@ -698,17 +1377,19 @@ def save_config(channel_id, cfg, pickups):
                 i.whitelist_role,
             ),
         )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def update_channel_config(channel_id, variable, value):
     c.execute(
         'UPDATE OR IGNORE channels SET "{0}" = ? WHERE channel_id = ?'.format(variable),
         (value, channel_id),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def update_pickup_config(channel_id, pickup_name, variable, value):
     c.execute(
         'UPDATE OR IGNORE pickup_configs SET "{0}" = ? WHERE channel_id = ? and pickup_name = ?'.format(
@@ -716,9 +1397,10 @@ def update_pickup_config(channel_id, pickup_name, variable, value):
         ),
         (value, channel_id, pickup_name),
     )
-    conn.commit()
+    _commit()
 
 
+@serialized
 def update_pickups(channel_id, pickups):
     for i in pickups:
         c.execute(
@@ -736,7 +1418,7 @@ def update_pickups(channel_id, pickups):
                 i.whitelist_role,
             ),
         )
-    conn.commit()
+    _commit()
 
 
 def check_db():
@@ -922,6 +1604,23 @@ def check_db():
             c.execute("ALTER TABLE `channels` ADD COLUMN `ready_expire` INTEGER")
             c.execute("ALTER TABLE `pickup_configs` ADD COLUMN `ready_expire` INTEGER")
 
+        if db_version < 15:
+            create_indexes()
+
+        if db_version < 16:
+            # the ladder is ordered by rank and user_id now
+            c.execute("DROP INDEX IF EXISTS `channel_players_rank`")
+            create_indexes()
+
+        if db_version < 17:
+            create_roster()
+            backfill_roster()
+            create_roster_indexes()
+
+        if db_version < 18:
+            create_counters()
+            rebuild_counters()
+
         c.execute(
             "INSERT OR REPLACE INTO utility (variable, value) VALUES ('version', ?)",
             (str(version),),
@@ -1117,12 +1816,380 @@ def create_tables():
         ],
     )
 
+    create_roster()
+    create_counters()
+    create_indexes()
+    create_roster_indexes()
+
     c.execute(
         "INSERT INTO utility (variable, value) VALUES ('version', ?)", (str(version),)
     )
     conn.commit()
 
 
-def close():
+def create_counters():
+    # matches per pickup and day, and games per player, pickup and day
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS `pickup_days`
+        ( `channel_id` INTEGER,
+        `pickup_name` TEXT,
+        `day` INTEGER,
+        `count` INTEGER,
+        PRIMARY KEY(`channel_id`, `pickup_name`, `day`) )"""
+    )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS `player_days`
+        ( `channel_id` INTEGER,
+        `user_id` INTEGER,
+        `pickup_name` TEXT,
+        `day` INTEGER,
+        `count` INTEGER,
+        `user_name` TEXT,
+        PRIMARY KEY(`channel_id`, `user_id`, `pickup_name`, `day`) )"""
+    )
+    # covering, !top reads nothing else
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_days_day`
+        ON `player_days` (`channel_id`, `day`, `user_id`, `count`, `user_name`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_days_pickup`
+        ON `player_days` (`channel_id`, `pickup_name`, `day`, `user_id`, `count`, `user_name`)"""
+    )
+
+
+def counter_filter(channel_id):
+    if channel_id is None:
+        return "", ()
+    return "WHERE channel_id = ?", (channel_id,)
+
+
+@serialized
+def rebuild_counters(channel_id=None):
+    """Recount pickup_days and player_days from pickups and player_pickups."""
+    where, args = counter_filter(channel_id)
+    c.execute("DELETE FROM pickup_days {0}".format(where), args)
+    c.execute("DELETE FROM player_days {0}".format(where), args)
+    c.execute(
+        "INSERT INTO pickup_days (channel_id, pickup_name, day, count) SELECT channel_id, pickup_name, at / {0}, count(*) FROM pickups {1} GROUP BY channel_id, pickup_name, at / {0}".format(
+            DAY, where
+        ),
+        args,
+    )
+    # the name from the latest row goes with max(rowid)
+    c.execute(
+        "INSERT INTO player_days (channel_id, user_id, pickup_name, day, count, user_name) SELECT channel_id, user_id, pickup_name, day, n, user_name FROM (SELECT channel_id, user_id, pickup_name, at / {0} AS day, count(*) AS n, user_name, max(rowid) FROM player_pickups {1} GROUP BY channel_id, user_id, pickup_name, at / {0})".format(
+            DAY, where
+        ),
+        args,
+    )
+    result_cache.invalidate(channel_id)
+    _commit()
+    c.execute("SELECT count(*) FROM pickup_days {0}".format(where), args)
+    pickup_rows = c.fetchone()[0]
+    c.execute("SELECT count(*) FROM player_days {0}".format(where), args)
+    return pickup_rows, c.fetchone()[0]
+
+
+@serialized
+def check_counters(channel_id=None):
+    """(pickup_days rows, player_days rows) that differ from a fresh count."""
+    where, args = counter_filter(channel_id)
+    counts = []
+    for table, source, keys in (
+        ("pickup_days", "pickups", "channel_id, pickup_name, day"),
+        ("player_days", "player_pickups", "channel_id, user_id, pickup_name, day"),
+    ):
+        stored = "SELECT {0}, count FROM {1} {2}".format(keys, table, where)
+        counted = "SELECT {0}, count(*) AS count FROM (SELECT *, at / {1} AS day FROM {2} {3}) GROUP BY {0}".format(
+            keys, DAY, source, where
+        )
+        # a key with a wrong count is on both sides, a missing one on one side
+        c.execute(
+            "SELECT count(*) FROM (SELECT {0} FROM ({1} EXCEPT {2}) UNION SELECT {0} FROM ({2} EXCEPT {1}))".format(
+                keys, stored, counted
+            ),
+            args * 4,
+        )
+        counts.append(c.fetchone()[0])
+    return tuple(counts)
+
+
+def create_roster():
+    # one row per player of a match, pickups.players is kept for display
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS `pickup_roster`
+        ( `pickup_id` INTEGER,
+        `channel_id` INTEGER,
+        `user_id` INTEGER,
+        `nick` TEXT,
+        `team` TEXT )"""
+    )
+
+
+def create_roster_indexes():
+    # shaped after the player search in lastgame()
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `pickup_roster_user`
+        ON `pickup_roster` (`channel_id`, `user_id`, `pickup_id`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `pickup_roster_nick`
+        ON `pickup_roster` (`channel_id`, `nick` COLLATE NOCASE, `pickup_id`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `channel_players_nick`
+        ON `channel_players` (`channel_id`, `nick` COLLATE NOCASE)"""
+    )
+
+
+def backfill_roster(batch=1000):
+    """Fill pickup_roster from player_pickups, `batch` matches at a time.
+
+    Players without a player_pickups row (unpicked ones) are taken from the
+    nick string in pickups, kept by nick only and split on spaces as there
+    is nothing better to go by.
+    """
+    last = -(2**63)
+    while True:
+        c.execute(
+            "SELECT pickup_id, channel_id, players, alpha_players, beta_players FROM pickups WHERE pickup_id > ? ORDER BY pickup_id LIMIT ?",
+            (last, batch),
+        )
+        pickups = c.fetchall()
+        if not pickups:
+            return
+        last = pickups[-1][0]
+
+        known = {}  # {pickup_id: [(user_id, user_name, team), ...]}
+        for channel_id in {row[1] for row in pickups}:
+            c.execute(
+                "SELECT pickup_id, user_id, user_name, team FROM player_pickups WHERE channel_id = ? AND pickup_id BETWEEN ? AND ?",
+                (channel_id, pickups[0][0], last),
+            )
+            for pickup_id, user_id, user_name, team in c.fetchall():
+                known.setdefault(pickup_id, []).append((user_id, user_name, team))
+
+        rows = []
+        for pickup_id, channel_id, players, alpha, beta in pickups:
+            alpha = " {0} ".format(alpha or "")
+            beta = " {0} ".format(beta or "")
+            words = (players or "").split()
+            for user_id, nick, team in known.get(pickup_id, ()):
+                unsplit(words, nick)
+                if team is None:
+                    team = roster_team(nick, alpha, beta)
+                rows.append((pickup_id, channel_id, user_id, nick, team))
+            for nick in words:
+                team = roster_team(nick, alpha, beta)
+                rows.append((pickup_id, channel_id, None, nick, team))
+        c.executemany(
+            "INSERT INTO pickup_roster (pickup_id, channel_id, user_id, nick, team) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+def unsplit(words, nick):
+    """Take the words of nick out of a split nick string, if they are there."""
+    parts = (nick or "").split()
+    for i in range(len(words) - len(parts) + 1):
+        if parts and words[i : i + len(parts)] == parts:
+            del words[i : i + len(parts)]
+            return
+
+
+def roster_team(nick, alpha, beta):
+    if " {0} ".format(nick) in alpha:
+        return "alpha"
+    if " {0} ".format(nick) in beta:
+        return "beta"
+    return None
+
+
+def fts5_available():
+    try:
+        c.execute("CREATE VIRTUAL TABLE temp.`fts5_probe` USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    c.execute("DROP TABLE temp.`fts5_probe`")
+    return True
+
+
+def setup_search():
+    """Keep the FTS5 index of pickup_roster nicks, when sqlite has FTS5.
+
+    Not a versioned migration: the same database may be opened by a sqlite
+    without FTS5, its triggers are dropped then and the index is rebuilt
+    the next time FTS5 is around.
+    """
+    global name_search
+    c.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'name_search_%'"
+    )
+    triggers = {row[0] for row in c.fetchall()}
+    name_search = fts5_available()
+    if not name_search:
+        for name in triggers:
+            c.execute("DROP TRIGGER `{0}`".format(name))
+        if triggers:
+            console.display(
+                "DATABASE| FTS5 is missing, player search falls back to LIKE."
+            )
+        conn.commit()
+        return
+    if triggers == {"name_search_insert", "name_search_delete"}:
+        return
+
+    # unicode61 folds case, "name"* matches any word of a nick by prefix
+    c.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS `name_search`
+        USING fts5(nick, content='pickup_roster', content_rowid='rowid')"""
+    )
+    c.execute(
+        """CREATE TRIGGER IF NOT EXISTS `name_search_insert` AFTER INSERT ON `pickup_roster`
+        BEGIN
+            INSERT INTO name_search (rowid, nick) VALUES (new.rowid, new.nick);
+        END"""
+    )
+    c.execute(
+        """CREATE TRIGGER IF NOT EXISTS `name_search_delete` AFTER DELETE ON `pickup_roster`
+        BEGIN
+            INSERT INTO name_search (name_search, rowid, nick) VALUES ('delete', old.rowid, old.nick);
+        END"""
+    )
+    c.execute("INSERT INTO name_search (name_search) VALUES ('rebuild')")
     conn.commit()
-    conn.close()
+
+
+def search_query(text):
+    # one quoted phrase, the last word matched by prefix
+    return '"{0}"*'.format(text.replace('"', '""'))
+
+
+def create_indexes():
+    # shaped after the queries in top(), stats(), lastgame(), undo_ranks(),
+    # get_rank_details() and check_memberid()
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_pickups_at`
+        ON `player_pickups` (`channel_id`, `at`, `user_id`, `user_name`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_pickups_user`
+        ON `player_pickups` (`channel_id`, `user_id`, `pickup_id`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_pickups_pickup`
+        ON `player_pickups` (`channel_id`, `pickup_id`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_pickups_user_name`
+        ON `player_pickups` (`channel_id`, `user_name` COLLATE NOCASE)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `player_pickups_pickup_name`
+        ON `player_pickups` (`channel_id`, `pickup_name`, `at`, `user_id`, `user_name`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `pickups_pickup_name`
+        ON `pickups` (`channel_id`, `pickup_name`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `bans_user`
+        ON `bans` (`channel_id`, `user_id`, `active`)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS `channel_players_ladder`
+        ON `channel_players` (`channel_id`, `rank`, `user_id`)"""
+    )
+
+
+# async versions of the queries run from chat commands
+async def a_register_pickup(match):
+    return await run_async(register_pickup, match)
+
+
+async def a_check_memberid(channel_id, user_id):
+    return await run_async(check_memberid, channel_id, user_id)
+
+
+async def a_lastgame(channel_id, text=False, offset=0):
+    return await run_async(lastgame, channel_id, text, offset)
+
+
+async def a_stats(channel_id, text=False):
+    return await run_memoized(stats, channel_id, text)
+
+
+async def a_top(channel_id, timegap=False, pickup=False):
+    return await run_memoized(top, channel_id, timegap, pickup)
+
+
+async def a_get_ladder(channel_id, page):
+    return await run_memoized(get_ladder, channel_id, page)
+
+
+async def a_get_ladder_around(channel_id, user_id, radius=5):
+    return await run_memoized(get_ladder_around, channel_id, user_id, radius)
+
+
+async def a_get_rank_details(channel_id, user_id=False, nick=False):
+    return await run_memoized(get_rank_details, channel_id, user_id, nick)
+
+
+async def a_noadds(channel_id, index=None):
+    return await run_memoized(noadds, channel_id, index)
+
+
+async def a_noadd(channel_id, user_id, user_name, duratation, author_name, reason=""):
+    return await run_async(
+        noadd, channel_id, user_id, user_name, duratation, author_name, reason
+    )
+
+
+async def a_forgive(channel_id, user_id, user_name, unban_author_name):
+    return await run_async(forgive, channel_id, user_id, user_name, unban_author_name)
+
+
+async def a_set_phrase(channel_id, user_id, phrase):
+    return await run_async(set_phrase, channel_id, user_id, phrase)
+
+
+async def a_get_expire(user_id):
+    return await run_async(get_expire, user_id)
+
+
+async def a_set_expire(user_id, seconds):
+    return await run_async(set_expire, user_id, seconds)
+
+
+async def a_get_ranks(channel, user_ids):
+    return await run_async(get_ranks, channel, user_ids)
+
+
+async def a_seed_player(channel_id, user_id, rating):
+    return await run_async(seed_player, channel_id, user_id, rating)
+
+
+async def a_undo_ranks(channel_id, match_id):
+    return await run_async(undo_ranks, channel_id, match_id)
+
+
+async def a_reset_ranks(channel_id):
+    return await run_async(reset_ranks, channel_id)
+
+
+async def a_reset_stats(channel_id):
+    return await run_async(reset_stats, channel_id)
+
+
+def close():
+    global executor, conn
+    # let queued work finish before the connection goes away
+    if executor is not None:
+        executor.shutdown(wait=True)
+        executor = None
+    with lock:
+        flush()
+        conn.commit()
+        conn.close()
+        conn = None
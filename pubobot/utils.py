@@ -23,22 +23,28 @@ def format_timestring(timelist):
 
 
 def split_large_message(text, delimiter="\n", charlimit=1999):
-    templist = text.split(delimiter)
-    tempstr = ""
+    """Split text on `delimiter` into chunks no longer than `charlimit`."""
     result = []
-    print(templist)
-    for i in range(0, len(templist)):
-        tempstr += templist[i]
-        msglen = len(tempstr)
-        if msglen >= charlimit:
-            raise ("Text split failed!")
-        elif i + 1 < len(templist):
-            tempstr += delimiter
-            if msglen + len(templist[i + 1]) >= charlimit - 2:
+    tempstr = None
+    for part in text.split(delimiter):
+        # a single part that does not fit is cut up as it is
+        while len(part) > charlimit:
+            if tempstr is not None:
                 result.append(tempstr)
-                tempstr = ""
-        else:
+                tempstr = None
+            result.append(part[:charlimit])
+            part = part[charlimit:]
+
+        if tempstr is None:
+            tempstr = part
+        elif len(tempstr) + len(delimiter) + len(part) > charlimit:
             result.append(tempstr)
+            tempstr = part
+        else:
+            tempstr += delimiter + part
+
+    if tempstr is not None:
+        result.append(tempstr)
     return result
 
 
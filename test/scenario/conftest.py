@@ -34,6 +34,9 @@ async def pbot_client(tmp_path, time_mock):
     bot.init()
     stats3.init(db)
     config.init()
+    # scenarios assert the order of messages across channels and DMs
+    config.cfg.SEND_CONCURRENCY = 1
+    config.cfg.SEND_RATE = 0
     client.init()
 
     dpytest.configure(client.c, num_guilds=0, num_channels=0, num_members=0)
@@ -57,6 +60,7 @@ async def pbot_client(tmp_path, time_mock):
 
     yield client.c
 
+    assert bot.check_index() == ()
     console.terminate()
     await background_task
     await dpytest.empty_queue()
@@ -229,6 +233,7 @@ class Message:
         for _ in range(self.collect):
             msg = await self.messenger.get_message()
             self.responses.append(msg)
+        assert bot.check_index() == ()
 
         if self.collect == 1:
             return self.responses[0]
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+import discord.ext.test as dpytest
+
+from pubobot import bot, stats3
+
+
+async def settle():
+    await asyncio.sleep(0.05)
+    await dpytest.empty_queue()
+
+
+async def play(pbot, players):
+    for player in players:
+        await pbot.send_message("!j elim", player)
+    await settle()
+
+
+@pytest.mark.asyncio
+@pytest.mark.scenario(guild="Example", channel="General", members=10)
+@pytest.mark.pickup(
+    name="elim",
+    players=8,
+    config={"pick_teams": "auto"},
+)
+async def test_ranked_auto_teams_split_last_teammates(pbot, pickup):
+    players = pbot.members[: pickup.players]
+
+    # unranked auto teams are random and the match ends right away
+    await play(pbot, players)
+    stats3.submit(lambda: None).result()  # the match is stored
+    alpha = {
+        user_id
+        for (user_id,) in stats3.conn.execute(
+            "SELECT user_id FROM player_pickups WHERE team = 'alpha'"
+        )
+    }
+
+    # everyone is rated the same, only the last teams tell the splits apart
+    await pbot.send_message("!set_pickups elim ranked 1", pbot.admin)
+    await play(pbot, players)
+    match = bot.active_matches[-1]
+    for team in (match.alpha_team, match.beta_team):
+        assert len(team) == 4
+        assert len([player for player in team if player.id in alpha]) == 2
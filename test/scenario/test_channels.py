@@ -0,0 +1,42 @@
+import pytest
+import asyncio
+
+import discord.ext.test as dpytest
+
+from pubobot import bot
+
+pytestmark = [
+    pytest.mark.asyncio,
+    pytest.mark.scenario(guild="Example", channel="General", members=10),
+    pytest.mark.pickup(name="elim", players=8),
+]
+
+
+async def nothing_sent():
+    # time.time is mocked, so give the loop a few real frames instead
+    await asyncio.sleep(0.05)
+    return dpytest.sent_queue.empty()
+
+
+async def test_messages_reach_only_pickup_channels(pbot, pickup):
+    assert bot.channels_by_id == {channel.id: channel for channel in bot.channels}
+
+    offtopic = dpytest.back.make_text_channel("offtopic", pbot.guild)
+    await dpytest.message("!j elim", channel=offtopic, member=pbot.members[0])
+    assert await nothing_sent()
+
+    async with pbot.interact("!j elim", 1) as msg:
+        assert "(1/8)" in msg.content
+
+    async with pbot.interact("!disable_pickups", pbot.admin) as msg:
+        assert "have been disabled" in msg.content
+    assert bot.channels == [] and bot.channels_by_id == {}
+
+    await pbot.send_message("!j elim", 2)
+    assert await nothing_sent()
+
+    async with pbot.interact("!enable_pickups", pbot.admin):
+        pass
+    assert list(bot.channels_by_id) == [pbot.channel.id]
+    async with pbot.interact("!enable_pickups", pbot.admin) as msg:
+        assert "allready have pickups configured" in msg.content
@@ -0,0 +1,84 @@
+import pytest
+import asyncio
+
+import discord
+
+from pubobot import config
+from matcher import PickStageMatcher
+
+
+# Mark each test in this module
+pytestmark = [
+    pytest.mark.asyncio,
+    pytest.mark.scenario(guild="Example", channel="General", members=10),
+    pytest.mark.pickup(
+        name="elim",
+        players=8,
+        config={
+            "pick_captains": "2",
+            "pick_teams": "manual",
+            "pick_order": "abbaab",
+            "require_ready": "60s",
+        },
+    ),
+]
+
+emoji_ready = "☑"
+
+
+@pytest.fixture
+def edits(monkeypatch):
+    """Count the HTTP edit requests that reach discord."""
+    calls = []
+    original = discord.Message.edit
+
+    async def edit(self, **fields):
+        calls.append(fields.get("content"))
+        return await original(self, **fields)
+
+    monkeypatch.setattr(discord.Message, "edit", edit)
+    return calls
+
+
+async def fill_pickup(pbot, players):
+    for player in players:
+        await pbot.send_message("!j elim", player)
+        await pbot.get_message()
+
+    # DMs, the topic and finally the ready message
+    for _ in range(len(players) + 1):
+        await pbot.get_message()
+    return await pbot.get_message()
+
+
+@pytest.mark.parametrize("debounce,expected", [(0, 7), (0.25, 1)])
+async def test_ready_edits_are_debounced(pbot, pickup, edits, debounce, expected):
+    config.cfg.EDIT_DEBOUNCE = debounce
+    players = pbot.members[: pickup.players]
+    ready_msg = await fill_pickup(pbot, players)
+
+    # everyone but the last player checks in at the same moment
+    for p in players[:-1]:
+        await pbot.react(p, ready_msg, emoji_ready)
+
+    pbot.time_travel(1)
+    await asyncio.sleep(0.05)
+
+    # one edit per reaction without debouncing, a single one with it
+    assert len(edits) == expected
+    assert "Waiting on: <@{0}>.".format(players[-1].id) in edits[-1]
+
+
+async def test_last_ready_is_not_delayed(pbot, pickup, edits):
+    config.cfg.EDIT_DEBOUNCE = 0.25
+    players = pbot.members[: pickup.players]
+    ready_msg = await fill_pickup(pbot, players)
+
+    for p in players:
+        await pbot.react(p, ready_msg, emoji_ready)
+
+    # no time has passed, the pending edit is dropped and the match starts
+    matcher = PickStageMatcher()
+    async with pbot.message() as msg:
+        assert matcher.match_start(msg.content)
+    assert edits == []
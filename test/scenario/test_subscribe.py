@@ -0,0 +1,18 @@
+import pytest
+
+pytestmark = [
+    pytest.mark.asyncio,
+    pytest.mark.scenario(guild="Example", channel="General", members=10),
+    pytest.mark.pickup(name="Elim", players=8),
+]
+
+
+async def test_subscribe_without_promotion_role(pbot, pickup):
+    async with pbot.interact("!subscribe elim", 1) as msg:
+        assert "Promotion role for 'Elim' pickup is not set." in msg.content
+
+    async with pbot.interact("!unsubscribe ELIM", 1) as msg:
+        assert "Promotion role for 'Elim' pickup is not set." in msg.content
+
+    async with pbot.interact("!subscribe ctf", 1) as msg:
+        assert "Pickup 'ctf' not found on this channel." in msg.content
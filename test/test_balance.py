@@ -0,0 +1,117 @@
+import random
+import time
+from itertools import combinations
+
+import pytest
+
+from pubobot import balance
+
+
+def imbalance(ratings, team):
+    return abs(2 * sum(ratings[i] for i in team) - sum(ratings))
+
+
+def brute_force(ratings, size):
+    return min(
+        imbalance(ratings, team) for team in combinations(range(len(ratings)), size)
+    )
+
+
+@pytest.mark.parametrize("players", range(2, 15))
+def test_exact_split_is_optimal(players):
+    rnd = random.Random(players)
+    for _ in range(20):
+        ratings = [rnd.randint(800, 2200) for _ in range(players)]
+        team = balance.split(ratings, engine="exact")
+
+        assert len(team) == players // 2 == len(set(team))
+        assert imbalance(ratings, team) == brute_force(ratings, players // 2)
+
+
+def test_split_honours_team_size():
+    ratings = [1400, 1500, 1600, 1700, 1800]
+    for engine in balance.engines:
+        assert len(balance.split(ratings, 2, engine=engine)) == 2
+        assert len(balance.split(ratings, 3, engine=engine)) == 3
+
+
+def test_local_split_is_close_and_deterministic():
+    rnd = random.Random(0)
+    ratings = [rnd.randint(800, 2200) for _ in range(24)]
+    team = balance.split(ratings, engine="local", seed=1)
+
+    assert team == balance.split(ratings, engine="local", seed=1)
+    assert len(team) == 12
+    assert (
+        imbalance(ratings, team)
+        <= imbalance(ratings, balance.split(ratings, engine="exact")) + 2 * 50
+    )
+
+
+def test_auto_falls_back_when_out_of_time():
+    rnd = random.Random(0)
+    ratings = [rnd.randint(800, 2200) for _ in range(32)]
+    team = balance.split(ratings, budget=1e-9, seed=1)
+
+    assert team == balance.split(ratings, engine="local", seed=1)
+
+
+def objectives(players=24, **weights):
+    rnd = random.Random(players)
+    ratings = [rnd.randint(800, 2200) for _ in range(players)]
+    # everyone's last match had them in blocks of four
+    teammates = [
+        (a, b)
+        for a in range(players)
+        for b in range(a + 1, players)
+        if a // 4 == b // 4
+    ]
+    return balance.Objectives(ratings, [0, 1], teammates, **weights)
+
+
+def test_swaps_track_the_full_cost():
+    goal = objectives()
+    team, cost = balance.descend(goal, range(12))
+    assert cost == pytest.approx(goal.cost(team))
+    assert cost < goal.cost(range(12))
+
+
+def test_arrange_meets_the_constraints():
+    goal = objectives()
+    # enough time for the exact seed split, so the result only depends on seed
+    team = balance.arrange(goal, budget=1, seed=1)
+    rating, spread, captain, repeat = goal.parts(team)
+
+    assert len(team) == 12
+    assert captain == 0
+    assert repeat == 12  # two of each block of four on either team
+    assert rating <= 50
+    assert team == balance.arrange(goal, budget=1, seed=1)
+
+
+def test_arrange_prefers_even_spread():
+    goal = objectives(8, repeat=0, spread=1)
+    team = balance.arrange(goal, seed=1)
+    assert goal.cost(team) == min(goal.cost(team) for team in combinations(range(8), 4))
+
+
+@pytest.mark.parametrize("players", range(2, 11))
+def test_arrange_finds_the_exact_optimum_for_small_rosters(players):
+    rnd = random.Random(players)
+    for _ in range(20):
+        ratings = [rnd.randint(800, 2200) for _ in range(players)]
+        splits = list(combinations(range(players), players // 2))
+
+        goal = balance.Objectives(ratings)
+        team = balance.arrange(goal)
+        assert goal.cost(team) == min(goal.cost(team) for team in splits)
+
+        team = balance.arrange(balance.Objectives(ratings, spread=0))
+        assert imbalance(ratings, team) == brute_force(ratings, players // 2)
+
+
+def test_arrange_is_fast_for_24_players():
+    goal = objectives()
+    start = time.perf_counter()
+    balance.arrange(goal, budget=0.05)
+    assert time.perf_counter() - start < 0.1
@@ -0,0 +1,228 @@
+import time
+import asyncio
+import itertools
+from unittest.mock import Mock, patch
+
+import discord
+import pytest
+import pytest_asyncio
+
+from pubobot import client, config, scheduler
+
+ids = itertools.count(1)
+
+
+class FakeChannel:
+    """Stand-in for a discord channel, each send takes `latency` seconds."""
+
+    def __init__(self, name="fake", latency=0):
+        self.id = next(ids)
+        self.name = name
+        self.latency = latency
+        self.sent = []
+
+    async def send(self, content):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((time.monotonic(), content))
+        return content
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clean_client():
+    config.init()
+    config.cfg.SEND_RATE = 0
+    client.init()
+    yield
+    if client.sender_task:
+        client.sender_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await client.sender_task
+    client.init()
+
+
+async def wait_for_sent(*channels, count=1):
+    for _ in range(1000):
+        if all(len(channel.sent) >= count for channel in channels):
+            return
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_sender_delivers_without_polling():
+    channel = FakeChannel()
+    client.start_sender()
+    await asyncio.sleep(0)
+
+    queued = time.monotonic()
+    client.notice(channel, "hello")
+    await wait_for_sent(channel)
+
+    assert [content for _, content in channel.sent] == ["hello"]
+    assert channel.sent[0][0] - queued < 0.05
+
+
+@pytest.mark.asyncio
+async def test_sender_survives_bad_entries():
+    channel = FakeChannel()
+    client.start_sender()
+    await asyncio.sleep(0)
+
+    client.queue_send(channel.send, None, channel.id)  # kwargs.pop fails
+    client.notice(channel, "still alive")
+    await wait_for_sent(channel)
+
+    assert [content for _, content in channel.sent] == ["still alive"]
+
+
+@pytest.mark.asyncio
+async def test_send_keeps_order_within_a_channel():
+    channels = [FakeChannel(latency=0.001 * i) for i in range(3)]
+    for i in range(5):
+        for channel in channels:
+            client.notice(channel, str(i))
+
+    assert client.queue_depth() == 15
+    assert client.queue_depth(channels[0].id) == 5
+
+    await client.send()
+    for channel in channels:
+        assert [content for _, content in channel.sent] == list("01234")
+    assert client.queue_depth() == 0
+
+
+@pytest.mark.asyncio
+async def test_send_throughput_scales_with_channels():
+    async def timed(count):
+        client.init()
+        channels = [FakeChannel(latency=0.02) for _ in range(count)]
+        for channel in channels:
+            for i in range(5):
+                client.notice(channel, str(i))
+        start = time.monotonic()
+        await client.send()
+        return time.monotonic() - start
+
+    one = await timed(1)
+    eight = await timed(8)
+    # 8 times the messages, but the channels drain side by side
+    assert eight < one * 3
+
+
+@pytest.mark.asyncio
+async def test_send_concurrency_is_bounded():
+    config.cfg.SEND_CONCURRENCY = 2
+    client.init()
+    in_flight = []
+    peak = []
+
+    async def send(content):
+        in_flight.append(content)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.005)
+        in_flight.remove(content)
+
+    for i in range(6):
+        client.queue_send(send, {"content": i}, i)
+    await client.send()
+
+    assert max(peak) == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_channel_does_not_stall_others():
+    config.cfg.SEND_RATE = 1
+    config.cfg.SEND_RATE_PERIOD = 0.2
+    client.init()
+    busy, quiet = FakeChannel(), FakeChannel()
+    for i in range(3):
+        client.notice(busy, str(i))
+    client.notice(quiet, "hi")
+
+    start = time.monotonic()
+    await client.send()
+
+    # the busy channel waits for its bucket, the quiet one goes right away
+    assert quiet.sent[0][0] - start < 0.05
+    assert busy.sent[-1][0] - start >= 0.35
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_is_retried():
+    config.cfg.SEND_RATE_PERIOD = 0.01
+    client.init()
+    channel = FakeChannel()
+    calls = []
+
+    async def send(content):
+        calls.append(content)
+        if len(calls) == 1:
+            raise discord.HTTPException(Mock(status=429, reason="Too Many"), "slow")
+        return await channel.send(content)
+
+    client.queue_send(send, {"content": "retry me"}, channel.id)
+    await client.send()
+
+    assert calls == ["retry me", "retry me"]
+    assert [content for _, content in channel.sent] == ["retry me"]
+
+
+@pytest.fixture
+def coalesce(time_mock):
+    config.cfg.COALESCE_NOTICES = 1
+    config.cfg.COALESCE_WINDOW = 0.5
+    scheduler.init()
+    yield time_mock
+    scheduler.init()
+
+
+@pytest.fixture
+def time_mock():
+    with patch("time.time") as mock:
+        mock.return_value = 0
+        yield mock
+
+
+@pytest.mark.asyncio
+async def test_notices_are_merged_within_the_window(coalesce):
+    channel = FakeChannel()
+    client.notice(channel, "**elim** (7/8)")
+    client.notice(channel, "Only 1 player left")
+    await client.send()
+    assert channel.sent == []
+
+    scheduler.run(1)
+    await client.send()
+    assert [content for _, content in channel.sent] == [
+        "**elim** (7/8)\nOnly 1 player left"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_notice_with_callback_flushes_held_notices_first(coalesce):
+    channel = FakeChannel()
+    results = []
+    client.notice(channel, "first")
+    client.notice(channel, "ready check", callback=results.append)
+    client.reply(channel, Mock(id=1, nick="nick"), "hi")
+    await client.send()
+
+    assert [content for _, content in channel.sent] == [
+        "first",
+        "ready check",
+        "<@1>, hi",
+    ]
+    assert results == ["ready check"]
+    assert "notices#{0}".format(channel.id) not in scheduler.tasks
+
+
+@pytest.mark.asyncio
+async def test_merged_notices_respect_the_length_limit(coalesce):
+    channel = FakeChannel()
+    for _ in range(3):
+        client.notice(channel, "x" * 900)
+    scheduler.run(1)
+    await client.send()
+
+    sent = [content for _, content in channel.sent]
+    assert sent == ["x" * 900 + "\n" + "x" * 900, "x" * 900]
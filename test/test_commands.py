@@ -0,0 +1,86 @@
+import inspect
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from pubobot import bot
+from pubobot.bot import Call, Channel
+
+
+def make_channel(**cfg):
+    channel = Channel.__new__(Channel)
+    channel.cfg = {"prefix": "!", "ranked": 0, **cfg}
+    channel.channel = Mock()
+    for name, method in inspect.getmembers(Channel, inspect.isfunction):
+        if name != "processmsg":
+            is_async = inspect.iscoroutinefunction(method)
+            setattr(channel, name, AsyncMock() if is_async else Mock())
+    channel.access_level.return_value = 0
+    return channel
+
+
+def message(content):
+    return SimpleNamespace(
+        content=content,
+        author=Mock(display_name="player"),
+        guild="guild",
+        channel="channel",
+    )
+
+
+@pytest.mark.parametrize("name", sorted(bot.commands))
+def test_async_flag_matches_the_handler(name):
+    command = bot.commands[name]
+    channel = Mock(spec=Channel)
+    channel.cfg = {"capfor_enabled": 1}
+    channel.channel = Mock()
+    call = Call(message("!" + name), Mock(), ["a", "b", "c"], ["a", "b", "c"], 2)
+    with patch("pubobot.client.reply"):
+        result = command.handler(channel, call)
+    assert inspect.isawaitable(result) == command.is_async
+    if inspect.iscoroutine(result):
+        result.close()
+
+
+@pytest.mark.asyncio
+async def test_dispatch():
+    channel = make_channel()
+
+    await channel.processmsg(message("hello !j"))
+    await channel.processmsg(message("?j elim"))
+    channel.add_player.assert_not_called()
+    channel.access_level.assert_not_called()
+
+    await channel.processmsg(message("!J Elim"))
+    assert channel.add_player.call_args[0][1] == ["elim"]
+    await channel.processmsg(message("+elim ctf"))
+    assert channel.add_player.call_args[0][1] == ["elim", "ctf"]
+    await channel.processmsg(message("--"))
+    assert channel.remove_player.call_args[0][1] == []
+
+    await channel.processmsg(message("!lasttt ExamplePlayer"))
+    assert channel.lastgame.call_args[0][1:] == (["ExamplePlayer"], 2)
+    await channel.processmsg(message("!lasttttttttt"))
+    assert channel.lastgame.await_count == 1
+
+    await channel.processmsg(message("!forgive a b"))
+    channel.forgive.assert_not_called()
+    await channel.processmsg(message("!forgive <@1>"))
+    assert channel.forgive.call_args[0][1:] == ("<@1>", 0)
+    assert channel.access_level.call_count == 1
+
+    await channel.processmsg(message("!lb 2"))
+    channel.get_leaderboard.assert_not_called()
+    channel.cfg["ranked"] = 1
+    await channel.processmsg(message("!lb 2"))
+    assert channel.get_leaderboard.call_args[0][1] == ["2"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_follows_the_prefix():
+    channel = make_channel(prefix=".")
+    await channel.processmsg(message("!who"))
+    channel.who.assert_not_called()
+    await channel.processmsg(message(".who elim"))
+    assert channel.who.call_args[0][1] == ["elim"]
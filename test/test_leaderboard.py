@@ -0,0 +1,70 @@
+import random
+
+from pubobot.leaderboard import Leaderboard
+
+
+def reference(rows):
+    rated = sorted(
+        (user_id for user_id, row in rows.items() if row[0] is not None),
+        key=lambda i: (-rows[i][0], -i),
+    )
+    ladder = [
+        i
+        for i in rated
+        if rows[i][2] is not None
+        and rows[i][3] is not None
+        and rows[i][2] + rows[i][3] > 0
+    ]
+    return rated, ladder
+
+
+def random_row(rnd, user_id):
+    rank = rnd.choice([None, rnd.randint(1000, 2000)])
+    games = rnd.choice([None, 0, rnd.randint(1, 20)])
+    wins = None if games is None else rnd.randint(0, games)
+    loses = None if games is None else games - wins
+    return (rank, "nick{0}".format(user_id % 40), wins, loses)
+
+
+def test_matches_a_sorted_ladder_through_updates():
+    rnd = random.Random(0)
+    rows = {user_id: random_row(rnd, user_id) for user_id in range(200)}
+    board = Leaderboard((user_id, *row) for user_id, row in rows.items())
+
+    for step in range(500):
+        user_id = rnd.randrange(250)
+        rows[user_id] = random_row(rnd, user_id)
+        board.update(user_id, *rows[user_id])
+
+        if step % 50:
+            continue
+        rated, ladder = reference(rows)
+        for place, user_id in enumerate(rated, 1):
+            assert board.position(user_id) == place
+        for page in range(len(ladder) // 10 + 2):
+            assert board.page(page) == [
+                rows[i] for i in ladder[page * 10 : (page + 1) * 10]
+            ]
+        for i, user_id in enumerate(ladder):
+            first, around = board.around(user_id, 3)
+            start = max(i - 3, 0)
+            assert first == start + 1
+            assert around == [rows[u] for u in ladder[start : i + 4]]
+
+
+def test_find_by_nick_picks_the_best_rated():
+    board = Leaderboard(
+        [
+            (1, 1500, "Same", 1, 0),
+            (2, 1700, "same", 1, 0),
+            (3, None, "same", None, None),
+            (4, 1600, "other", 1, 0),
+        ]
+    )
+    assert board.find("SAME") == 2
+    assert board.find("nobody") is None
+
+    board.update(2, 1700, "renamed", 1, 0)
+    assert board.find("same") == 1
+    assert board.position(4) == 2
+    assert board.around(3) == (None, [])
@@ -2,7 +2,8 @@ import pytest
 
 from unittest.mock import patch
 
-from pubobot.bot import Pickup
+from pubobot import bot
+from pubobot.bot import Match, Pickup, Players
 
 
 class FakeUser:
@@ -12,6 +13,7 @@ class FakeUser:
 
 @pytest.fixture
 def pickup():
+    bot.init()
     return Pickup(None, {"pickup_name": "dummy"})
 
 
@@ -46,3 +48,140 @@ def test_unmark_user_ready(pickup):
 
     pickup.unmark_user_ready(users[1], users[2], users[4])
     assert pickup.get_ready_users(users, 60) == [users[0]]
+
+
+def test_member_index_follows_players(pickup):
+    users = [FakeUser(i) for i in range(5)]
+    other = Pickup(None, {"pickup_name": "other"})
+
+    pickup.players.append(users[0])
+    pickup.players += users[1:3]
+    other.players.append(users[0])
+    bot.active_pickups.extend([pickup, other])
+    assert bot.pickups_by_member[0] == {pickup: None, other: None}
+    assert bot.check_index() == ()
+
+    pickup.players.remove(users[0])
+    pickup.players[0] = users[3]
+    assert set(bot.pickups_by_member) == {0, 2, 3}
+    assert bot.check_index() == ()
+
+    other.players = []
+    bot.active_pickups.remove(other)
+    assert 0 not in bot.pickups_by_member
+    assert bot.check_index() == ()
+
+    list.append(pickup.players, users[4])  # bypasses the index
+    assert bot.check_index() == (4,)
+
+
+def test_member_index_has_active_matches_only(pickup):
+    users = [FakeUser(i) for i in range(4)]
+    match = Match.__new__(Match)
+    match._players = Players(match, users, indexed=False)
+    assert bot.matches_by_member == {}
+
+    bot.active_matches.append(match)
+    match.players.attach()
+    match.players = users[:3]
+    assert set(bot.matches_by_member) == {0, 1, 2}
+    assert bot.check_index() == ()
+
+    bot.active_matches.remove(match)
+    match.players.detach()
+    assert bot.matches_by_member == {}
+    assert match.players == users[:3]
+
+
+def test_channel_pickup_index():
+    channel = bot.Channel.__new__(bot.Channel)
+    channel.pickups = []
+    channel.pickups_by_name = {}
+    channel.pickup_groups = {"small": ["duel", "TDM"]}
+    for name in ("CTF", "tdm", "duel"):
+        channel.add_pickup(Pickup(channel, {"pickup_name": name}))
+    ctf, tdm, duel = channel.pickups
+
+    assert channel.get_pickup("ctf") is ctf and channel.get_pickup("TDM") is tdm
+    assert channel.get_pickup("elim") is None
+    assert channel.get_pickups(["duel", "small", "elim", "Ctf"]) == [ctf, tdm, duel]
+
+    channel.drop_pickup(tdm)
+    assert channel.get_pickups(["small"]) == [duel]
+    assert list(channel.pickups_by_name) == ["ctf", "duel"]
+
+
+def test_template_fills_known_variables():
+    template = bot.Template("%role% add %pickup_name%, 100% sure %left% to go")
+    assert (
+        template.render(role="", pickup_name="elim")
+        == " add elim, 100% sure %left% to go"
+    )
+
+
+def test_effective_config_until_updated():
+    channel = bot.Channel.__new__(bot.Channel)
+    channel.id = 1
+    channel.pickups = []
+    channel.cfg = {"ip": "1.2.3.4", "password": None, "startmsg": "%ip%/%password%"}
+    channel.cfg.update(promotion_role=5, promotemsg=None, submsg=None)
+    channel.cfg.update(start_pm_msg=None, maps="a,b")
+    pickup = Pickup(channel, dict(dict.fromkeys(channel.cfg), pickup_name="elim"))
+    channel.pickups.append(pickup)
+
+    settings = channel.settings(pickup)
+    assert channel.settings(pickup) is settings
+    assert settings.startmsg == "1.2.3.4/" and settings.start_pm_msg is None
+    assert settings.submsg == "<@&5> NEED SUB @ **elim**, please connect to 1.2.3.4."
+    assert settings.promotemsg.render(required_players=3) == (
+        "<@&5> please !add elim, 3 players to go!"
+    )
+
+    with patch("pubobot.stats3.update_pickup_config"), patch(
+        "pubobot.stats3.update_channel_config"
+    ):
+        channel.update_pickup_config(pickup, "password", "secret")
+        assert channel.settings(pickup).startmsg == "1.2.3.4/secret"
+        channel.update_channel_config("maps", "c")
+        assert channel.get_value("maps", pickup) == "c"
+    assert settings.values["maps"] == "a,b"  # kept by matches started before
+
+
+def test_unpicked_pool_finds_players_by_id():
+    users = [FakeUser(i) for i in range(4)]
+    pool = bot.UnpickedPool(users)
+    position = pool.find_player(users[2])
+    assert pool.get(position) is users[2] and users[2] in pool
+
+    assert pool.pick_by_player_id(2) is users[2]
+    assert users[2] not in pool and pool.find_player(users[2]) is None
+    assert pool.get_by_player_id(2) == (None, None)
+
+    pool.add(FakeUser(9), position)
+    assert pool.get_by_player_id(9)[0] == position
+    pool.remove_player(users[0])
+    assert sorted(p.id for p in pool.all.values()) == [1, 3, 9]
+    assert not hasattr(pool, "__dict__")
+
+
+@pytest.mark.asyncio
+async def test_add_rechecks_active_match_after_the_ban_check():
+    bot.init()
+    channel = bot.Channel.__new__(bot.Channel)
+    channel.id, channel.channel, channel.cfg = 1, "channel", {}
+    channel.pickups, channel.pickups_by_name, channel.pickup_groups = [], {}, {}
+    channel.add_pickup(Pickup(channel, {"pickup_name": "elim", "maxplayers": 4}))
+    member = FakeUser(1)
+    match = Match.__new__(Match)
+
+    async def check_memberid(channel_id, user_id):
+        # another pickup of the member fills while the query runs
+        bot.matches_by_member[user_id] = {match: None}
+        return False, None, None
+
+    with patch("pubobot.stats3.a_check_memberid", check_memberid), patch(
+        "pubobot.client.reply"
+    ) as reply:
+        await channel.add_player(member, ["elim"])
+    assert reply.call_args[0][2] == "You are already in an active match."
+    assert channel.pickups[0].players == []
@@ -0,0 +1,245 @@
+"""register_pickup() against the per-player implementation it replaced."""
+
+import random
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from pubobot import stats3
+
+
+def legacy_register_pickup(match):
+    new_ranks = dict()
+    at = int(stats3.time())
+    # the legacy writes bypass the rating cache
+    stats3.rank_cache.invalidate(match.pickup.channel.id)
+    match.ranks = stats3.get_ranks(
+        match.pickup.channel, [i.id for i in match.players]
+    )  # Update players ratings incase of changes
+
+    playersstr = " " + " ".join([i.nick or i.name for i in match.players]) + " "
+    if match.alpha_team and match.beta_team:
+        alphastr = " ".join([i.nick or i.name for i in match.alpha_team])
+        betastr = " ".join([i.nick or i.name for i in match.beta_team])
+    else:
+        betastr = None
+        alphastr = None
+
+    stats3.c.execute(
+        "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at, players, alpha_players, beta_players, is_ranked, winner_team) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            match.id,
+            match.pickup.channel.id,
+            match.pickup.name,
+            at,
+            playersstr,
+            alphastr,
+            betastr,
+            match.ranked,
+            match.winner,
+        ),
+    )
+
+    if match.ranked and match.winner:
+        alpha_rank = int(
+            sum([match.ranks[player.id] for player in match.alpha_team])
+            / len(match.alpha_team)
+        )
+        beta_rank = int(
+            sum([match.ranks[player.id] for player in match.beta_team])
+            / len(match.beta_team)
+        )
+
+        # [alpha, beta]
+        expected_scores = [
+            1 / (1 + 10 ** ((beta_rank - alpha_rank) / 400)),
+            1 / (1 + 10 ** ((alpha_rank - beta_rank) / 400)),
+        ]
+        if match.winner == "alpha":
+            scores = [1, 0]
+        elif match.winner == "draw":
+            scores = [0.5, 0.5]
+        else:
+            scores = [0, 1]
+
+    for player in [
+        player for player in match.players if player not in match.unpicked_pool
+    ]:
+        user_name = player.nick or player.name
+        team = None
+        is_lastpick = player == match.lastpick  # True or False
+        if match.alpha_team and match.beta_team:
+            if player in match.alpha_team:
+                team_num = 0
+                team = "alpha"
+            elif player in match.beta_team:
+                team_num = 1
+                team = "beta"
+
+        if match.ranked and match.winner and team:
+            stats3.c.execute(
+                "INSERT OR IGNORE INTO channel_players (channel_id, user_id, nick, rank, wins, loses, phrase) VALUES (?, ?, ?, ?, 0, 0, NULL)",
+                (match.pickup.channel.id, player.id, user_name, match.ranks[player.id]),
+            )
+
+            # if we need to calibrate this player add additional rank gain/loss boost
+            rank_k = match.pickup.channel.cfg["ranked_multiplayer"]
+            stats3.c.execute(
+                "SELECT wins, loses, streak, is_seeded FROM channel_players WHERE channel_id = ? AND user_id = ?",
+                (match.pickup.channel.id, player.id),
+            )
+            result = stats3.c.fetchone()
+            wins, loses, streak, is_seeded = [i or 0 for i in result]
+
+            is_ranked = True
+            rank_change = int(rank_k * (scores[team_num] - expected_scores[team_num]))
+            if (
+                match.pickup.channel.cfg["ranked_calibrate"]
+                and wins + loses < 8
+                and not is_seeded
+            ):
+                rank_change = int(rank_change * ((10 - (wins + loses)) / 2.0))
+
+            if match.ranked_streaks:
+                if streak.__gt__(0) != scores[team_num].__gt__(0):
+                    streak = 0
+                if scores[team_num] == 1:
+                    streak += 1
+                elif scores[team_num] == 0.5:
+                    streak = 0
+                else:
+                    streak -= 1
+                if abs(streak) > 2:
+                    rank_change = int(rank_change * (min([abs(streak), 6]) / 2.0))
+            else:
+                streak = 0
+
+            rank_after = match.ranks[player.id] + rank_change
+            is_winner = scores[team_num]
+
+            stats3.c.execute(
+                "UPDATE channel_players SET nick = ?, rank = ?, wins=?, loses=?, streak=? WHERE channel_id = ? AND user_id = ?",
+                (
+                    user_name,
+                    rank_after,
+                    wins + scores[team_num],
+                    loses + abs(scores[team_num] - 1),
+                    streak,
+                    match.pickup.channel.id,
+                    player.id,
+                ),
+            )
+            new_ranks[player.id] = [user_name, rank_after]
+
+        else:
+            is_ranked = False
+            rank_change = None
+            rank_after = None
+            is_winner = None
+
+        stats3.c.execute(
+            "INSERT OR IGNORE INTO player_pickups (pickup_id, channel_id, user_id, user_name, pickup_name, at, team, is_ranked, is_winner, rank_after, rank_change, is_lastpick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                match.id,
+                match.pickup.channel.id,
+                player.id,
+                user_name,
+                match.pickup.name,
+                at,
+                team,
+                is_ranked,
+                is_winner,
+                rank_after,
+                rank_change,
+                is_lastpick,
+            ),
+        )
+
+    stats3.conn.commit()
+    return new_ranks
+
+
+class FakePlayer:
+    def __init__(self, id):
+        self.id = id
+        self.name = "player{0}".format(id)
+        self.nick = "nick{0}".format(id) if id % 3 else None
+
+
+def random_matches(seed, count):
+    """Match specs, built twice so each implementation gets fresh objects."""
+    rnd = random.Random(seed)
+    specs = []
+    for match_id in range(count):
+        size = rnd.choice([2, 4, 6, 8, 10])
+        players = rnd.sample(range(1, 31), size)
+        half = size // 2
+        teams = rnd.random() > 0.1
+        specs.append(
+            dict(
+                id=match_id,
+                players=players,
+                alpha=players[:half] if teams else [],
+                beta=players[half:] if teams else [],
+                unpicked=rnd.sample(players, 1) if rnd.random() < 0.1 else [],
+                lastpick=rnd.choice(players),
+                ranked=teams and rnd.random() > 0.2,
+                streaks=rnd.random() > 0.3,
+                winner=rnd.choice(["alpha", "beta", "draw", None]),
+                cfg={
+                    "initial_rating": rnd.choice([None, 1200]),
+                    "ranked_multiplayer": rnd.choice([24, 32]),
+                    "ranked_calibrate": rnd.choice([0, 1]),
+                },
+            )
+        )
+    return specs
+
+
+def build(spec):
+    players = {i: FakePlayer(i) for i in spec["players"]}
+    channel = SimpleNamespace(id=1, cfg=spec["cfg"])
+    return SimpleNamespace(
+        id=spec["id"],
+        pickup=SimpleNamespace(channel=channel, name="elim"),
+        players=list(players.values()),
+        alpha_team=[players[i] for i in spec["alpha"]],
+        beta_team=[players[i] for i in spec["beta"]],
+        unpicked_pool=[players[i] for i in spec["unpicked"]],
+        lastpick=players[spec["lastpick"]],
+        ranked=spec["ranked"],
+        ranked_streaks=spec["streaks"],
+        winner=spec["winner"],
+    )
+
+
+def play(db, register, specs):
+    stats3.init(db)
+    # a few players start out seeded or with a phrase
+    stats3.seed_player(1, 3, 1700)
+    stats3.seed_player(1, 7, 1100)
+    stats3.set_phrase(1, 5, "hello")
+    results = []
+    with patch("pubobot.stats3.time", return_value=1000):
+        for spec in specs:
+            match = build(spec)
+            results.append((register(match), match.ranks))
+    tables = {
+        table: stats3.c.execute(
+            "SELECT * FROM {0} ORDER BY 1, 2, 3".format(table)
+        ).fetchall()
+        for table in ("channel_players", "player_pickups", "pickups")
+    }
+    stats3.close()
+    return results, {k: [tuple(row) for row in v] for k, v in tables.items()}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_register_pickup_matches_legacy(tmp_path, seed):
+    specs = random_matches(seed, 60)
+    expected = play(tmp_path / "legacy.sqlite3", legacy_register_pickup, specs)
+    actual = play(tmp_path / "new.sqlite3", stats3.register_pickup, specs)
+
+    assert actual[0] == expected[0]
+    assert actual[1] == expected[1]
@@ -0,0 +1,117 @@
+"""replay_ranks() against the ratings register_pickup() handed out live."""
+
+import random
+from types import SimpleNamespace
+
+from unittest.mock import patch
+
+import pytest
+
+from pubobot import stats3
+
+
+class FakePlayer:
+    def __init__(self, id):
+        self.id = id
+        self.name = "player{0}".format(id)
+        self.nick = None
+
+
+def channel(**cfg):
+    defaults = {
+        "initial_rating": 1400,
+        "ranked_multiplayer": 32,
+        "ranked_calibrate": 1,
+        "ranked_streaks": 1,
+    }
+    return SimpleNamespace(id=1, cfg={**defaults, **cfg})
+
+
+def play(chan, seed, count, unranked=()):
+    rnd = random.Random(seed)
+    players = [FakePlayer(i) for i in range(12)]
+    for match_id in range(count):
+        size = rnd.choice([2, 4, 8])
+        picked = rnd.sample(players, size)
+        ranked = rnd.random() > 0.1 and match_id not in unranked
+        stats3.register_pickup(
+            SimpleNamespace(
+                id=match_id,
+                pickup=SimpleNamespace(channel=chan, name="elim"),
+                players=picked,
+                alpha_team=picked[: size // 2],
+                beta_team=picked[size // 2 :],
+                unpicked_pool=[],
+                lastpick=picked[-1],
+                ranked=ranked,
+                ranked_streaks=chan.cfg["ranked_streaks"],
+                winner=rnd.choice(["alpha", "beta", "draw"]),
+            )
+        )
+
+
+def ladder():
+    return {
+        table: [
+            tuple(row)
+            for row in stats3.conn.execute(
+                "SELECT * FROM {0} ORDER BY 1, 2, 3".format(table)
+            )
+        ]
+        for table in ("channel_players", "player_pickups")
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    stats3.init(tmp_path / "db.sqlite3")
+    # seeded before their first match, so the seed can be recovered
+    stats3.seed_player(1, 3, 1700)
+    with patch("pubobot.stats3.time", return_value=1000):
+        yield
+    stats3.close()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_replay_reproduces_live_ratings(db, seed):
+    chan = channel()
+    play(chan, seed, 80)
+    live = ladder()
+
+    stats3.reset_ranks(chan.id)
+    stats3.seed_player(1, 3, 1700)
+    matches, players, changed = stats3.replay_ranks(chan)
+
+    assert ladder() == live
+    assert changed == 0
+    assert players == 12
+    assert matches == len({row[0] for row in live["player_pickups"] if row[7]})
+
+
+def test_replay_applies_new_settings(db, tmp_path):
+    play(channel(), 0, 40)
+    _, _, changed = stats3.replay_ranks(channel(ranked_multiplayer=24))
+    replayed = ladder()
+    stats3.close()
+
+    # the same history played live with the new settings
+    stats3.init(tmp_path / "fresh.sqlite3")
+    stats3.seed_player(1, 3, 1700)
+    play(channel(ranked_multiplayer=24), 0, 40)
+
+    assert changed > 0
+    assert ladder() == replayed
+
+
+def test_replay_skips_undone_matches(db, tmp_path):
+    play(channel(), 1, 30)
+    stats3.undo_ranks(1, 5)
+    stats3.replay_ranks(channel())
+    replayed = ladder()["channel_players"]
+    stats3.close()
+
+    stats3.init(tmp_path / "fresh.sqlite3")
+    stats3.seed_player(1, 3, 1700)
+    play(channel(), 1, 30, unranked={5})
+
+    assert ladder()["channel_players"] == replayed
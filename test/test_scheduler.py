@@ -0,0 +1,125 @@
+import time
+import asyncio
+
+import pytest
+
+from unittest.mock import patch
+
+from pubobot import scheduler
+
+
+@pytest.fixture(autouse=True)
+def clean_scheduler():
+    scheduler.init()
+    yield
+    scheduler.init()
+
+
+@pytest.fixture
+def time_mock():
+    with patch("time.time") as m:
+        m.return_value = 0
+        yield m
+
+
+def test_runs_all_due_tasks_in_order(time_mock):
+    fired = []
+    for name, delay in [("c", 30), ("a", 10), ("b", 20), ("d", 40)]:
+        scheduler.add_task(name, delay, fired.append, (name,))
+
+    scheduler.run(35)
+    assert fired == ["a", "b", "c"]
+    assert list(scheduler.tasks.keys()) == ["d"]
+
+    scheduler.run(41)
+    assert fired == ["a", "b", "c", "d"]
+    assert scheduler.tasks == {}
+
+
+def test_cancelled_tasks_do_not_fire(time_mock):
+    fired = []
+    scheduler.add_task(1, 10, fired.append, (1,))
+    scheduler.add_task(2, 20, fired.append, (2,))
+    scheduler.cancel_task(1)
+
+    scheduler.run(100)
+    assert fired == [2]
+
+
+def test_readd_after_cancel_uses_new_deadline(time_mock):
+    fired = []
+    scheduler.add_task("player", 10, fired.append, ("old",))
+    scheduler.cancel_task("player")
+    scheduler.add_task("player", 50, fired.append, ("new",))
+    assert scheduler.tasks["player"][0] == 50
+
+    scheduler.run(20)
+    assert fired == []
+
+    scheduler.run(60)
+    assert fired == ["new"]
+
+
+def test_failing_task_does_not_block_others(time_mock):
+    fired = []
+
+    def boom():
+        raise RuntimeError("boom")
+
+    scheduler.add_task("bad", 1, boom, ())
+    scheduler.add_task("good", 2, fired.append, ("good",))
+
+    scheduler.run(10)
+    assert fired == ["good"]
+
+
+def test_cancel_compacts_queue(time_mock):
+    for i in range(1000):
+        scheduler.add_task(i, i, lambda: None, ())
+    for i in range(999):
+        scheduler.cancel_task(i)
+
+    assert len(scheduler.tasks) == 1
+    assert len(scheduler.queue) < 100
+
+
+@pytest.mark.asyncio
+async def test_wait_sleeps_until_next_task():
+    scheduler.attach(asyncio.get_running_loop())
+    fired = []
+    scheduler.add_task("soon", 0.05, fired.append, ("soon",))
+
+    # same shape as the main loop: run what is due, then sleep
+    start = time.monotonic()
+    wakeups = 0
+    while True:
+        scheduler.run(time.time())
+        if fired:
+            break
+        await asyncio.wait_for(scheduler.wait(), 1)
+        wakeups += 1
+
+    assert 0.04 < time.monotonic() - start < 0.5
+    assert wakeups <= 3
+    assert fired == ["soon"]
+
+
+@pytest.mark.asyncio
+async def test_wait_honours_external_deadline():
+    scheduler.attach(asyncio.get_running_loop())
+    scheduler.add_task("later", 60, lambda: None, ())
+
+    start = time.monotonic()
+    await scheduler.wait(time.time() + 0.05)
+    assert time.monotonic() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_add_task_wakes_up_idle_wait():
+    scheduler.attach(asyncio.get_running_loop())
+    waiter = asyncio.ensure_future(scheduler.wait())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    scheduler.add_task("now", 0, lambda: None, ())
+    await asyncio.wait_for(waiter, 1)
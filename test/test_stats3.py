@@ -0,0 +1,571 @@
+import time
+import random
+import sqlite3
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from pubobot import config, scheduler, stats3
+
+
+@pytest.fixture
+def db(tmp_path):
+    stats3.init(tmp_path / "db.sqlite3")
+    yield tmp_path / "db.sqlite3"
+    stats3.close()
+
+
+def pragma(name):
+    return stats3.c.execute("PRAGMA {0}".format(name)).fetchone()[0]
+
+
+def test_pragma_profile_is_applied(db):
+    config.init()
+    stats3.init(db, config.db_pragmas())
+
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 1  # NORMAL
+    assert pragma("mmap_size") == config.cfg.DB_MMAP_SIZE
+    assert pragma("cache_size") == config.cfg.DB_CACHE_SIZE
+    assert pragma("temp_store") == 2  # MEMORY
+
+
+def test_bad_pragmas_are_skipped(db):
+    stats3.init(
+        db,
+        {
+            "journal_mode": "sideways",
+            "cache_size": "lots",
+            "page_size": 512,
+            "synchronous": "full",
+            "temp_store": None,
+        },
+    )
+
+    assert pragma("journal_mode") == "delete"
+    assert pragma("synchronous") == 2  # FULL
+    assert pragma("page_size") != 512
+
+
+def test_checkpoint_reschedules_itself(db):
+    stats3.init(db, {"journal_mode": "WAL"})
+    scheduler.init()
+    stats3.schedule_checkpoint(60)
+    assert "db_checkpoint" in scheduler.tasks
+
+    stats3.set_expire(1, 60)
+    scheduler.run(time.time() + 61)
+
+    assert "db_checkpoint" in scheduler.tasks
+    busy, log, checkpointed = stats3.checkpoint()
+    assert busy == 0 and log == checkpointed
+    scheduler.init()
+
+
+class FakePlayer:
+    def __init__(self, id):
+        self.id = id
+        self.name = "player{0}".format(id)
+        self.nick = None
+
+
+def fake_match(match_id, players, winner="alpha", channel_id=1, pickup="elim"):
+    channel = SimpleNamespace(
+        id=channel_id,
+        cfg={"initial_rating": 1400, "ranked_multiplayer": 32, "ranked_calibrate": 1},
+    )
+    half = len(players) // 2
+    return SimpleNamespace(
+        id=match_id,
+        pickup=SimpleNamespace(channel=channel, name=pickup),
+        players=players,
+        alpha_team=players[:half],
+        beta_team=players[half:],
+        unpicked_pool=[],
+        lastpick=players[-1],
+        ranked=True,
+        ranked_streaks=True,
+        winner=winner,
+    )
+
+
+# tables that grow with the number of games played
+hot_tables = ("player_pickups", "pickups", "pickup_roster", "bans", "channel_players")
+
+
+def full_scans(statement):
+    plan = stats3.conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+    return [
+        row[3]
+        for row in plan
+        if row[3].startswith("SCAN ")
+        and row[3].split()[1] in hot_tables
+        and " USING " not in row[3]
+    ]
+
+
+def test_hot_queries_use_indexes(db):
+    statements = []
+    stats3.conn.set_trace_callback(statements.append)
+
+    players = [FakePlayer(i) for i in range(8)]
+    stats3.register_pickup(fake_match(1, players))
+    stats3.register_pickup(fake_match(2, players, winner="beta"))
+    stats3.top(1)
+    stats3.top(1, timegap=100)
+    stats3.top(1, pickup="elim")
+    stats3.top(1, timegap=100, pickup="elim")
+    stats3.stats(1)
+    stats3.stats(1, "elim")
+    stats3.stats(1, "player1")
+    stats3.get_rank_details(1, user_id=1)
+    stats3.get_ladder(1, 0)
+    stats3.lastgame(1)
+    stats3.lastgame(1, "elim")
+    stats3.lastgame(1, "player1")
+    stats3.lastgame(1, "<@2>")
+    stats3.lastgame(1, "play")
+    stats3.stats(1, "PLAY")
+    stats3.last_teammates(1, [player.id for player in players])
+    stats3.noadd(1, 3, "player3", 60, "admin")
+    stats3.check_memberid(1, 3)
+    stats3.noadds(1)
+    stats3.forgive(1, 3, "player3", "admin")
+    stats3.undo_ranks(1, 2)
+    stats3.conn.set_trace_callback(None)
+
+    queries = [
+        statement
+        for statement in statements
+        if statement.split()[0].upper() in ("SELECT", "UPDATE", "DELETE")
+    ]
+    assert queries
+    scans = {statement: full_scans(statement) for statement in queries}
+    assert {k: v for k, v in scans.items() if v} == {}
+
+
+def test_last_teammates(db):
+    players = [FakePlayer(i) for i in range(8)]
+    stats3.register_pickup(fake_match(1, players))
+    # players 0 and 1 met again since, on opposite teams
+    stats3.register_pickup(
+        fake_match(2, [players[0], players[4], players[1], players[5]])
+    )
+
+    pairs = stats3.last_teammates(1, [player.id for player in players])
+    # 2 and 3 still remember 0 and 1 from their own last match
+    assert pairs == {
+        (0, 4),
+        (1, 5),
+        (0, 2),
+        (0, 3),
+        (1, 2),
+        (1, 3),
+        (2, 3),
+        (4, 6),
+        (4, 7),
+        (5, 6),
+        (5, 7),
+        (6, 7),
+    }
+    assert stats3.last_teammates(1, [2, 3, 9]) == {(2, 3)}
+    assert stats3.last_teammates(2, [0, 1]) == set()
+
+
+def test_migration_adds_indexes(tmp_path):
+    db = tmp_path / "old.sqlite3"
+    stats3.init(db)
+    for (name,) in stats3.c.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall():
+        stats3.c.execute("DROP INDEX `{0}`".format(name))
+    stats3.c.execute("UPDATE utility SET value = '14' WHERE variable = 'version'")
+    stats3.close()
+
+    stats3.init(db)
+    indexes = {
+        name
+        for (name,) in stats3.c.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        ).fetchall()
+    }
+    assert "player_pickups_at" in indexes and "bans_user" in indexes
+    version = stats3.c.execute(
+        "SELECT value FROM utility WHERE variable = 'version'"
+    ).fetchone()[0]
+    assert version == str(stats3.version)
+    stats3.close()
+
+
+def test_lastgame_finds_a_players_games(db):
+    players = [FakePlayer(i) for i in range(4)]
+    stats3.register_pickup(fake_match(1, players))
+    stats3.register_pickup(fake_match(2, players[:2] + [FakePlayer(5), FakePlayer(6)]))
+    players[0].nick = "Renamed"
+    stats3.register_pickup(fake_match(3, [FakePlayer(i) for i in range(6, 10)]))
+
+    assert stats3.lastgame(1, "<@!3>")[0] == 1
+    assert stats3.lastgame(1, "PLAYER1")[0] == 2
+    assert stats3.lastgame(1, "player1", 1)[0] == 1
+    assert stats3.lastgame(1, "player1", 2) is None
+    assert stats3.lastgame(1, "player5")[0] == 2
+    # by the nick used at the time, not the current one
+    assert stats3.lastgame(1, "player0")[0] == 2
+    assert stats3.lastgame(1, "nobody") is None
+
+
+def test_name_search_matches_by_prefix(db):
+    assert stats3.name_search
+    players = [FakePlayer(i) for i in range(4)]
+    players[1].nick = "Zed_Runner"
+    stats3.register_pickup(fake_match(1, players))
+    stats3.register_pickup(fake_match(2, players[2:] + [FakePlayer(8), FakePlayer(9)]))
+
+    assert stats3.lastgame(1, "zed")[0] == 1
+    assert stats3.lastgame(1, "RUN")[0] == 1
+    assert stats3.lastgame(1, "play")[0] == 2
+    assert stats3.lastgame(1, "play", 1)[0] == 1
+    assert stats3.lastgame(1, "unner") is None
+    assert stats3.stats(1, "zed").startswith("Stats for **Zed_Runner**")
+
+
+def test_name_search_falls_back_without_fts5(db, monkeypatch):
+    players = [FakePlayer(i) for i in range(4)]
+    players[1].nick = "Zed_Runner"
+    stats3.register_pickup(fake_match(1, players))
+
+    monkeypatch.setattr(stats3, "fts5_available", lambda: False)
+    stats3.init(db)
+    assert not stats3.name_search
+    # the triggers are gone, so writes work without the fts5 module
+    stats3.register_pickup(fake_match(2, players))
+    assert stats3.lastgame(1, "unner")[0] == 2
+    assert stats3.stats(1, "zed") == "Nothing found."
+
+    monkeypatch.undo()
+    stats3.init(db)
+    assert stats3.name_search
+    # rebuilt, match 2 is in the index too
+    assert stats3.lastgame(1, "zed")[0] == 2
+
+
+def raw_top(channel_id, timegap, pickup=None):
+    # !top as it was counted from player_pickups
+    rows = stats3.c.execute(
+        "SELECT user_id, count(*) FROM player_pickups WHERE channel_id = ? AND at > ? AND pickup_name = coalesce(?, pickup_name) GROUP BY user_id",
+        (channel_id, timegap, pickup),
+    ).fetchall()
+    return sorted(row[1] for row in rows)[::-1][:10]
+
+
+def test_day_counters_match_the_history(db, monkeypatch):
+    rnd = random.Random(3)
+    players = [FakePlayer(i) for i in range(12)]
+    now = 100 * stats3.DAY
+    for match_id in range(60):
+        # a few matches a day, spread over the last month
+        monkeypatch.setattr(
+            stats3, "time", lambda: now - 30 * stats3.DAY + match_id * 43000
+        )
+        pickup = rnd.choice(["elim", "ctf"])
+        stats3.register_pickup(
+            fake_match(match_id, rnd.sample(players, 4), pickup=pickup)
+        )
+    assert stats3.check_counters() == (0, 0)
+
+    for timegap in (now - 7 * stats3.DAY + 5000, now - 30 * stats3.DAY, 0):
+        for pickup in (None, "elim"):
+            top = stats3.top(1, timegap=timegap, pickup=pickup or False)
+            counts = sorted(
+                (int(entry.split(": ")[1]) for entry in top.split(", ")), reverse=True
+            )
+            assert counts == raw_top(1, timegap, pickup)
+
+    assert stats3.stats(1) == "Total pickups: 60 | {0}".format(
+        ", ".join(
+            "{0}: {1}".format(*row)
+            for row in stats3.c.execute(
+                "SELECT pickup_name, count(*) FROM pickups GROUP BY pickup_name"
+            ).fetchall()
+        )
+    )
+
+    stats3.c.execute("UPDATE player_days SET count = count + 1 WHERE rowid = 1")
+    stats3.c.execute("DELETE FROM pickup_days WHERE rowid = 1")
+    assert stats3.check_counters(1) == (1, 1)
+    assert stats3.check_counters(2) == (0, 0)
+    stats3.rebuild_counters(1)
+    assert stats3.check_counters() == (0, 0)
+
+    stats3.reset_stats(1)
+    assert stats3.c.execute("SELECT count(*) FROM player_days").fetchone()[0] == 0
+    assert stats3.stats(1, "elim") == "No pickups played yet."
+
+
+def test_migration_backfills_roster(tmp_path):
+    db = tmp_path / "old.sqlite3"
+    stats3.init(db)
+    players = [FakePlayer(i) for i in range(6)]
+    players[1].nick = "Big Dave"
+    players[2].nick = "Dave"
+    match = fake_match(1, players[:4])
+    stats3.register_pickup(match)
+    stats3.register_pickup(fake_match(2, players[2:], channel_id=2))
+    # a match from before player_pickups rows were written for everyone
+    stats3.c.execute(
+        "INSERT INTO pickups (pickup_id, channel_id, pickup_name, at, players, alpha_players, beta_players, is_ranked, winner_team) VALUES (3, 1, 'elim', 0, 'player0 ghost', 'player0', NULL, 0, NULL)"
+    )
+    expected = stats3.c.execute(
+        "SELECT pickup_id, channel_id, user_id, nick, team FROM pickup_roster ORDER BY pickup_id, nick"
+    ).fetchall()
+    stats3.c.execute("DROP TABLE pickup_roster")
+    stats3.c.execute("UPDATE utility SET value = '16' WHERE variable = 'version'")
+    stats3.close()
+
+    stats3.init(db)
+    roster = stats3.c.execute(
+        "SELECT pickup_id, channel_id, user_id, nick, team FROM pickup_roster ORDER BY pickup_id, nick"
+    ).fetchall()
+    assert [tuple(row) for row in roster] == [tuple(row) for row in expected] + [
+        (3, 1, None, "ghost", None),
+        (3, 1, None, "player0", "alpha"),
+    ]
+    assert stats3.lastgame(1, "<@1>")[0] == 1
+    assert stats3.lastgame(1, "big dave")[0] == 1
+    stats3.close()
+
+
+def slow_query(seconds):
+    stats3.conn.create_function("pause", 1, time.sleep)
+    return stats3.c.execute("SELECT pause(?)", (seconds,)).fetchone()
+
+
+@pytest.mark.asyncio
+async def test_loop_stays_responsive_during_slow_query(db):
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    ticking = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    await stats3.run_async(stats3.serialized(slow_query), 0.3)
+    ticking.cancel()
+
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert len(ticks) > 10
+    assert max(gaps) < 0.1
+
+
+@pytest.mark.asyncio
+async def test_async_queries_run_in_submission_order(db):
+    order = []
+    stats3.submit(lambda: (time.sleep(0.05), order.append("slow")))
+    await stats3.run_async(order.append, "fast")
+    assert order == ["slow", "fast"]
+
+
+def test_sync_api_waits_for_the_database_thread(db):
+    job = stats3.submit(stats3.serialized(slow_query), 0.1)
+    time.sleep(0.01)  # let the worker take the lock
+    stats3.set_expire(1, 60)  # blocks until the slow query is done
+    assert job.done()
+    assert stats3.get_expire(1) == 60
+
+
+@pytest.fixture
+def write_behind(db):
+    scheduler.init()
+    stats3.write_behind(10, 1.0)
+    stats3.metrics.update(writes=0, commits=0, durable_commits=0)
+    yield
+    stats3.write_behind(0, 0)
+    scheduler.init()
+
+
+def committed_expire(db, user_id):
+    # a second connection only sees what has been committed
+    conn = sqlite3.connect(db)
+    row = conn.execute(
+        "SELECT default_expire FROM players WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def test_writes_are_grouped(db, write_behind):
+    for i in range(25):
+        stats3.set_expire(i, 60)
+
+    assert stats3.metrics["writes"] == 25
+    assert stats3.metrics["commits"] == 2
+    assert stats3.pending_writes == 5
+    assert committed_expire(db, 24) is None
+    assert stats3.get_expire(24) == 60  # visible to the bot right away
+
+
+def test_flush_interval_commits_pending_writes(db, write_behind):
+    stats3.set_expire(1, 60)
+    scheduler.run(time.time() + 2)
+
+    assert committed_expire(db, 1) == 60
+    assert "db_flush" in scheduler.tasks
+
+
+def test_register_pickup_is_durable(db, write_behind):
+    stats3.set_expire(1, 60)
+    stats3.register_pickup(fake_match(1, [FakePlayer(i) for i in range(4)]))
+
+    assert stats3.metrics["durable_commits"] == 1
+    assert stats3.pending_writes == 0
+    assert committed_expire(db, 1) == 60
+
+
+def test_close_flushes(db, write_behind):
+    stats3.set_expire(1, 60)
+    stats3.close()
+    stats3.init(db)
+    assert committed_expire(db, 1) == 60
+
+
+def fresh_ranks(channel, user_ids):
+    stats3.rank_cache.invalidate(channel.id)
+    return stats3.get_ranks(channel, user_ids)
+
+
+def test_ranks_are_cached(db):
+    channel = SimpleNamespace(id=1, cfg={"initial_rating": 1400})
+    stats3.seed_player(1, 0, 1600)
+    statements = []
+    stats3.conn.set_trace_callback(statements.append)
+
+    assert stats3.get_ranks(channel, [0, 1]) == {0: 1600, 1: 1400}
+    assert stats3.get_ranks(channel, [0, 1]) == {0: 1600, 1: 1400}
+    stats3.conn.set_trace_callback(None)
+
+    assert len(statements) == 1
+    assert (stats3.rank_cache.hits, stats3.rank_cache.misses) == (1, 1)
+
+
+def test_rank_cache_is_written_through(db):
+    players = [FakePlayer(i) for i in range(4)]
+    channel = SimpleNamespace(id=1, cfg={"initial_rating": 1400})
+    user_ids = [player.id for player in players]
+    stats3.get_ranks(channel, user_ids)
+
+    stats3.register_pickup(fake_match(1, players))
+    assert stats3.get_ranks(channel, user_ids) == fresh_ranks(channel, user_ids)
+    stats3.seed_player(1, 5, 1750)
+    assert stats3.get_ranks(channel, [5]) == {5: 1750}
+    stats3.register_pickup(fake_match(2, players, winner="beta"))
+    stats3.undo_ranks(1, 2)
+    assert stats3.get_ranks(channel, user_ids) == fresh_ranks(channel, user_ids)
+    stats3.reset_ranks(1)
+    assert stats3.get_ranks(channel, user_ids) == dict.fromkeys(user_ids, 1400)
+
+
+def test_rank_cache_drops_idle_channels(db, monkeypatch):
+    for channel_id in (1, 2, 3):
+        for user_id in range(2):
+            stats3.seed_player(channel_id, user_id, 1500)
+    monkeypatch.setattr(stats3.rank_cache, "max_players", 4)
+    for channel_id in (1, 2, 1, 3):
+        stats3.rank_cache.players(channel_id)
+
+    assert list(stats3.rank_cache.channels) == [1, 3]
+    assert stats3.rank_cache.size == 4
+
+
+def test_leaderboard_matches_the_sql_fallback(db, monkeypatch):
+    rnd = random.Random(0)
+    players = [FakePlayer(i) for i in range(30)]
+    for match_id in range(40):
+        stats3.register_pickup(
+            fake_match(match_id, rnd.sample(players, 6), rnd.choice(["alpha", "beta"]))
+        )
+    stats3.seed_player(1, 100, 1800)  # rated, but off the ladder
+
+    def queries():
+        return (
+            [stats3.get_rank_details(1, user_id=i)[0] for i in (0, 5, 100, 999)],
+            [list(stats3.get_rank_details(1, nick="player7")[0])],
+            [[tuple(row) for row in stats3.get_ladder(1, page)] for page in range(4)],
+            [stats3.get_ladder_around(1, i, 2)[0] for i in (0, 5, 100)],
+            [
+                [tuple(row) for row in stats3.get_ladder_around(1, i, 2)[1]]
+                for i in (0, 5, 100)
+            ],
+        )
+
+    cached = queries()
+    stats3.rank_cache.invalidate(1)
+    stats3.result_cache.invalidate(1)
+    monkeypatch.setattr(stats3.rank_cache, "max_players", 0)
+    assert stats3.rank_cache.board(1) is None
+    assert queries() == cached
+    assert cached[0][2][0] == 1  # the seeded player tops !rank
+
+
+def test_leaderboard_fallback_uses_indexes(db, monkeypatch):
+    monkeypatch.setattr(stats3.rank_cache, "max_players", 0)
+    statements = []
+    stats3.conn.set_trace_callback(statements.append)
+    stats3.get_rank_details(1, user_id=1)
+    stats3.get_ladder(1, 2)
+    stats3.get_ladder_around(1, 1)
+    stats3.conn.set_trace_callback(None)
+
+    for statement in statements:
+        if statement.startswith(("SELECT", "WITH")):
+            assert full_scans(statement) == [], statement
+
+
+@pytest.mark.asyncio
+async def test_result_cache_until_something_changes(db, monkeypatch):
+    players = [FakePlayer(i) for i in range(4)]
+    stats3.register_pickup(fake_match(1, players))
+    stats3.register_pickup(fake_match(2, players, channel_id=2))
+
+    before = stats3.stats(1)
+    assert await stats3.a_stats(1) == before
+    assert stats3.result_cache.hits == 1
+    stats3.stats(2)
+
+    stats3.register_pickup(fake_match(3, players))
+    assert ("stats", 2, (False,)) in stats3.result_cache.entries  # other channels stay
+    assert stats3.stats(1) != before
+
+    assert await stats3.a_noadds(1) == []
+    stats3.noadd(1, 3, "player3", 60, "admin")
+    assert len(await stats3.a_noadds(1)) == 1
+    stats3.forgive(1, 3, "player3", "admin")
+    assert await stats3.a_noadds(1) == []
+
+    # noadds texts count down, they expire sooner than the rest
+    stats3.stats(1)
+    later = time.time() + 30
+    monkeypatch.setattr(stats3, "time", lambda: later)
+    hits = stats3.result_cache.hits
+    stats3.stats(1)
+    stats3.noadds(1)
+    assert stats3.result_cache.hits == hits + 1
+
+
+def test_result_cache_is_bounded(db):
+    stats3.cache_results(3, 60)
+    for page in range(5):
+        stats3.get_ladder(1, page)
+    assert [key[2] for key in stats3.result_cache.entries] == [(2,), (3,), (4,)]
+    assert stats3.get_ladder(1, page=4) is stats3.get_ladder(1, 4)
+    stats3.get_ladder(1, 2)
+    stats3.get_ladder(1, 5)
+    assert [key[2] for key in stats3.result_cache.entries] == [(4,), (2,), (5,)]
+    assert stats3.result_cache.hits == 3
+
+    stats3.cache_results(1000, 0)
+    stats3.get_ladder(1, 0)
+    assert not stats3.result_cache.entries
+    stats3.cache_results(1000, 60)
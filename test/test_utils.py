@@ -0,0 +1,19 @@
+from pubobot import utils
+
+
+def test_split_large_message_packs_lines():
+    text = "\n".join(["a" * 4] * 5)
+    assert utils.split_large_message(text, charlimit=9) == ["aaaa\naaaa"] * 2 + ["aaaa"]
+
+
+def test_split_large_message_cuts_long_lines():
+    assert utils.split_large_message("ab\nabcdefg\nx", charlimit=3) == [
+        "ab",
+        "abc",
+        "def",
+        "g\nx",
+    ]
+
+
+def test_split_large_message_short_text_is_untouched():
+    assert utils.split_large_message("hello\nworld") == ["hello\nworld"]